@@ -0,0 +1,484 @@
+# backend/ann_index.py
+
+"""
+Nearest-neighbour indexes over the songs' normalized audio features.
+
+Three interchangeable index kinds share one interface (search / add / remove /
+save / load):
+
+- ExactIndex: brute-force scan, the reference for recall measurements.
+- IVFIndex:   vectors partitioned into k-means clusters; a query only scans the
+              'nprobe' clusters closest to it.
+- LSHIndex:   random-projection hashing into several hash tables; a query only
+              re-ranks the songs that share a bucket with it (plus 1-bit probes).
+
+An index is saved as a directory of .npy files plus an index.json manifest.
+load() memory-maps the arrays read-only, so several gunicorn workers loading
+the same index share the OS page cache instead of each holding a copy.
+Songs added/removed after the index was built are kept in a small in-memory
+delta (added vectors are scanned exactly, removed ids are masked out) until the
+index is rebuilt.
+
+Usage:
+    python -m backend.ann_index build --kind ivf --path instance/song_index
+    python -m backend.ann_index report --queries 200 --k 10
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from backend.similarity import top_k_smallest
+
+MANIFEST_FILE = 'index.json'
+
+logger = logging.getLogger(__name__)
+
+
+def _sq_distances(vectors, query):
+    """Squared Euclidean distances from one query to each row of 'vectors'."""
+    diff = np.asarray(vectors, dtype=np.float32) - np.asarray(query, dtype=np.float32)
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+class VectorIndex:
+    """
+    Common behaviour for all index kinds.
+
+    Subclasses implement _candidates(query, k) returning positions in the base
+    arrays worth scoring exactly; everything else (normalization, deltas,
+    tombstones, persistence) lives here.
+    """
+    kind = None
+    # Names of the kind-specific arrays stored next to ids.npy/vectors.npy
+    extra_arrays = ()
+
+    def __init__(self, ids, vectors, mean, std, params=None):
+        self.ids = ids                      # int64 song ids of the base vectors
+        self.vectors = vectors              # float32 (n, dims), normalized features
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.params = dict(params or {})
+        # In-memory delta on top of the (possibly memory-mapped) base arrays
+        self._removed = None                # bool mask over base positions, created on first removal
+        # (ids, vectors) of songs added since the build, swapped as one tuple so readers see a consistent pair
+        self._added = (np.empty(0, dtype=np.int64), np.empty((0, self.vectors.shape[1]), dtype=np.float32))
+        self._id_order = None               # argsort of self.ids, built lazily for id lookups
+        self._lock = threading.Lock()
+
+    # --- Construction ---
+
+    @classmethod
+    def build(cls, ids, raw_features, **params):
+        """Builds an index from song ids and their raw (unnormalized) feature rows."""
+        raw = np.asarray(raw_features, dtype=np.float64)
+        mean = np.nan_to_num(np.nanmean(raw, axis=0))
+        std = np.nan_to_num(np.nanstd(raw, axis=0))
+        std = np.where(std > 0, std, 1.0)
+        vectors = np.ascontiguousarray(np.nan_to_num((raw - mean) / std), dtype=np.float32)
+        index = cls(np.asarray(ids, dtype=np.int64), vectors, mean, std, params)
+        index._train()
+        return index
+
+    def _train(self):
+        """Builds the kind-specific structures from self.ids/self.vectors (may reorder them)."""
+
+    def transform(self, raw_features):
+        """Normalizes raw feature rows into this index's vector space."""
+        return np.nan_to_num((np.asarray(raw_features, dtype=np.float64) - self.mean) / self.std).astype(np.float32)
+
+    def __len__(self):
+        removed = int(self._removed.sum()) if self._removed is not None else 0
+        return len(self.ids) - removed + len(self._added[0])
+
+    # --- Queries ---
+
+    def _candidates(self, query, k):
+        """Base positions to score exactly for a query, or None to scan everything."""
+        raise NotImplementedError
+
+    def search(self, query, k, exclude_ids=None):
+        """
+        Returns (song_ids, squared_distances) of the k nearest songs to a normalized query vector.
+        'exclude_ids' (e.g. the user's favorites) are never returned.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        exclude_ids = np.asarray(exclude_ids if exclude_ids is not None else [], dtype=np.int64)
+        # Ask for extra candidates so excluded/removed songs don't leave us short
+        wanted = k + len(exclude_ids)
+
+        positions = self._candidates(query, wanted)
+        if positions is None:
+            # Full scan: score the base arrays in place instead of gathering a copy
+            ids, dist = self.ids, _sq_distances(self.vectors, query)
+            if self._removed is not None:
+                dist[self._removed] = np.inf
+        else:
+            positions = np.asarray(positions, dtype=np.intp)
+            if self._removed is not None and len(positions):
+                positions = positions[~self._removed[positions]]
+            ids, dist = self.ids[positions], _sq_distances(self.vectors[positions], query)
+        added_ids, added_vectors = self._added
+        if len(added_ids):
+            ids = np.concatenate([ids, added_ids])
+            dist = np.concatenate([dist, _sq_distances(added_vectors, query)])
+        if len(exclude_ids):
+            dist[np.isin(ids, exclude_ids)] = np.inf
+        best, best_dist = top_k_smallest(dist, k)
+        return ids[best], best_dist
+
+    # --- Incremental updates ---
+
+    def add(self, ids, raw_features):
+        """Adds songs (raw feature rows) without rebuilding; they are scanned exactly until the next rebuild."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._lock:
+            self.remove(ids)
+            added_ids, added_vectors = self._added
+            self._added = (np.concatenate([added_ids, ids]),
+                           np.concatenate([added_vectors, self.transform(raw_features)]))
+
+    def remove(self, ids):
+        """Removes songs by id (tombstones for base vectors, dropped from the delta)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        sorted_ids = self.ids[self._id_order]
+        found = np.searchsorted(sorted_ids, ids)
+        found = found[found < len(sorted_ids)]
+        found = found[np.isin(sorted_ids[found], ids)]
+        if len(found):
+            if self._removed is None:
+                self._removed = np.zeros(len(self.ids), dtype=bool)
+            self._removed[self._id_order[found]] = True
+        added_ids, added_vectors = self._added
+        keep = ~np.isin(added_ids, ids)
+        if not keep.all():
+            self._added = (added_ids[keep], added_vectors[keep])
+
+    def all_ids(self):
+        """Ids of every song currently in the index (base minus removed, plus added)."""
+        base = self.ids if self._removed is None else self.ids[~self._removed]
+        return np.concatenate([base, self._added[0]])
+
+    def delta_size(self):
+        """Number of pending incremental changes (a rebuild folds them into the base)."""
+        removed = int(self._removed.sum()) if self._removed is not None else 0
+        return removed + len(self._added[0])
+
+    def sync(self, catalog_ids, raw_features):
+        """
+        Brings the index in line with the catalog: adds songs it doesn't know and
+        removes songs that are gone. raw_features is aligned with catalog_ids.
+        """
+        catalog_ids = np.asarray(catalog_ids, dtype=np.int64)
+        current = self.all_ids()
+        new_mask = ~np.isin(catalog_ids, current)
+        gone = current[~np.isin(current, catalog_ids)]
+        self.remove(gone)
+        self.add(catalog_ids[new_mask], np.asarray(raw_features)[new_mask])
+        return int(new_mask.sum()), len(gone)
+
+    def refresh_changed(self, catalog_ids, raw_features, tolerance=1e-4):
+        """
+        Re-adds the songs whose features changed in place (same id, new values), e.g.
+        after a full catalog reload. Songs the index doesn't hold are left to sync().
+        Returns the number of songs re-added.
+        """
+        catalog_ids = np.asarray(catalog_ids, dtype=np.int64)
+        current_ids, current_vectors = self.all_ids(), self.all_vectors()
+        if not len(current_ids) or not len(catalog_ids):
+            return 0
+        order = np.argsort(current_ids, kind='stable')
+        found = np.minimum(np.searchsorted(current_ids[order], catalog_ids), len(order) - 1)
+        known = current_ids[order[found]] == catalog_ids
+        rows = np.flatnonzero(known)
+        raw = np.asarray(raw_features)[rows]
+        stale = np.abs(current_vectors[order[found[rows]]] - self.transform(raw)).max(axis=1) > tolerance
+        self.add(catalog_ids[rows[stale]], raw[stale])
+        return int(stale.sum())
+
+    # --- Persistence ---
+
+    def save(self, path):
+        """
+        Writes the index to 'path' (a directory). Pending deltas are folded in by
+        rebuilding first, so the saved index is self-contained.
+        """
+        index = self
+        if self.delta_size():
+            raw = self.all_vectors() * self.std + self.mean
+            index = type(self).build(self.all_ids(), raw, **self.params)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {'ids': index.ids, 'vectors': index.vectors}
+        arrays.update({name: getattr(index, name) for name in index.extra_arrays})
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+        manifest = {
+            'kind': index.kind,
+            'count': int(len(index.ids)),
+            'dims': int(index.vectors.shape[1]),
+            'mean': index.mean.tolist(),
+            'std': index.std.tolist(),
+            'params': index.params,
+            'created_at': time.time(),
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return index
+
+    def all_vectors(self):
+        base = self.vectors if self._removed is None else self.vectors[~self._removed]
+        return np.concatenate([np.asarray(base), self._added[1]])
+
+    @staticmethod
+    def load(path, mmap=True):
+        """Loads a saved index; with mmap=True the arrays are memory-mapped read-only."""
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        cls = INDEX_KINDS[manifest['kind']]
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+                  for name in ('ids', 'vectors') + cls.extra_arrays}
+        index = cls(arrays.pop('ids'), arrays.pop('vectors'), manifest['mean'], manifest['std'], manifest['params'])
+        for name, array in arrays.items():
+            setattr(index, name, array)
+        return index
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force scan of every vector."""
+    kind = 'exact'
+
+    def _candidates(self, query, k):
+        return None
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index: k-means centroids, vectors stored grouped by cluster.
+    Params: nlist (clusters, default ~sqrt(n)), nprobe (clusters scanned per query).
+    """
+    kind = 'ivf'
+    extra_arrays = ('centroids', 'offsets')
+
+    def _train(self):
+        n = len(self.ids)
+        nlist = int(self.params.setdefault('nlist', max(1, int(np.sqrt(n)))))
+        self.params.setdefault('nprobe', max(1, nlist // 16))
+        self.centroids = _kmeans(self.vectors, nlist, seed=self.params.get('seed', 0))
+        assignment = _nearest_centroid(self.vectors, self.centroids)
+        order = np.argsort(assignment, kind='stable')
+        self.ids, self.vectors = self.ids[order], self.vectors[order]
+        counts = np.bincount(assignment, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def _candidates(self, query, k):
+        nprobe = int(self.params['nprobe'])
+        lists, _ = top_k_smallest(_sq_distances(self.centroids, query), len(self.centroids))
+        chosen, total = [], 0
+        # Probe the closest clusters, and keep going while we have fewer than k candidates
+        for probed, lst in enumerate(lists):
+            if probed >= nprobe and total >= k:
+                break
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            chosen.append(np.arange(start, end))
+            total += end - start
+        return np.concatenate(chosen) if chosen else np.empty(0, dtype=np.intp)
+
+
+class LSHIndex(VectorIndex):
+    """
+    Random-projection LSH: each table hashes a vector to n_bits sign bits of
+    (x . plane - threshold). Thresholds are projections of random data points,
+    so the hyperplanes cut through the data instead of all crossing the origin.
+    Params: n_tables, n_bits (default ~1.6 * log2(n / 32): with only 5 dimensions
+    most of the 2^n_bits cells are empty, so more bits are needed to keep buckets
+    small), multiprobe (also probe buckets at Hamming distance 1).
+    """
+    kind = 'lsh'
+    extra_arrays = ('planes', 'thresholds', 'sorted_codes', 'order')
+
+    def _train(self):
+        n, dims = self.vectors.shape
+        n_tables = int(self.params.setdefault('n_tables', 8))
+        n_bits = int(self.params.setdefault('n_bits', int(np.clip(1.6 * np.log2(max(n, 1) / 32), 4, 32))))
+        self.params.setdefault('multiprobe', False)
+        rng = np.random.default_rng(self.params.get('seed', 0))
+        self.planes = rng.standard_normal((n_tables, n_bits, dims)).astype(np.float32)
+        anchors = self.vectors[rng.integers(0, max(n, 1), size=(n_tables, n_bits))] if n else np.zeros((n_tables, n_bits, dims), np.float32)
+        self.thresholds = np.einsum('tbd,tbd->tb', self.planes, anchors).astype(np.float32)
+        codes = self._hash(self.vectors)                       # (n_tables, n)
+        self.order = np.argsort(codes, axis=1, kind='stable').astype(np.int64)
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+
+    def _hash(self, vectors):
+        projections = np.einsum('tbd,nd->tnb', self.planes, np.atleast_2d(vectors)) > self.thresholds[:, None, :]
+        weights = (1 << np.arange(projections.shape[2], dtype=np.uint32))
+        return (projections.astype(np.uint32) * weights).sum(axis=2, dtype=np.uint32)
+
+    def _candidates(self, query, k):
+        query_codes = self._hash(query)[:, 0]
+        n_bits = self.planes.shape[1]
+        flips = np.uint32(1) << np.arange(n_bits, dtype=np.uint32) if self.params.get('multiprobe') else np.empty(0, np.uint32)
+        chosen = []
+        for table, code in enumerate(query_codes):
+            probes = np.concatenate([[code], code ^ flips]).astype(np.uint32)
+            sorted_codes = self.sorted_codes[table]
+            starts = np.searchsorted(sorted_codes, probes, 'left')
+            ends = np.searchsorted(sorted_codes, probes, 'right')
+            chosen.extend(self.order[table, start:end] for start, end in zip(starts, ends) if end > start)
+        return np.unique(np.concatenate(chosen)) if chosen else np.empty(0, dtype=np.intp)
+
+
+INDEX_KINDS = {cls.kind: cls for cls in (ExactIndex, IVFIndex, LSHIndex)}
+
+
+def _nearest_centroid(vectors, centroids, chunk_size=65536):
+    """Index of the closest centroid for every vector, computed in chunks to bound memory."""
+    c_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignment[start:start + chunk_size] = np.argmin(c_norms - 2.0 * chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def _kmeans(vectors, k, iterations=10, sample_size=100_000, seed=0):
+    """Plain Lloyd's k-means on a random sample of the vectors."""
+    rng = np.random.default_rng(seed)
+    if not len(vectors):
+        return np.zeros((1, vectors.shape[1]), dtype=np.float32)
+    sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    k = min(k, len(sample))
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _nearest_centroid(sample, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    return centroids
+
+
+def recall_report(catalog_ids, raw_features, kinds=('exact', 'ivf', 'lsh'), num_queries=200, k=10, seed=0, **params):
+    """
+    Builds each index kind over the same data and measures, against the exact
+    search, recall@k and per-query latency on 'num_queries' random catalog songs.
+    Returns one dict per kind.
+    """
+    exact = ExactIndex.build(catalog_ids, raw_features)
+    rng = np.random.default_rng(seed)
+    queries = exact.vectors[rng.choice(len(exact.ids), size=min(num_queries, len(exact.ids)), replace=False)]
+    truth = [set(exact.search(q, k)[0].tolist()) for q in queries]
+
+    report = []
+    for kind in kinds:
+        started = time.perf_counter()
+        index = INDEX_KINDS[kind].build(catalog_ids, raw_features, **params.get(kind, {}))
+        build_seconds = time.perf_counter() - started
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found, _ = index.search(query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(expected.intersection(found.tolist()))
+        report.append({
+            'kind': kind,
+            'params': index.params,
+            'recall': hits / max(1, sum(len(t) for t in truth)),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'build_seconds': build_seconds,
+        })
+    return report
+
+
+# --- Process-wide index used by the recommender ---
+
+_index = None
+_index_lock = threading.Lock()
+
+def _open_index(catalog, kind, path):
+    """Memory-maps the saved index at 'path' if it is of the wanted kind, else builds one in memory."""
+    manifest_path = os.path.join(path, MANIFEST_FILE) if path else None
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            saved_kind = json.load(f)['kind']
+        if saved_kind == kind:
+            return VectorIndex.load(path)
+        logger.warning("Saved index at %s is %r but %r was requested; building a %r index in memory "
+                       "(rebuild it with: python -m backend.ann_index build --kind %s)",
+                       path, saved_kind, kind, kind, kind)
+    return INDEX_KINDS[kind].build(catalog.ids, catalog.features)
+
+def get_index(catalog, kind, path=None):
+    """
+    Returns the process-wide index, kept in sync with the catalog snapshot.
+    The first call memory-maps the saved index at 'path' (or builds one in memory
+    if there is none or it is of another kind); later catalog changes are applied
+    incrementally. After a full catalog reload (songs may have been updated in
+    place) the changed vectors are re-added as well.
+    """
+    global _index
+    with _index_lock:
+        if _index is None or _index.requested_kind != kind:
+            _index = _open_index(catalog, kind, path)
+            _index.requested_kind = kind
+            _index.catalog_version = _index.reload_version = None
+        if _index.catalog_version != catalog.version:
+            if _index.reload_version != catalog.reload_version:
+                _index.refresh_changed(catalog.ids, catalog.features)
+                _index.reload_version = catalog.reload_version
+            _index.sync(catalog.ids, catalog.features)
+            _index.catalog_version = catalog.version
+        return _index
+
+def reset_index():
+    """Drops the process-wide index (the next get_index() reloads/rebuilds it)."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from backend.app import create_app
+    from backend.config import Config
+    from backend.recommender import get_catalog
+
+    parser = argparse.ArgumentParser(description='Build or evaluate the song nearest-neighbour index.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help='build an index from the song table and save it')
+    build_cmd.add_argument('--kind', choices=sorted(INDEX_KINDS), default=Config.RECOMMENDER_INDEX or 'ivf')
+    build_cmd.add_argument('--path', default=Config.RECOMMENDER_INDEX_PATH)
+    report_cmd = sub.add_parser('report', help='recall vs latency of each index kind against exact search')
+    report_cmd.add_argument('--queries', type=int, default=200)
+    report_cmd.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        catalog = get_catalog()
+    if args.command == 'build':
+        started = time.perf_counter()
+        index = INDEX_KINDS[args.kind].build(catalog.ids, catalog.features).save(args.path)
+        print(f"Built {args.kind} index over {len(index)} songs in {time.perf_counter() - started:.2f}s -> {args.path}")
+    else:
+        for row in recall_report(catalog.ids, catalog.features, num_queries=args.queries, k=args.k):
+            print(f"{row['kind']:>6}  recall@{args.k}={row['recall']:.3f}  p50={row['p50_ms']:.3f}ms  "
+                  f"p99={row['p99_ms']:.3f}ms  build={row['build_seconds']:.2f}s  params={row['params']}")
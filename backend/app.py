@@ -21,7 +21,12 @@ def create_app(config_class=Config):
     
     # Initialize CORS (Cross-Origin Resource Sharing)
     # Allows requests from the React frontend (running on a different port)
-    CORS(app) 
+    # X-Next-Cursor (pagination of /search) must be exposed explicitly to be readable by the browser
+    CORS(app, expose_headers=['X-Next-Cursor'])
+
+    # Latency/SQL instrumentation and the /metrics endpoint (Prometheus text format)
+    from backend import metrics
+    metrics.init_app(app)
 
     # Import and register the Blueprint containing the API routes
     # This import is done *inside* the factory function to avoid circular imports
@@ -31,18 +36,48 @@ def create_app(config_class=Config):
     # Return the configured Flask app instance
     return app
 
+def init_db(app):
+    """
+    Creates missing tables and the indexes declared after the tables were first created
+    (create_all skips existing tables). Safe to run repeatedly.
+    """
+    with app.app_context():
+        # This will check the database and create tables defined in models.py if needed
+        db.create_all()
+        print("Database tables created or already exist.") # English message
+
+        # The unique (user_id, song_id) favorite index (ON CONFLICT of the bulk edits relies on it)
+        # and the (genre, id) index of GET /songs
+        from backend.favorites import ensure_favorite_indexes
+        from backend.models import Song
+        ensure_favorite_indexes(db.engine)
+        for index in Song.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+        # Trigram indexes for the PostgreSQL search backend
+        if app.config['SEARCH_BACKEND'] == 'postgres' and db.engine.dialect.name == 'postgresql':
+            from backend.search_index import ensure_postgres_indexes
+            ensure_postgres_indexes(db.engine)
+
+def warm_up(app):
+    """
+    Brings the database schema up to date (init_db) and loads the song catalog once at startup,
+    so the first request doesn't pay for it. Every entry point (python -m backend.app,
+    backend/wsgi.py) calls it before serving.
+    """
+    init_db(app)
+    with app.app_context():
+        from backend.recommender import get_catalog
+        print(f"Song catalog loaded: {len(get_catalog())} songs.")
+
 # This block runs only when the script is executed directly (e.g., python -m backend.app)
 if __name__ == '__main__':
     # Create the Flask app instance using the factory
     app = create_app()
 
-    # Create database tables if they don't exist
-    # Use app.app_context() to ensure database operations have access to the app configuration
-    with app.app_context():
-        # This will check the database and create tables defined in models.py if needed
-        db.create_all()
-        print("Database tables created or already exist.") # English message
-        
-    # Run the Flask development server
+    # Create missing tables/indexes and load the catalog
+    warm_up(app)
+
+    # Run the Flask development server (for production use gunicorn with backend/wsgi.py)
     # debug=True enables automatic reloading on code changes and provides a debugger
     app.run(debug=True) # host='0.0.0.0' could be added to make it accessible on the network
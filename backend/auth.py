@@ -0,0 +1,137 @@
+# backend/auth.py
+
+"""
+Token authentication fast path.
+
+Validating a request used to mean decoding the JWT and loading the User row
+from the database on every call (every search keystroke). Here a bounded
+cache maps a token to the user's id and username until the earlier of the
+token's 'exp' and AUTH_CACHE_TTL. Routes receive a Principal that exposes
+id/username directly and only loads the full User row if an endpoint touches
+any other attribute.
+
+invalidate_user() is the hook for code that deletes a user or changes a
+password: it bumps the user's generation, checked on every cache hit, so all
+of their cached tokens miss and are validated against the database again.
+The cache is per process, so another worker keeps such a token for at most
+AUTH_CACHE_TTL seconds; routes that write rows referencing the user call
+Principal.ensure_exists() first.
+"""
+
+import threading
+import time
+
+import jwt
+
+from backend import db
+from backend.cache import MemoryBackend
+from backend.config import Config
+from backend.models import User
+
+
+class AuthenticationError(Exception):
+    """Raised when a token is invalid, expired or belongs to no user."""
+
+
+class Principal:
+    """
+    The authenticated user of a request.
+    'id' and 'username' come from the token cache; any other attribute
+    (e.g. 'favorites') is read from the User row, loaded on first access.
+    """
+    __slots__ = ('id', 'username', '_user')
+
+    def __init__(self, user_id, username):
+        self.id = user_id
+        self.username = username
+        self._user = None
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+            if self._user is None:
+                raise AuthenticationError("User not found")
+        return self._user
+
+    def ensure_exists(self):
+        """Loads the User row; raises AuthenticationError if the user was deleted."""
+        self.user
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't slots: delegate to the full User row
+        return getattr(self.user, name)
+
+    def __repr__(self):
+        return f"<Principal {self.id} {self.username!r}>"
+
+
+class TokenCache:
+    """
+    Bounded LRU of token -> (user_id, username, user generation).
+    A user's generation is bumped by invalidate_user(), which makes all of
+    their cached tokens miss without having to find them.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.ttl = ttl
+        self._entries = MemoryBackend(max_entries=max_entries)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None or entry[2] != self._generations.get(entry[0], 0):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def generation(self, user_id):
+        return self._generations.get(user_id, 0)
+
+    def put(self, token, user_id, username, generation, expires_at):
+        # 'generation' is read before the user was loaded, so an invalidation racing
+        # with this lookup leaves the entry already stale instead of resurrecting it
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl > 0:
+            self._entries.set(token, (user_id, username, generation), ttl=ttl)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                'evictions': self._entries.evictions}
+
+
+token_cache = TokenCache(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL)
+
+
+def authenticate_token(token, secret_key):
+    """
+    Returns the Principal for a bearer token, from the cache when possible.
+    Raises AuthenticationError (or a jwt error) when the token is not valid.
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return Principal(cached[0], cached[1])
+
+    data = jwt.decode(token, secret_key, algorithms=["HS256"])
+    generation = token_cache.generation(data['user_id'])
+    row = db.session.query(User.id, User.username).filter_by(id=data['user_id']).first()
+    if not row:
+        raise AuthenticationError("User not found")
+    token_cache.put(token, row.id, row.username, generation, data.get('exp', time.time() + token_cache.ttl))
+    return Principal(row.id, row.username)
+
+
+def invalidate_user(user_id):
+    """Forgets all cached tokens of a user (call on password change / account removal)."""
+    token_cache.invalidate_user(user_id)
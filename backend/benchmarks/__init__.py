@@ -0,0 +1,4 @@
+# backend/benchmarks/__init__.py
+
+# Benchmark scripts for the backend. Each module is runnable on its own, e.g.:
+#     python -m backend.benchmarks.auth_overhead
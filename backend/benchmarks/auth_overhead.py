@@ -0,0 +1,99 @@
+# backend/benchmarks/auth_overhead.py
+
+"""
+Per-request overhead of token authentication, before and after the token cache.
+
+Runs the token_required decorator around a no-op view inside a request context
+(so routing/JSON costs are excluded) against a temporary SQLite database:
+- legacy:     decode the JWT + load the User row on every request (old decorator)
+- cold cache: the cached path when every request misses (first request of a token)
+- warm cache: the cached path for a token seen before (the common case)
+
+Usage:
+    python -m backend.benchmarks.auth_overhead [--requests 20000]
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from functools import wraps
+
+import jwt
+
+
+def legacy_token_required(f, secret_key):
+    """The decorator as it was before the auth cache (one User query per request)."""
+    from flask import request, jsonify
+    from backend.models import User
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization').split(" ")[1]
+        try:
+            data = jwt.decode(token, secret_key, algorithms=["HS256"])
+            current_user = User.query.filter_by(id=data['user_id']).first()
+            if not current_user: raise Exception("User not found")
+        except Exception:
+            return jsonify({'message': 'Token invalid sau expirat!'}), 401
+        return f(current_user, *args, **kwargs)
+    return decorated
+
+
+def _time_per_call(func, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        func()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def run(requests=20000):
+    db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_file}"
+
+    from backend.app import create_app
+    from backend import db
+    from backend.models import User
+    from backend.routes import token_required, SECRET_KEY
+    from backend.auth import token_cache
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', password_hash='x')
+        db.session.add(user); db.session.commit()
+        token = jwt.encode({'user_id': user.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)},
+                           SECRET_KEY, algorithm="HS256")
+
+    def view(current_user):
+        return current_user.id
+
+    legacy = legacy_token_required(view, SECRET_KEY)
+    cached = token_required(view)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    results = {}
+    with app.test_request_context('/search', headers=headers):
+        results['legacy_us'] = _time_per_call(legacy, requests)
+
+        def cold():
+            token_cache.clear()
+            return cached()
+        results['cold_cache_us'] = _time_per_call(cold, requests)
+
+        token_cache.clear()
+        results['warm_cache_us'] = _time_per_call(cached, requests)
+    results['speedup'] = results['legacy_us'] / results['warm_cache_us']
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+    results = run(args.requests)
+    print(f"legacy (decode + User query): {results['legacy_us']:8.1f} us/request")
+    print(f"cached, cold (every miss):    {results['cold_cache_us']:8.1f} us/request")
+    print(f"cached, warm (token seen):    {results['warm_cache_us']:8.1f} us/request")
+    print(f"speedup (warm vs legacy):     {results['speedup']:8.1f}x")
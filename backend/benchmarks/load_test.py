@@ -0,0 +1,107 @@
+# backend/benchmarks/load_test.py
+
+"""
+Concurrent HTTP load against a running instance of the app.
+
+The app is served by werkzeug's threaded server on an ephemeral local port
+(start_server), and 'concurrency' client threads with keep-alive connections
+replay a weighted mix of /search, /recommendations, /profile and /favorites
+requests for a fixed duration.
+"""
+
+import http.client
+import logging
+import random
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+import numpy as np
+
+# (endpoint name, weight) of the default request mix
+DEFAULT_MIX = (('search', 5), ('recommendations', 3), ('profile', 1), ('favorites', 1))
+
+
+def start_server(app, host='127.0.0.1'):
+    """Serves 'app' on a free port in a background thread. Returns (server, base_url)."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per request
+    server = make_server(host, 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='bench-server', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def _path_for(endpoint, rng, search_terms):
+    if endpoint == 'search':
+        return f"/search?q={quote(rng.choice(search_terms))}"
+    if endpoint == 'recommendations':
+        return f"/recommendations?mode={rng.choice(['genre', 'similar'])}"
+    return f"/{endpoint}"
+
+
+def percentiles(latencies_ms):
+    if not latencies_ms:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def run_load(base_url, tokens, search_terms, concurrency=8, duration=10.0, mix=DEFAULT_MIX, seed=0):
+    """
+    Drives the server for 'duration' seconds with 'concurrency' clients.
+    Each client picks a random user token and endpoint (weighted by 'mix') per request.
+    Returns {endpoint: {'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'}} plus an 'all' entry.
+    """
+    parsed = urlparse(base_url)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker_id):
+        rng = random.Random(seed + worker_id)
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            headers = {'Authorization': f"Bearer {rng.choice(tokens)}"}
+            started = time.perf_counter()
+            try:
+                conn.request('GET', _path_for(endpoint, rng, search_terms), headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=30)
+                ok = False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if ok:
+                local[endpoint].append(elapsed_ms)
+            else:
+                local_errors[endpoint] += 1
+        conn.close()
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name in names + ['all']:
+        values = latencies[name] if name != 'all' else [v for n in names for v in latencies[n]]
+        failed = errors[name] if name != 'all' else sum(errors.values())
+        results[name] = {'requests': len(values), 'errors': failed, 'rps': len(values) / elapsed}
+        results[name].update(percentiles(values))
+    return results
@@ -0,0 +1,51 @@
+# backend/benchmarks/micro.py
+
+"""
+Microbenchmarks of single code paths, outside of HTTP.
+
+- bench_recommender: get_recommendations_for_user per mode (warm catalog, no
+  recommendation cache) and the batch iterator's throughput.
+- bench_ingest: the seed pipeline (ingest_csv in 'replace' mode) on a CSV.
+
+Both must be called inside an app context.
+"""
+
+import time
+
+import numpy as np
+
+from backend.benchmarks.load_test import percentiles
+
+
+def bench_recommender(user_ids, modes=('genre', 'similar', 'collaborative', 'blended'), repeats=200, num_recommendations=5, seed=0):
+    """
+    Times get_recommendations_for_user for 'repeats' random users per mode.
+    Returns {'recommend_<mode>': {calls, p50_ms, p95_ms, p99_ms}, 'batch_similar': {users, users_per_sec}}.
+    """
+    from backend.recommender import get_catalog, get_recommendations_for_user, iter_recommendations_for_users
+
+    rng = np.random.default_rng(seed)
+    get_catalog()  # the first call loads the catalog; don't count it
+    results = {}
+    for mode in modes:
+        get_recommendations_for_user(int(user_ids[0]), num_recommendations, mode=mode)  # builds derived indexes
+        latencies = []
+        for user_id in rng.choice(user_ids, size=repeats):
+            started = time.perf_counter()
+            get_recommendations_for_user(int(user_id), num_recommendations, mode=mode)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[f"recommend_{mode}"] = {'calls': repeats, **percentiles(latencies)}
+
+    started = time.perf_counter()
+    served = sum(1 for _ in iter_recommendations_for_users(list(user_ids), num_recommendations, mode='similar'))
+    elapsed = time.perf_counter() - started
+    results['batch_similar'] = {'users': served, 'users_per_sec': served / elapsed if elapsed else 0.0}
+    return results
+
+
+def bench_ingest(csv_path, chunksize=50000, method='auto'):
+    """Runs the seed pipeline (replace mode) on 'csv_path'. Returns {'ingest': {rows, seconds, rows_per_sec}}."""
+    from backend.ingest import ingest_csv
+
+    stats = ingest_csv(csv_path, mode='replace', chunksize=chunksize, method=method)
+    return {'ingest': {'rows': stats['inserted'], 'seconds': stats['seconds'], 'rows_per_sec': stats['rows_per_sec']}}
@@ -0,0 +1,162 @@
+# backend/benchmarks/run.py
+
+"""
+Reproducible benchmark run: synthetic data -> seed pipeline -> microbenchmarks -> HTTP load.
+
+1. Generates a synthetic catalog CSV shaped like data.csv (--songs, 10k..5M).
+2. Seeds the database from it with the ingestion pipeline (timed).
+3. Creates synthetic users and favorites (--users).
+4. Microbenchmarks get_recommendations_for_user per mode.
+5. Serves create_app() on a local port and drives /search, /recommendations,
+   /profile and /favorites with --concurrency clients for --duration seconds.
+
+By default everything runs against a temporary SQLite file. --database-url
+points it at another database (e.g. a throwaway PostgreSQL); that database is
+dropped and recreated, so never use a real one.
+
+Results (req/s, p50/p95/p99 per endpoint, peak RSS, ingest rows/sec, ...) are
+written as JSON; --compare flags metrics that regressed against an earlier run
+and exits with status 1 if any did.
+
+Usage:
+    python -m backend.benchmarks.run --songs 100000 --users 2000 --output results.json
+    python -m backend.benchmarks.run --songs 100000 --users 2000 --compare results.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+# Metrics where a larger value is better; everything else (latencies, seconds) is better smaller
+HIGHER_IS_BETTER = ('rps', 'rows_per_sec', 'users_per_sec')
+COMPARED_SUFFIXES = ('_ms', 'seconds', 'rss_mb') + HIGHER_IS_BETTER
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _make_tokens(user_ids, secret_key):
+    import jwt
+    expires = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    return [jwt.encode({'user_id': int(uid), 'exp': expires}, secret_key, algorithm="HS256") for uid in user_ids]
+
+
+def run(songs=100_000, users=1000, concurrency=8, duration=10.0, mean_favorites=20, repeats=200,
+        csv_path=None, seed=0):
+    """Runs all stages (see the module docstring) and returns the results dict."""
+    # Imported here: DATABASE_URL must be set before backend.config is first imported
+    from backend import db
+    from backend.app import create_app
+    from backend.benchmarks.load_test import run_load, start_server
+    from backend.benchmarks.micro import bench_ingest, bench_recommender
+    from backend.benchmarks.synthetic import CatalogProfile, generate_catalog_csv, generate_users_and_favorites
+    from backend.routes import SECRET_KEY
+
+    results = {}
+    profile = CatalogProfile()
+    if csv_path is None:
+        csv_path = os.path.join(tempfile.mkdtemp(), 'synthetic_songs.csv')
+        started = time.perf_counter()
+        generate_catalog_csv(csv_path, songs, profile=profile, seed=seed)
+        results['generate_catalog'] = {'songs': songs, 'seconds': time.perf_counter() - started}
+
+    app = create_app()
+    with app.app_context():
+        results.update(bench_ingest(csv_path))
+        started = time.perf_counter()
+        user_ids = generate_users_and_favorites(db.engine, users, mean_favorites=mean_favorites, seed=seed)
+        results['generate_users'] = {'users': users, 'seconds': time.perf_counter() - started}
+        results.update(bench_recommender(user_ids, repeats=repeats, seed=seed))
+
+    tokens = _make_tokens(user_ids, SECRET_KEY)
+    search_terms = [str(word) for word in profile.title_words[::max(1, len(profile.title_words) // 500)]]
+    server, base_url = start_server(app)
+    try:
+        for endpoint, stats in run_load(base_url, tokens, search_terms, concurrency=concurrency,
+                                        duration=duration, seed=seed).items():
+            results[f"http_{endpoint}"] = stats
+    finally:
+        server.shutdown()
+    results['memory'] = {'peak_rss_mb': peak_rss_mb()}
+    return results
+
+
+def _flatten(results):
+    return {f"{group}.{name}": value for group, metrics in results.items()
+            for name, value in metrics.items() if isinstance(value, (int, float))}
+
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compares two results dicts metric by metric.
+    Returns [(metric, baseline value, current value, relative change)] for metrics
+    that got worse by more than 'threshold' (synthetic data generation is not compared).
+    """
+    regressions = []
+    old_values = _flatten(baseline)
+    for metric, new in _flatten(current).items():
+        old = old_values.get(metric)
+        if not old or not metric.endswith(COMPARED_SUFFIXES) or metric.startswith('generate_'):
+            continue
+        change = (new - old) / old
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        if worse > threshold:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+def _print_results(results):
+    for group, metrics in results.items():
+        values = ', '.join(f"{name}={value:,.2f}" if isinstance(value, float) else f"{name}={value}"
+                           for name, value in metrics.items())
+        print(f"{group:24} {values}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--songs', type=int, default=100_000, help='synthetic catalog size')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--mean-favorites', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent HTTP clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of HTTP load')
+    parser.add_argument('--repeats', type=int, default=200, help='calls per recommender mode')
+    parser.add_argument('--csv', default=None, help='use this CSV instead of generating one')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', default=None, help='database to use (dropped!); default: temporary SQLite')
+    parser.add_argument('--output', default=None, help='write results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative regression (default 10%%)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    results = run(songs=args.songs, users=args.users, concurrency=args.concurrency, duration=args.duration,
+                  mean_favorites=args.mean_favorites, repeats=args.repeats, csv_path=args.csv, seed=args.seed)
+    report = {'meta': {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       'python': platform.python_version(), 'platform': platform.platform(),
+                       'database': os.environ['DATABASE_URL'].split(':', 1)[0], **vars(args)},
+              'results': results}
+    _print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        for metric, old, new, change in regressions:
+            print(f"REGRESSION {metric}: {old:,.3f} -> {new:,.3f} ({change:+.1%})")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}.")
@@ -0,0 +1,102 @@
+# backend/benchmarks/synthetic.py
+
+"""
+Synthetic catalogs, users and favorites shaped like data.csv.
+
+Genres are drawn with the genre frequencies of data.csv and each audio feature
+from a normal distribution with that genre's mean/std (clipped to the observed
+range). Titles and artists are built from words of the real titles/artists so
+search queries hit realistic posting-list sizes. Users favorite songs mostly
+from 1-3 preferred genres, with a long-tailed number of favorites.
+
+The catalog is written as a CSV in the data.csv column layout, so it can be
+loaded through the real ingestion pipeline (backend/ingest.py).
+"""
+
+import csv
+import re
+
+import numpy as np
+import pandas as pd
+
+from backend.ingest import COLUMN_MAPPING
+
+FEATURES = ['danceability', 'energy', 'tempo', 'loudness', 'valence']
+
+
+class CatalogProfile:
+    """Distributions extracted from a real CSV (by default data.csv)."""
+
+    def __init__(self, csv_path='data.csv'):
+        df = pd.read_csv(csv_path, usecols=list(COLUMN_MAPPING)).rename(columns=COLUMN_MAPPING).dropna()
+        counts = df['genre'].value_counts()
+        self.genres = counts.index.to_numpy()
+        self.genre_probs = (counts / counts.sum()).to_numpy()
+        grouped = df.groupby('genre')[FEATURES]
+        self.means = grouped.mean().reindex(self.genres).to_numpy()
+        self.stds = grouped.std().fillna(0).reindex(self.genres).to_numpy()
+        self.mins = df[FEATURES].min().to_numpy()
+        self.maxs = df[FEATURES].max().to_numpy()
+        self.title_words = np.array(sorted({w for t in df['title'] for w in re.findall(r"[A-Za-z']{2,}", t)}))
+        self.artist_words = np.array(sorted({w for a in df['artist'] for w in re.findall(r"[A-Za-z']{2,}", a)}))
+
+
+def generate_catalog_csv(path, num_songs, profile=None, seed=0, chunk_size=100_000):
+    """
+    Writes 'num_songs' synthetic songs to a CSV with data.csv's column names.
+    Generated in chunks, so millions of rows don't need to fit in memory.
+    """
+    profile = profile or CatalogProfile()
+    rng = np.random.default_rng(seed)
+    num_artists = max(10, num_songs // 8)
+    columns = list(COLUMN_MAPPING)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for start in range(0, num_songs, chunk_size):
+            n = min(chunk_size, num_songs - start)
+            genre_idx = rng.choice(len(profile.genres), size=n, p=profile.genre_probs)
+            features = rng.normal(profile.means[genre_idx], profile.stds[genre_idx])
+            features = np.clip(features, profile.mins, profile.maxs).round(4)
+            words = rng.choice(profile.title_words, size=(n, 3))
+            lengths = rng.integers(1, 4, size=n)
+            artist_ids = rng.zipf(1.3, size=n) % num_artists
+            for i in range(n):
+                title = ' '.join(words[i, :lengths[i]]) + f" #{start + i}"  # unique (title, artist)
+                artist = f"{profile.artist_words[artist_ids[i] % len(profile.artist_words)]} {artist_ids[i]}"
+                row = {'track_name': title, 'track_artist': artist, 'playlist_genre': profile.genres[genre_idx[i]]}
+                row.update(zip(FEATURES, features[i]))
+                writer.writerow([row[c] for c in columns])
+    return path
+
+
+def generate_users_and_favorites(engine, num_users, mean_favorites=20, seed=0, password_hash='x'):
+    """
+    Inserts 'num_users' users and their favorites (biased to 1-3 preferred genres).
+    Returns the list of created user ids.
+    """
+    from sqlalchemy import insert, select
+    from backend.models import User, Song, Favorite
+
+    rng = np.random.default_rng(seed)
+    with engine.begin() as conn:
+        songs = pd.read_sql_query(select(Song.id, Song.genre), conn)
+        first_user = conn.execute(select(User.id).order_by(User.id.desc()).limit(1)).scalar() or 0
+        usernames = [f"bench_user_{first_user + i + 1}_{seed}" for i in range(num_users)]
+        conn.execute(insert(User.__table__), [{'username': u, 'password_hash': password_hash} for u in usernames])
+        user_ids = [row[0] for row in conn.execute(select(User.id).where(User.username.in_(usernames)).order_by(User.id))]
+
+        by_genre = {genre: group['id'].to_numpy() for genre, group in songs.groupby('genre')}
+        genres = np.array(list(by_genre))
+        favorites = []
+        for user_id in user_ids:
+            count = int(min(len(songs), max(1, rng.lognormal(np.log(mean_favorites), 0.8))))
+            preferred = rng.choice(genres, size=min(len(genres), rng.integers(1, 4)), replace=False)
+            pool = np.concatenate([by_genre[g] for g in preferred])
+            # ~80% from preferred genres, the rest from the whole catalog
+            picks = np.concatenate([rng.choice(pool, size=min(len(pool), int(count * 0.8) + 1), replace=False),
+                                    rng.choice(songs['id'].to_numpy(), size=count // 5, replace=False)])
+            favorites.extend({'user_id': user_id, 'song_id': int(song_id)} for song_id in np.unique(picks))
+        for start in range(0, len(favorites), 50_000):
+            conn.execute(insert(Favorite.__table__), favorites[start:start + 50_000])
+    return user_ids
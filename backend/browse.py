@@ -0,0 +1,124 @@
+# backend/browse.py
+
+"""
+Catalog browsing: filtered pages of the song table and streaming exports.
+
+Pages use keyset pagination on Song.id (WHERE id > :after ORDER BY id LIMIT n),
+so every page is an index range scan no matter how deep the client is, and
+rows inserted meanwhile never shift the pages. Exports run one query on a
+server-side cursor (stream_results) and yield rows in batches, so the full
+result is never materialized in memory.
+"""
+
+import csv
+import io
+import json
+import math
+
+from sqlalchemy import select
+
+from backend import db
+from backend.models import Song
+from backend.serializers import SONG_FIELDS
+
+# Features that can be filtered with <feature>_min / <feature>_max (inclusive)
+RANGE_FILTERS = ('danceability', 'energy', 'tempo', 'loudness', 'valence')
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_BATCH_SIZE = 1000
+
+
+class BrowseError(ValueError):
+    """Raised for invalid filter or field parameters (the message is shown to the client)."""
+
+
+def parse_fields(value):
+    """
+    Parses ?fields=id,title,... into a tuple of song fields (API order). Empty: all fields.
+    """
+    if not value:
+        return SONG_FIELDS
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(SONG_FIELDS)
+    if unknown:
+        raise BrowseError(f"Campuri necunoscute: {', '.join(sorted(unknown))}")
+    return tuple(field for field in SONG_FIELDS if field in requested)
+
+
+def parse_filters(args):
+    """
+    Builds the WHERE conditions from the query string:
+    ?genre=pop or ?genre=pop,rock and ?<feature>_min=x / ?<feature>_max=y for the audio features
+    (e.g. energy_min=0.8, tempo_min=120&tempo_max=130).
+    """
+    conditions = []
+    genres = [genre.strip() for genre in args.get('genre', '').split(',') if genre.strip()]
+    if genres:
+        conditions.append(Song.genre == genres[0] if len(genres) == 1 else Song.genre.in_(genres))
+    for feature in RANGE_FILTERS:
+        column = getattr(Song, feature)
+        for suffix, compare in (('_min', column.__ge__), ('_max', column.__le__)):
+            raw = args.get(feature + suffix)
+            if raw is None:
+                continue
+            try:
+                value = float(raw)
+            except ValueError:
+                value = math.nan
+            if not math.isfinite(value):
+                # float() also accepts 'nan' and 'inf', which would match nothing / everything
+                raise BrowseError(f"{feature}{suffix} trebuie sa fie un numar")
+            conditions.append(compare(value))
+    return conditions
+
+
+def _songs_select(fields, conditions, after=None):
+    columns = [Song.id] + [getattr(Song, field) for field in fields if field != 'id']
+    query = select(*columns).where(*conditions)
+    if after is not None:
+        query = query.where(Song.id > after)
+    return query.order_by(Song.id)
+
+
+def _project(row, fields):
+    return {field: getattr(row, field) for field in fields}
+
+
+def load_songs_page(fields, conditions, limit, after=None):
+    """
+    Returns (songs, next_cursor) for one page of the catalog (only the requested fields).
+    next_cursor is the id of the last song of the page, None on the last page.
+    """
+    rows = db.session.execute(_songs_select(fields, conditions, after).limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [_project(row, fields) for row in rows[:limit]], next_cursor
+
+
+def iter_song_rows(fields, conditions, after=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields lists of up to 'batch_size' projected song dicts for every matching song, in id order,
+    read from a server-side cursor.
+    """
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            _songs_select(fields, conditions, after))
+        for rows in result.partitions():
+            yield [_project(row, fields) for row in rows]
+
+
+def iter_export(fields, conditions, export_format, after=None):
+    """Generates the export body in chunks: one JSON object per line (ndjson) or CSV with a header row."""
+    if export_format == 'ndjson':
+        for batch in iter_song_rows(fields, conditions, after):
+            yield ''.join(json.dumps(song) + '\n' for song in batch)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for batch in iter_song_rows(fields, conditions, after):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,266 @@
+# backend/cache.py
+
+"""
+Caching of computed recommendations.
+
+Entries are keyed by user, the user's favorites-version and the request
+parameters. toggle_favorite bumps the favorites-version, so every cached entry
+of that user becomes unreachable at once (and ages out of the LRU) instead of
+having to be found and deleted.
+
+With the in-process backend that counter only exists in the worker that handled
+the toggle, so the key also carries a fingerprint of the user's favorites read
+from the database (backend/favorites.py:favorites_version, one indexed
+aggregate query per lookup). Other gunicorn workers therefore never serve a
+list computed before the change. The redis backend shares the counter and
+skips that query.
+
+After a change, the user's recently requested entries are recomputed by one
+background worker thread fed by a bounded, per-user de-duplicated queue.
+
+Two interchangeable storage backends:
+- MemoryBackend: in-process LRU with a per-entry TTL (default, and the local
+  stand-in for the shared backend in development/tests).
+- RedisBackend: shared between workers/hosts; needs the optional 'redis' package.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    Thread-safe in-process LRU cache with a TTL per entry.
+    Counters (incr) live outside the LRU so they are never evicted: losing a
+    favorites-version would make stale entries reachable again.
+    """
+
+    def __init__(self, max_entries=10000, default_ttl=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()   # key -> (expires_at or None, value)
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'size': len(self._entries), 'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class RedisBackend:
+    """
+    Shared cache backend on Redis. Values are stored as JSON with a TTL;
+    eviction is left to Redis' own maxmemory policy.
+    """
+
+    def __init__(self, url, default_ttl=None, prefix='musicrec:'):
+        import redis  # optional dependency, only needed when this backend is configured
+        self._redis = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self._redis.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def incr(self, key):
+        return int(self._redis.incr(self.prefix + key))
+
+    def get_counter(self, key):
+        return int(self._redis.get(self.prefix + key) or 0)
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + '*'):
+            self._redis.delete(key)
+
+    def stats(self):
+        info = self._redis.info('stats')
+        return {'evictions': info.get('evicted_keys', 0), 'expirations': info.get('expired_keys', 0)}
+
+
+def create_backend(kind, max_entries, ttl, redis_url=None):
+    """Builds the backend named in the config ('memory' or 'redis')."""
+    if kind == 'redis':
+        return RedisBackend(redis_url, default_ttl=ttl)
+    return MemoryBackend(max_entries=max_entries, default_ttl=ttl)
+
+
+class RecommendationCache:
+    """
+    Recommendation results per (user, favorites-version, params).
+    Also remembers which users/params were requested recently, so their
+    entries can be recomputed in the background after an invalidation.
+    """
+
+    def __init__(self, backend, max_active_users=1000, version_of=None):
+        self.backend = backend
+        self.max_active_users = max_active_users
+        # Optional version_of(user_id) -> str read from the database, part of every key
+        self.version_of = version_of
+        self._active = OrderedDict()    # user_id -> set of params requested recently
+        self._lock = threading.Lock()
+        # Users waiting to be warmed (oldest first) and the single thread warming them
+        self._pending = OrderedDict()
+        self._wakeup = threading.Condition(self._lock)
+        self._warmer = None
+        self._warm_app = None
+        self._warm_compute = None
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id, params):
+        version = str(self.backend.get_counter(f"recs:ver:{user_id}"))
+        if self.version_of is not None:
+            version += '.' + self.version_of(user_id)
+        return f"recs:{user_id}:{version}:" + ':'.join(str(p) for p in params)
+
+    def get_or_compute(self, user_id, params, compute):
+        """
+        Returns the cached result for (user_id, params), or calls compute() and caches it.
+        'params' is a tuple of everything else the result depends on (mode, count, catalog stamp).
+        """
+        self._mark_active(user_id, params)
+        key = self._key(user_id, params)
+        result = self.backend.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = compute()
+        if result:  # don't pin empty results (e.g. a transient DB error)
+            self.backend.set(key, result)
+        return result
+
+    def invalidate_user(self, user_id):
+        """Makes all cached entries of a user unreachable (call after their favorites change)."""
+        self.backend.incr(f"recs:ver:{user_id}")
+
+    def _mark_active(self, user_id, params):
+        with self._lock:
+            self._active.setdefault(user_id, set()).add(params)
+            self._active.move_to_end(user_id)
+            while len(self._active) > self.max_active_users:
+                self._active.popitem(last=False)
+
+    def active_users(self):
+        with self._lock:
+            return list(self._active)
+
+    def warm_async(self, app, compute, user_ids=None):
+        """
+        Queues the entries recently requested by the given users (default: all active users) for
+        recomputation by the background warmer. compute(user_id, params) must return the result.
+        A user already waiting is not queued twice; beyond max_active_users waiting users the oldest
+        are dropped (their entries are simply computed on the next request).
+        """
+        with self._wakeup:
+            for user_id in (user_ids or list(self._active)):
+                self._pending[user_id] = None
+                self._pending.move_to_end(user_id)
+            while len(self._pending) > self.max_active_users:
+                self._pending.popitem(last=False)
+            self._warm_app, self._warm_compute = app, compute
+            # Started on first use (and again in a forked worker, where the thread doesn't exist)
+            if self._warmer is None or not self._warmer.is_alive():
+                self._warmer = threading.Thread(target=self._warm_loop, name='recommendation-cache-warmer',
+                                                daemon=True)
+                self._warmer.start()
+            self._wakeup.notify()
+
+    def _warm_loop(self):
+        while True:
+            with self._wakeup:
+                while not self._pending:
+                    self._wakeup.wait()
+                user_id, _ = self._pending.popitem(last=False)
+                params_list = list(self._active.get(user_id, ()))
+                app, compute = self._warm_app, self._warm_compute
+            try:
+                with app.app_context():
+                    for params in params_list:
+                        key = self._key(user_id, params)
+                        if self.backend.get(key) is None:
+                            result = compute(user_id, params)
+                            if result:
+                                self.backend.set(key, result)
+            except Exception:
+                logger.exception("Warming the recommendation cache of user %s failed", user_id)
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        stats.update(self.backend.stats())
+        return stats
+
+
+def _favorites_version(user_id):
+    from backend.favorites import favorites_version
+    return favorites_version(user_id)
+
+
+# Process-wide recommendation cache
+_backend = create_backend(
+    Config.RECOMMENDATION_CACHE_BACKEND,
+    max_entries=Config.RECOMMENDATION_CACHE_SIZE,
+    ttl=Config.RECOMMENDATION_CACHE_TTL,
+    redis_url=Config.CACHE_REDIS_URL,
+)
+recommendation_cache = RecommendationCache(
+    _backend, version_of=_favorites_version if isinstance(_backend, MemoryBackend) else None)
@@ -0,0 +1,418 @@
+# backend/catalog.py
+
+"""
+Process-wide, in-memory song catalog.
+
+The song table changes rarely (seed_db.py / imports) but is read on every
+recommendation request. Instead of reloading it with pandas each time, the
+catalog keeps the song metadata in compact columnar NumPy arrays sorted by id,
+loads them once and then only pulls the rows that were added since the last
+load (tracked with a high-water mark on Song.id). In-place updates of existing
+rows (ingest --mode upsert) bump the CatalogVersion row, which makes every
+worker reload the table on its next refresh check.
+
+If an on-disk snapshot exists (backend/snapshot.py, CATALOG_SNAPSHOT_PATH),
+the first load memory-maps it instead of reading the table, then catches up
+with the database through the usual refresh check. Rows added after the
+export are kept in a small in-memory tail (SegmentedColumn), so the mapped
+files stay shared and read-only; re-exporting the snapshot folds them in.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select, func, update
+from sqlalchemy.exc import IntegrityError
+
+from backend.config import Config
+from backend.models import Song, CatalogVersion
+
+logger = logging.getLogger(__name__)
+
+# Numeric audio features stored on Song, in table column order
+FEATURE_COLUMNS = ('danceability', 'energy', 'tempo', 'loudness', 'valence')
+# All columns returned for a song (same order as the song table)
+SONG_COLUMNS = ('id', 'title', 'artist', 'genre') + FEATURE_COLUMNS
+
+
+class CatalogSnapshot:
+    """
+    Immutable columnar view of the song table.
+    Rows are sorted by song id, so id -> position lookups use binary search.
+    A refresh never mutates a snapshot, it builds a new one and swaps it in,
+    so readers can keep using the snapshot they got without locking.
+
+    'version' changes with every refresh that changed something. 'reload_version' only
+    changes when the catalog was loaded from scratch (not just appended to): structures
+    derived from the positions (search index, ANN index) extend themselves while it stays
+    the same and rebuild when it moves. 'db_version' is the database's CatalogVersion,
+    the same in every worker (shared caches key on it).
+    """
+    __slots__ = ('ids', 'titles', 'artists', 'genre_codes', 'genre_names',
+                 'features', 'version', 'reload_version', 'db_version', 'high_water_mark')
+
+    def __init__(self, ids, titles, artists, genre_codes, genre_names, features, version=0,
+                 reload_version=None, db_version=0):
+        # Each column is an array, or a SegmentedColumn after rows were appended to a mapped snapshot
+        self.ids = ids                      # int64, sorted ascending
+        self.titles = titles                # object array of str (or snapshot.StringColumn)
+        self.artists = artists              # object array of str (or snapshot.StringColumn)
+        self.genre_codes = genre_codes      # int16, -1 when the genre is missing
+        self.genre_names = genre_names      # tuple of str, indexed by genre code
+        self.features = features            # float (n, len(FEATURE_COLUMNS))
+        self.version = version
+        self.reload_version = version if reload_version is None else reload_version
+        self.db_version = db_version
+        self.high_water_mark = int(ids[-1]) if len(ids) else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=object),
+                   np.empty(0, dtype=np.int16), (), np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float64))
+
+    def positions_of(self, song_ids):
+        """
+        Returns the catalog positions of the given song ids.
+        Ids that are not in the catalog are silently dropped.
+        """
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        if not len(self.ids) or not len(song_ids):
+            return np.empty(0, dtype=np.intp)
+        positions = np.searchsorted(self.ids, song_ids)
+        positions[positions >= len(self.ids)] = 0
+        return positions[self.ids[positions] == song_ids]
+
+    def artist_positions(self, artist):
+        """Positions of the songs whose artist is exactly 'artist'."""
+        return _positions_equal(self.artists, artist)
+
+    def genre_code(self, genre):
+        """Returns the code of a genre name, or -1 if the catalog has no such genre."""
+        try:
+            return self.genre_names.index(genre)
+        except ValueError:
+            return -1
+
+    def genre_at(self, position):
+        code = self.genre_codes[position]
+        return self.genre_names[code] if code >= 0 else None
+
+    def to_records(self, positions):
+        """
+        Converts catalog positions to song dicts with the same keys/order as a row
+        of the song table (what pandas' to_dict('records') used to return).
+        """
+        records = []
+        for pos in positions:
+            features = self.features[pos]
+            if features.dtype == np.float32:
+                # Shortest repr round-trips the value that was stored in the database
+                values = [float(str(v)) for v in features]
+            else:
+                values = features.tolist()
+            record = {
+                'id': int(self.ids[pos]),
+                'title': self.titles[pos],
+                'artist': self.artists[pos],
+                'genre': self.genre_at(pos),
+            }
+            record.update(zip(FEATURE_COLUMNS, values))
+            records.append(record)
+        return records
+
+
+class SegmentedColumn:
+    """
+    A catalog column made of a read-only base (a memory-mapped snapshot array or
+    snapshot.StringColumn) followed by an in-memory tail of the rows appended since.
+    Positions span both segments, so appending never copies the mapped base into
+    private memory and its pages stay shared between workers.
+
+    Supports what the catalog columns are used for: len(), indexing with an int, slice,
+    integer array or boolean mask, searchsorted() (ids are sorted across both segments),
+    elementwise ufuncs/comparisons and np.asarray() (which copies both segments).
+    """
+    __slots__ = ('base', 'tail')
+
+    def __init__(self, base, tail):
+        self.base = base
+        self.tail = tail
+
+    def __len__(self):
+        return len(self.base) + len(self.tail)
+
+    @property
+    def dtype(self):
+        return self.tail.dtype
+
+    @property
+    def ndim(self):
+        return self.tail.ndim
+
+    @property
+    def shape(self):
+        return (len(self),) + self.tail.shape[1:]
+
+    def __getitem__(self, key):
+        n_base = len(self.base)
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            return self.base[key] if key < n_base else self.tail[key - n_base]
+        if isinstance(key, slice):
+            positions = np.arange(*key.indices(len(self)))
+        else:
+            key = np.asarray(key)
+            if key.dtype == bool:
+                positions = np.flatnonzero(key)
+            else:
+                positions = key.astype(np.intp)
+                positions = np.where(positions < 0, positions + len(self), positions)
+        in_base = positions < n_base
+        if in_base.all():
+            return self.base[positions]
+        out = np.empty((len(positions),) + self.tail.shape[1:], dtype=self.dtype)
+        out[in_base] = self.base[positions[in_base]]
+        out[~in_base] = self.tail[positions[~in_base] - n_base]
+        return out
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def searchsorted(self, values, side='left', sorter=None):
+        # Called by np.searchsorted(); only meaningful for the (sorted) ids column
+        n_base = len(self.base)
+        positions = np.asarray(self.base.searchsorted(values, side=side))
+        past_base = positions == n_base
+        if past_base.any():
+            positions = np.where(past_base, n_base + self.tail.searchsorted(values, side=side), positions)
+        return positions
+
+    def __array__(self, dtype=None, copy=None):
+        array = np.concatenate([np.asarray(self.base), self.tail])
+        return array if dtype is None else array.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == '__call__' and not kwargs and all(x is self or np.ndim(x) == 0 for x in inputs):
+            # Column against scalars (e.g. genre_codes == code): one pass per segment
+            return np.concatenate([ufunc(*[segment if x is self else x for x in inputs])
+                                   for segment in (self.base, self.tail)])
+        inputs = [np.asarray(x) if isinstance(x, SegmentedColumn) else x for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __eq__(self, other):
+        return np.equal(self, other)
+
+    def __ne__(self, other):
+        return np.not_equal(self, other)
+
+    def __lt__(self, other):
+        return np.less(self, other)
+
+    def __le__(self, other):
+        return np.less_equal(self, other)
+
+    def __gt__(self, other):
+        return np.greater(self, other)
+
+    def __ge__(self, other):
+        return np.greater_equal(self, other)
+
+    __hash__ = None
+
+
+def _positions_equal(column, value):
+    """Positions where a string column equals 'value' (a memory-mapped StringColumn is not decoded)."""
+    if isinstance(column, SegmentedColumn):
+        return np.concatenate([_positions_equal(column.base, value),
+                               len(column.base) + _positions_equal(column.tail, value)])
+    if isinstance(column, np.ndarray):
+        return np.flatnonzero(column == value)
+    return column.positions_of(value)
+
+
+def _append_rows(column, values):
+    """
+    Appends rows to a catalog column. In-memory arrays are concatenated; a memory-mapped
+    or string-buffer column becomes (or stays) the base of a SegmentedColumn.
+    """
+    if isinstance(column, SegmentedColumn):
+        return SegmentedColumn(column.base, np.concatenate([column.tail, values]))
+    if isinstance(column, np.ndarray) and not isinstance(column, np.memmap):
+        return np.concatenate([column, values])
+    return SegmentedColumn(column, values)
+
+
+def read_catalog_version(conn):
+    """Current CatalogVersion.version (0 before any in-place update)."""
+    return conn.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar() or 0
+
+
+def bump_catalog_version(conn):
+    """
+    Increments the catalog version, which makes every worker fully reload its catalog and the
+    structures derived from it. Call it in the transaction that rewrites existing songs
+    (SongCatalog.invalidate() does it in a transaction of its own).
+    """
+    bumped = conn.execute(update(CatalogVersion).where(CatalogVersion.id == 1)
+                          .values(version=CatalogVersion.version + 1)).rowcount
+    if not bumped:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(CatalogVersion).values(id=1, version=1))
+        except IntegrityError:
+            # Created concurrently by another import
+            conn.execute(update(CatalogVersion).where(CatalogVersion.id == 1)
+                         .values(version=CatalogVersion.version + 1))
+
+
+def _encode_genres(genres, genre_names):
+    """
+    Dictionary-encodes a sequence of genre names against an existing list of names.
+    Returns (codes, names); unseen genres are appended to the names.
+    """
+    names = list(genre_names)
+    lookup = {name: code for code, name in enumerate(names)}
+    codes = np.empty(len(genres), dtype=np.int16)
+    for i, genre in enumerate(genres):
+        if genre is None or (isinstance(genre, float) and np.isnan(genre)):
+            codes[i] = -1
+            continue
+        code = lookup.get(genre)
+        if code is None:
+            code = lookup[genre] = len(names)
+            names.append(genre)
+        codes[i] = code
+    return codes, tuple(names)
+
+
+class SongCatalog:
+    """
+    Holds the current CatalogSnapshot and keeps it in sync with the database.
+
+    - The first access loads the full table (or maps the on-disk snapshot, if any).
+    - Later accesses check (at most every CATALOG_REFRESH_SECONDS) the max id,
+      row count and catalog version. New rows above the high-water mark are appended
+      incrementally; any other change (deletions, reseed, in-place updates) triggers
+      a full reload.
+    - Code that rewrites songs outside backend/ingest.py calls invalidate() (or
+      bump_catalog_version() in its own transaction) so every worker reloads.
+    """
+
+    def __init__(self, refresh_interval=None, snapshot_path=None):
+        self.refresh_interval = Config.CATALOG_REFRESH_SECONDS if refresh_interval is None else refresh_interval
+        self.snapshot_path = Config.CATALOG_SNAPSHOT_PATH if snapshot_path is None else snapshot_path
+        self._snapshot = None
+        self._row_count = 0
+        self._db_version = 0    # CatalogVersion.version the snapshot was loaded at
+        self._version = 0   # bumped on every change, never reset (derived caches key on it)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self, engine):
+        """Returns an up-to-date CatalogSnapshot, loading or refreshing it if needed."""
+        snap = self._snapshot
+        if snap is not None and time.monotonic() - self._last_check < self.refresh_interval:
+            return snap
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._snapshot is not None and time.monotonic() - self._last_check < self.refresh_interval:
+                return self._snapshot
+            self._refresh(engine)
+            return self._snapshot
+
+    def invalidate(self, engine):
+        """
+        Forces a full reload in every worker: bumps the database's catalog version and makes
+        this process check it on its next access.
+        """
+        with engine.begin() as conn:
+            bump_catalog_version(conn)
+        self._last_check = 0.0
+
+    def _refresh(self, engine):
+        with engine.connect() as conn:
+            max_id, row_count = conn.execute(select(func.max(Song.id), func.count(Song.id))).one()
+            max_id = max_id or 0
+            db_version = read_catalog_version(conn)
+            snap = self._snapshot
+            if snap is None and self.snapshot_path:
+                snap = self._load_snapshot_file(max_id, row_count, db_version)
+
+            if snap is None or max_id < snap.high_water_mark or db_version != self._db_version:
+                self._version += 1
+                self._snapshot = self._load(conn, CatalogSnapshot.empty(), self._version, db_version=db_version)
+            elif max_id > snap.high_water_mark or row_count != self._row_count:
+                self._version += 1
+                new_snap = self._load(conn, snap, self._version, after_id=snap.high_water_mark, db_version=db_version)
+                if len(new_snap) != row_count:
+                    # Rows were deleted or rewritten below the high-water mark
+                    new_snap = self._load(conn, CatalogSnapshot.empty(), self._version, db_version=db_version)
+                self._snapshot = new_snap
+
+        self._row_count = len(self._snapshot)
+        self._db_version = db_version
+        self._last_check = time.monotonic()
+
+    def _load_snapshot_file(self, max_id, row_count, db_version):
+        """
+        Maps the on-disk snapshot as the starting point. The refresh logic then compares it
+        with the database (its stamp is its own max id / row count) and appends or reloads.
+        A snapshot exported before songs were updated in place (older catalog version) is not used.
+        """
+        from backend.snapshot import load_snapshot
+        try:
+            loaded = load_snapshot(self.snapshot_path, version=self._version + 1)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load the catalog snapshot at %s: %s", self.snapshot_path, e)
+            return None
+        if loaded is None:
+            return None
+        snap, stamp = loaded
+        if stamp.get('catalog_version', 0) != db_version:
+            logger.info("Catalog snapshot %s predates in-place song updates; loading from the database.",
+                        self.snapshot_path)
+            return None
+        if (stamp['max_id'], stamp['count']) != (max_id, row_count):
+            logger.info("Catalog snapshot %s is behind the database (%s vs max_id=%s, count=%s); catching up.",
+                        self.snapshot_path, stamp, max_id, row_count)
+        self._version += 1
+        self._snapshot = snap
+        self._row_count = len(snap)
+        self._db_version = db_version
+        return snap
+
+    @staticmethod
+    def _load(conn, base, version, after_id=None, db_version=0):
+        """
+        Reads songs (optionally only those with id > after_id) and appends them to base.
+        A memory-mapped base keeps its columns as is; the new rows go to a separate tail.
+        """
+        query = select(*[getattr(Song, col) for col in SONG_COLUMNS]).order_by(Song.id)
+        if after_id is not None:
+            query = query.where(Song.id > after_id)
+        df = pd.read_sql_query(query, conn)
+
+        genre_codes, genre_names = _encode_genres(df['genre'].tolist(), base.genre_names)
+        features = df[list(FEATURE_COLUMNS)].to_numpy(dtype=np.float64)
+        return CatalogSnapshot(
+            ids=_append_rows(base.ids, df['id'].to_numpy(dtype=np.int64)),
+            titles=_append_rows(base.titles, df['title'].to_numpy(dtype=object)),
+            artists=_append_rows(base.artists, df['artist'].to_numpy(dtype=object)),
+            genre_codes=_append_rows(base.genre_codes, genre_codes),
+            genre_names=genre_names,
+            features=_append_rows(base.features, features.astype(base.features.dtype)),
+            version=version,
+            reload_version=version if after_id is None else base.reload_version,
+            db_version=db_version,
+        )
+
+
+# Process-wide catalog instance shared by the recommender and routes
+song_catalog = SongCatalog()
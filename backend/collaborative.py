@@ -0,0 +1,414 @@
+# backend/collaborative.py
+
+"""
+Item-item collaborative filtering over the Favorite table.
+
+Favorites form a binary users x songs matrix R. Songs i and j co-occur once
+for every user who liked both, C = R^T R, and their similarity is the cosine
+
+    sim(i, j) = C[i, j] / sqrt(n_i * n_j)      (n_i = number of users who liked i)
+
+Only the top-K neighbours of every song are kept, so "users who liked X also
+liked" for a user with F favorites costs O(F * K). All matrices are CSR arrays
+(indptr, indices, values) built with NumPy; scipy is not a dependency.
+
+Toggling a favorite doesn't rebuild anything: the co-occurrence changes of the
+song with the user's other favorites go to a delta, and the neighbour lists of
+the touched songs are recomputed from base row + delta the next time they are
+used. Once the delta grows past a fraction of the base matrix, the matrices are
+rebuilt from the interactions held in memory (no database read).
+
+Each gunicorn worker holds its own model and only sees the changes it handled
+itself. get_model() therefore compares a fingerprint of the Favorite table
+(row count, sum of user ids, sum of song ids) with the one the model reflects,
+at most every 'refresh_interval' seconds. The changes a worker applies itself
+move its model's fingerprint the same way they moved the table's, so only
+changes made by other workers trigger a rebuild. The check and the rebuild run
+on a background thread; requests keep using the old model meanwhile.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select, func
+
+from backend.models import Favorite
+
+logger = logging.getLogger(__name__)
+
+# Neighbours kept per song
+DEFAULT_NEIGHBOURS = 50
+# Co-occurrence pairs generated per pass while building (bounds peak memory, ~16 bytes each)
+BUILD_PAIRS_PER_PASS = 20_000_000
+# Compact (rebuild) once the delta holds this many changes, or 10% of the base nnz if larger
+COMPACT_MIN_CHANGES = 100_000
+
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+_EMPTY_SCORES = np.empty(0, dtype=np.float32)
+
+
+def gather_rows(indptr, rows):
+    """Indices into a CSR data array of all entries of the given rows, row after row."""
+    starts, ends = indptr[rows], indptr[np.asarray(rows) + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return offsets + np.arange(total)
+
+
+def build_cooccurrence(user_index, item_index, n_items, pairs_per_pass=BUILD_PAIRS_PER_PASS):
+    """
+    Co-occurrence counts C = R^T R (diagonal excluded) as CSR arrays (indptr, indices, counts).
+    'user_index'/'item_index' are the (user, item) pairs of R, without duplicates.
+    Pairs are generated for groups of users at a time and reduced with np.unique.
+    """
+    order = np.lexsort((item_index, user_index))
+    users, items = user_index[order], item_index[order]
+    group_starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else np.empty(0, np.int64)
+    group_sizes = np.diff(np.r_[group_starts, len(users)])
+    pairs_per_user = group_sizes.astype(np.int64) ** 2
+
+    codes, counts = [], []
+    first = 0
+    while first < len(group_starts):
+        # As many users as fit in one pass (at least one)
+        last = first + max(1, int(np.searchsorted(np.cumsum(pairs_per_user[first:]), pairs_per_pass, side='right')))
+        begin = group_starts[first]
+        end = group_starts[last] if last < len(group_starts) else len(users)
+        sizes = np.repeat(group_sizes[first:last], group_sizes[first:last])   # group size of each interaction
+        starts = np.repeat(group_starts[first:last] - begin, group_sizes[first:last])
+        left = np.repeat(np.arange(end - begin), sizes)
+        right = np.repeat(starts, sizes) + (np.arange(len(left)) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+        keep = left != right
+        chunk_items = items[begin:end]
+        pair_codes = chunk_items[left[keep]].astype(np.int64) * n_items + chunk_items[right[keep]]
+        unique_codes, unique_counts = np.unique(pair_codes, return_counts=True)
+        codes.append(unique_codes)
+        counts.append(unique_counts)
+        first = last
+
+    if codes:
+        all_codes = np.concatenate(codes)
+        unique_codes, inverse = np.unique(all_codes, return_inverse=True)
+        values = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int32)
+    else:
+        unique_codes, values = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    rows, cols = np.divmod(unique_codes, n_items)   # sorted by row, then column
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_items), out=indptr[1:])
+    return indptr, cols.astype(np.int32), values
+
+
+def top_k_per_row(indptr, indices, values, k):
+    """Keeps the k largest values of every CSR row (largest first). Returns CSR arrays."""
+    n_rows = len(indptr) - 1
+    rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+    order = np.lexsort((-values, rows))
+    rank = np.arange(len(order)) - np.repeat(indptr[:-1], np.diff(indptr))
+    keep = order[rank < k]
+    new_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.minimum(np.diff(indptr), k), out=new_indptr[1:])
+    return new_indptr, indices[keep], values[keep]
+
+
+class CollaborativeModel:
+    """
+    Item-item cosine neighbours of the songs that have at least one favorite.
+    Base matrices are indexed by position in 'song_ids'; the incremental delta is keyed by song id.
+    Public methods are thread-safe.
+    """
+
+    def __init__(self, user_ids, song_ids, neighbours=DEFAULT_NEIGHBOURS):
+        self.k = neighbours
+        self._lock = threading.RLock()
+        # Fingerprint of the Favorite table this model reflects (see _favorites_stamp), set by get_model
+        self.stamp = None
+        self._build(np.asarray(user_ids, dtype=np.int64), np.asarray(song_ids, dtype=np.int64))
+
+    def _build(self, user_ids, song_ids):
+        pairs = np.unique(np.stack([user_ids, song_ids], axis=1), axis=0) if len(user_ids) else np.empty((0, 2), np.int64)
+        self.user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+        self.song_ids, item_index = np.unique(pairs[:, 1], return_inverse=True)
+        user_index, item_index = user_index.ravel(), item_index.ravel()
+        n_items = len(self.song_ids)
+
+        # Interactions by user (pairs are sorted by user id, then song id)
+        self.user_indptr = np.zeros(len(self.user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_index, minlength=len(self.user_ids)), out=self.user_indptr[1:])
+        self.user_items = item_index.astype(np.int32)
+
+        self.counts = np.bincount(item_index, minlength=n_items).astype(np.int32)
+        self.co_indptr, self.co_indices, self.co_counts = build_cooccurrence(user_index, item_index, n_items)
+        rows = np.repeat(np.arange(n_items), np.diff(self.co_indptr))
+        sims = (self.co_counts / np.sqrt(self.counts[rows].astype(np.float64) * self.counts[self.co_indices]))
+        self.nbr_indptr, self.nbr_indices, self.nbr_sims = top_k_per_row(
+            self.co_indptr, self.co_indices, sims.astype(np.float32), self.k)
+
+        # Incremental state since the last build
+        self._added = {}         # user id -> song ids favorited since the build
+        self._removed = {}       # user id -> song ids of the base matrix unfavorited since the build
+        self._count_delta = {}   # song id -> change of n_i
+        self._co_delta = {}      # song id -> {other song id: change of C[i, j]}
+        self._overrides = {}     # song id -> (neighbour song ids, sims) recomputed from base + delta
+        self._dirty = set()      # song ids whose neighbour lists are out of date
+        self._changes = 0
+
+    @classmethod
+    def from_database(cls, connection, neighbours=DEFAULT_NEIGHBOURS):
+        """Builds the model from every row of the Favorite table."""
+        rows = connection.execute(select(Favorite.user_id, Favorite.song_id)).all()
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1], neighbours=neighbours)
+
+    @property
+    def delta_size(self):
+        return self._changes
+
+    def _base_position(self, song_id):
+        pos = int(np.searchsorted(self.song_ids, song_id))
+        return pos if pos < len(self.song_ids) and self.song_ids[pos] == song_id else -1
+
+    def items_of(self, user_id):
+        """Current favorite song ids of a user (base interactions +/- delta)."""
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        items = set()
+        if pos < len(self.user_ids) and self.user_ids[pos] == user_id:
+            items.update(self.song_ids[self.user_items[self.user_indptr[pos]:self.user_indptr[pos + 1]]].tolist())
+        items -= self._removed.get(user_id, set())
+        items |= self._added.get(user_id, set())
+        return items
+
+    def _apply(self, user_id, song_id, sign):
+        others = self.items_of(user_id)
+        if (song_id in others) == (sign > 0):
+            return False   # already applied (e.g. also seen by the build query)
+        others.discard(song_id)
+        co_row = self._co_delta.setdefault(song_id, {})
+        for other in others:
+            co_row[other] = co_row.get(other, 0) + sign
+            other_row = self._co_delta.setdefault(other, {})
+            other_row[song_id] = other_row.get(song_id, 0) + sign
+        self._count_delta[song_id] = self._count_delta.get(song_id, 0) + sign
+        self._dirty.update(others)
+        self._dirty.add(song_id)
+
+        undo, record = (self._removed, self._added) if sign > 0 else (self._added, self._removed)
+        if song_id in undo.get(user_id, ()):
+            undo[user_id].discard(song_id)
+        else:
+            record.setdefault(user_id, set()).add(song_id)
+        self._changes += len(others) + 1
+        if self._changes > max(COMPACT_MIN_CHANGES, len(self.co_indices) // 10):
+            self.compact()
+        return True
+
+    def add(self, user_id, song_id):
+        """Records a new favorite. Returns False if it was already known."""
+        with self._lock:
+            return self._apply(int(user_id), int(song_id), +1)
+
+    def remove(self, user_id, song_id):
+        """Records a removed favorite. Returns False if it wasn't known."""
+        with self._lock:
+            return self._apply(int(user_id), int(song_id), -1)
+
+    def interactions(self):
+        """Current (user ids, song ids) arrays: the base interactions with the delta applied."""
+        with self._lock:
+            users = np.repeat(self.user_ids, np.diff(self.user_indptr))
+            songs = self.song_ids[self.user_items]
+            if self._removed:
+                removed = np.array([(u, s) for u, items in self._removed.items() for s in items], dtype=np.int64)
+                keep = ~np.isin(users * (1 << 32) + songs, removed[:, 0] * (1 << 32) + removed[:, 1])
+                users, songs = users[keep], songs[keep]
+            added = [(u, s) for u, items in self._added.items() for s in items]
+            if added:
+                added = np.array(added, dtype=np.int64)
+                users, songs = np.concatenate([users, added[:, 0]]), np.concatenate([songs, added[:, 1]])
+            return users, songs
+
+    def compact(self):
+        """Folds the delta into rebuilt base matrices."""
+        with self._lock:
+            self._build(*self.interactions())
+
+    def _counts_of(self, song_ids):
+        counts = np.zeros(len(song_ids), dtype=np.float64)
+        if len(self.song_ids):
+            positions = np.searchsorted(self.song_ids, song_ids)
+            positions[positions >= len(self.song_ids)] = 0
+            in_base = self.song_ids[positions] == song_ids
+            counts[in_base] = self.counts[positions[in_base]]
+        if self._count_delta:
+            counts += [self._count_delta.get(song_id, 0) for song_id in song_ids.tolist()]
+        return counts
+
+    def _recompute(self, song_id):
+        """Neighbour list of a dirty song from its base co-occurrence row plus the delta."""
+        row = {}
+        pos = self._base_position(song_id)
+        if pos >= 0:
+            start, end = self.co_indptr[pos], self.co_indptr[pos + 1]
+            row = dict(zip(self.song_ids[self.co_indices[start:end]].tolist(), self.co_counts[start:end].tolist()))
+        for other, change in self._co_delta.get(song_id, {}).items():
+            row[other] = row.get(other, 0) + change
+        others = np.array([other for other, count in row.items() if count > 0], dtype=np.int64)
+        if not len(others):
+            return _EMPTY_IDS, _EMPTY_SCORES
+        co = np.array([row[other] for other in others.tolist()], dtype=np.float64)
+        sims = co / np.sqrt(self._counts_of(np.array([song_id]))[0] * self._counts_of(others))
+        top = np.argsort(-sims, kind='stable')[:self.k]
+        return others[top], sims[top].astype(np.float32)
+
+    def neighbours(self, song_id):
+        """(neighbour song ids, cosine similarities) of one song, most similar first."""
+        with self._lock:
+            return self._neighbours(int(song_id))
+
+    def _neighbours(self, song_id):
+        if song_id in self._dirty:
+            self._overrides[song_id] = self._recompute(song_id)
+            self._dirty.discard(song_id)
+        if song_id in self._overrides:
+            return self._overrides[song_id]
+        pos = self._base_position(song_id)
+        if pos < 0:
+            return _EMPTY_IDS, _EMPTY_SCORES
+        start, end = self.nbr_indptr[pos], self.nbr_indptr[pos + 1]
+        return self.song_ids[self.nbr_indices[start:end]], self.nbr_sims[start:end]
+
+    def recommend(self, favorite_song_ids, limit, exclude_ids=None):
+        """
+        "Users who liked these also liked": sums the similarities of the neighbours of every
+        favorite and returns the 'limit' best (song ids, scores), best first.
+        The favorites themselves and 'exclude_ids' are never returned.
+        """
+        favorites = np.unique(np.asarray(favorite_song_ids, dtype=np.int64))
+        with self._lock:
+            patched = [song_id for song_id in favorites.tolist() if song_id in self._dirty or song_id in self._overrides]
+            base = favorites[~np.isin(favorites, patched)] if patched else favorites
+            positions = np.searchsorted(self.song_ids, base)
+            positions[positions >= len(self.song_ids)] = 0
+            positions = positions[self.song_ids[positions] == base] if len(self.song_ids) else positions[:0]
+            entries = gather_rows(self.nbr_indptr, positions)
+            ids = [self.song_ids[self.nbr_indices[entries]]]
+            sims = [self.nbr_sims[entries]]
+            for song_id in patched:
+                neighbour_ids, neighbour_sims = self._neighbours(song_id)
+                ids.append(neighbour_ids)
+                sims.append(neighbour_sims)
+        ids, sims = np.concatenate(ids), np.concatenate(sims)
+        if not len(ids):
+            return _EMPTY_IDS, _EMPTY_SCORES
+
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse.ravel(), weights=sims).astype(np.float32)
+        excluded = favorites if exclude_ids is None else np.concatenate([favorites, np.asarray(exclude_ids, np.int64)])
+        keep = ~np.isin(candidates, excluded)
+        candidates, scores = candidates[keep], scores[keep]
+        top = np.argsort(-scores, kind='stable')[:limit]
+        return candidates[top], scores[top]
+
+
+# Process-wide model, built from the Favorite table on first use
+_model = None
+_model_lock = threading.Lock()     # held while a model is checked/built
+_last_check = 0.0
+_refresh_thread = None
+# Favorite changes made while the model is being built, replayed once it is ready
+_pending = None
+_pending_lock = threading.Lock()
+
+def _favorites_stamp(connection):
+    """(row count, sum of user ids, sum of song ids) of the Favorite table."""
+    count, user_sum, song_sum = connection.execute(select(
+        func.count(Favorite.id), func.coalesce(func.sum(Favorite.user_id), 0),
+        func.coalesce(func.sum(Favorite.song_id), 0))).one()
+    return int(count), int(user_sum), int(song_sum)
+
+def _apply_change(model, user_id, song_id, added):
+    """Applies one favorite change to a model, moving its stamp like the change moved the table's."""
+    with model._lock:
+        applied = model.add(user_id, song_id) if added else model.remove(user_id, song_id)
+        if applied and model.stamp is not None:
+            sign = 1 if added else -1
+            count, user_sum, song_sum = model.stamp
+            model.stamp = (count + sign, user_sum + sign * int(user_id), song_sum + sign * int(song_id))
+
+def _rebuild(engine, neighbours):
+    """Builds a new model from the database and swaps it in (call with _model_lock held)."""
+    global _model, _last_check, _pending
+    with _pending_lock:
+        _pending = []
+    with engine.connect() as conn:
+        # Stamp first: a row added in between makes the next check rebuild again, never miss it
+        stamp = _favorites_stamp(conn)
+        model = CollaborativeModel.from_database(conn, neighbours=neighbours)
+    model.stamp = stamp
+    with _pending_lock:
+        # Changes already seen by the query are no-ops (add/remove are idempotent)
+        for user_id, song_id, added in _pending:
+            _apply_change(model, user_id, song_id, added)
+        _model, _pending = model, None
+    _last_check = time.monotonic()
+
+def _refresh(engine, neighbours):
+    """Rebuilds the model if other workers changed the Favorite table (runs with _model_lock held)."""
+    global _last_check, _pending
+    try:
+        with engine.connect() as conn:
+            stamp = _favorites_stamp(conn)
+        if stamp != _model.stamp:
+            _rebuild(engine, neighbours)
+    except Exception:
+        logger.exception("Refreshing the collaborative model failed")
+        with _pending_lock:
+            _pending = None
+    finally:
+        _last_check = time.monotonic()
+        _model_lock.release()
+
+def get_model(engine, neighbours=DEFAULT_NEIGHBOURS, refresh_interval=None):
+    """
+    Returns the collaborative model, building it on first use. With a 'refresh_interval',
+    a background thread rebuilds it when the Favorite table changed since the build
+    (checked at most that often); the current model is returned meanwhile.
+    """
+    global _refresh_thread
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _rebuild(engine, neighbours)
+        return _model
+    if refresh_interval is not None and time.monotonic() - _last_check >= refresh_interval:
+        # One check at a time; the lock is released by the thread when it is done
+        if _model_lock.acquire(blocking=False):
+            if time.monotonic() - _last_check >= refresh_interval:
+                _refresh_thread = threading.Thread(target=_refresh, args=(engine, neighbours),
+                                                   name='cf-refresh', daemon=True)
+                _refresh_thread.start()
+            else:
+                _model_lock.release()
+    return _model
+
+def favorites_toggled(user_id, changes):
+    """Applies a user's (song_id, added) changes, e.g. of a bulk edit, in order."""
+    with _pending_lock:
+        model = _model
+        if _pending is not None:
+            # A build is running: replay the changes on the new model too
+            _pending.extend((user_id, song_id, added) for song_id, added in changes)
+    if model is None:
+        return
+    for song_id, added in changes:
+        _apply_change(model, user_id, song_id, added)
+
+def reset_model():
+    """Forgets the model; the next get_model() call rebuilds it from the database."""
+    global _model
+    with _model_lock:
+        _model = None
@@ -17,4 +17,82 @@ class Config:
     # Disable modification tracking for SQLAlchemy, as it's often not needed and consumes resources.
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool of the one engine shared by the routes and the recommender (per worker process).
+    # Size it to the number of request threads per worker (gunicorn --threads) plus the scoring workers.
+    # pool_pre_ping checks connections before use (survives database restarts / idle timeouts).
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))     # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))   # seconds before a connection is replaced
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False')
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': DB_POOL_PRE_PING}
+    if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # SQLite gets its own pool class from SQLAlchemy, which doesn't take these sizes
+        SQLALCHEMY_ENGINE_OPTIONS.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                         pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+
+    # How often (in seconds) the in-memory song catalog checks the database for new rows.
+    # Between checks the cached catalog is used as-is; set to 0 to check on every request.
+    CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', 5))
+
+    # On-disk columnar catalog snapshot (python -m backend.snapshot export). When it exists, workers
+    # memory-map it at startup instead of reading the song table, then catch up with the database.
+    CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', 'instance/catalog_snapshot')
+
+    # Nearest-neighbour index used by the 'similar' recommendation mode.
+    # Empty: exact in-memory scan. 'exact', 'ivf' or 'lsh': use backend/ann_index.py, memory-mapping
+    # the index saved at RECOMMENDER_INDEX_PATH (python -m backend.ann_index build) if it exists.
+    RECOMMENDER_INDEX = os.environ.get('RECOMMENDER_INDEX', '')
+    RECOMMENDER_INDEX_PATH = os.environ.get('RECOMMENDER_INDEX_PATH') or 'instance/song_index'
+
+    # Collaborative filtering ('collaborative' and 'blended' modes): neighbours kept per song,
+    # and the weight of the collaborative score in the blended mode (the rest is audio-feature similarity)
+    CF_NEIGHBOURS = int(os.environ.get('CF_NEIGHBOURS', 50))
+    BLEND_CF_WEIGHT = float(os.environ.get('BLEND_CF_WEIGHT', 0.5))
+    # Each worker applies its own favorite changes to its model; changes made through other workers
+    # are picked up by a rebuild, at most every CF_REFRESH_SECONDS, once the Favorite table changed
+    CF_REFRESH_SECONDS = float(os.environ.get('CF_REFRESH_SECONDS', 300))
+
+    # Recommendation result cache: 'memory' (in-process LRU + TTL) or 'redis' (shared, needs the redis package).
+    # With 'memory' and several workers, each lookup also checks the user's favorites in the database,
+    # so a worker never serves a list from before a change handled by another worker.
+    RECOMMENDATION_CACHE_BACKEND = os.environ.get('RECOMMENDATION_CACHE_BACKEND', 'memory')
+    RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 10000))
+    RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 600))  # seconds
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+
+    # Search backend for /search: 'memory' (in-process trigram index over the catalog)
+    # or 'postgres' (pg_trgm indexes in the database; ignored for other databases)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory')
+
+    # Authentication fast path: validated tokens are cached (bounded LRU) for at most
+    # AUTH_CACHE_TTL seconds, and never past the token's own expiry
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 300))
+
+    # Sampling profiler: fraction of requests run under cProfile (0 disables it);
+    # profiles of sampled requests slower than PROFILE_SLOW_MS are logged
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+
+    # Bounded pool for CPU-heavy recommendation scoring (backend/scoring.py); 0 workers scores
+    # in the request thread. Requests beyond workers + queue get 503 instead of piling up.
+    SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', min(4, os.cpu_count() or 1)))
+    SCORING_QUEUE = int(os.environ.get('SCORING_QUEUE', 32))
+    SCORING_TIMEOUT = float(os.environ.get('SCORING_TIMEOUT', 30))  # seconds
+
+    # Most song ids accepted by one PUT/PATCH /favorites/bulk request
+    FAVORITES_BULK_MAX = int(os.environ.get('FAVORITES_BULK_MAX', 10000))
+
+    # Radio sessions (backend/radio.py): 'memory' (in-process LRU) or 'redis' (shared by all workers,
+    # uses CACHE_REDIS_URL); idle sessions expire after RADIO_SESSION_TTL seconds
+    RADIO_SESSION_BACKEND = os.environ.get('RADIO_SESSION_BACKEND', 'memory')
+    RADIO_MAX_SESSIONS = int(os.environ.get('RADIO_MAX_SESSIONS', 20000))
+    RADIO_SESSION_TTL = int(os.environ.get('RADIO_SESSION_TTL', 1800))
+
+    # Usernames (comma-separated) of service accounts allowed to request /recommendations/batch
+    # for any users; everyone else may only ask for their own recommendations
+    BATCH_RECOMMENDATION_USERS = frozenset(
+        name.strip() for name in os.environ.get('BATCH_RECOMMENDATION_USERS', '').split(',') if name.strip())
+
     # You can add other configurations here, like mail server settings, etc.
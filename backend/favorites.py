@@ -0,0 +1,141 @@
+# backend/favorites.py
+
+"""
+Data access for a user's favorite songs.
+
+Favorites are always loaded together with their songs in one joined query
+(instead of one Song lookup per favorite), and large lists can be streamed in
+pages using keyset pagination on Favorite.id.
+
+Bulk edits (apply_favorite_changes) are set-based: the song ids are validated
+with one IN query, new rows are inserted with INSERT ... ON CONFLICT DO NOTHING
+on the unique (user_id, song_id) index, and removals are a single DELETE. Both
+use RETURNING song_id, so only the rows a request really changed are reported
+(and passed on to the stats, caches and collaborative model).
+"""
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend import db
+from backend.models import Song, Favorite, UserStats, UserGenreCount
+from backend.serializers import SONG_COLUMNS, serialize_song
+
+def _favorite_songs_query(user_id):
+    return (db.session.query(Favorite.id.label('favorite_id'), *SONG_COLUMNS)
+            .join(Song, Song.id == Favorite.song_id)
+            .filter(Favorite.user_id == user_id)
+            .order_by(Favorite.id))
+
+def load_favorite_songs(user_id):
+    """
+    Returns all favorite songs of a user (serialized), in the order they were added.
+    """
+    return [serialize_song(row) for row in _favorite_songs_query(user_id)]
+
+def load_favorite_songs_page(user_id, limit, after=None):
+    """
+    Returns (songs, next_cursor) for one page of a user's favorites.
+    The cursor is the Favorite.id of the last row, so each page is an index range scan
+    instead of an OFFSET; next_cursor is None on the last page.
+    """
+    query = _favorite_songs_query(user_id)
+    if after is not None:
+        query = query.filter(Favorite.id > after)
+    rows = query.limit(limit + 1).all()
+    next_cursor = rows[limit - 1].favorite_id if len(rows) > limit else None
+    return [serialize_song(row) for row in rows[:limit]], next_cursor
+
+def favorite_song_ids(user_id):
+    """
+    Returns the set of song ids the user has favorited (no Song rows loaded).
+    """
+    return {song_id for (song_id,) in db.session.query(Favorite.song_id).filter(Favorite.user_id == user_id)}
+
+def favorites_version(user_id):
+    """
+    Fingerprint of a user's favorites (count, max Favorite.id, sum of song ids) that changes with
+    every add or remove. Lets per-process caches notice changes made by other workers.
+    """
+    count, max_id, id_sum = (db.session.query(func.count(Favorite.id), func.max(Favorite.id), func.sum(Favorite.song_id))
+                             .filter(Favorite.user_id == user_id)
+                             .one())
+    return f"{count}-{max_id or 0}-{id_sum or 0}"
+
+
+# --- Bulk edits ---
+
+# Rows per INSERT statement (keeps the bound parameters under the SQLite/PostgreSQL limits)
+BULK_INSERT_ROWS = 5000
+
+_DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def _insert_favorites(user_id, song_ids):
+    """
+    Inserts (user_id, song_id) rows, skipping pairs that already exist (e.g. added concurrently).
+    Returns the song ids that were actually inserted.
+    """
+    dialect = db.session.get_bind().dialect
+    dialect_insert = _DIALECT_INSERTS.get(dialect.name)
+    rows = [{'user_id': user_id, 'song_id': song_id} for song_id in song_ids]
+    inserted = []
+    for start in range(0, len(rows), BULK_INSERT_ROWS):
+        batch = rows[start:start + BULK_INSERT_ROWS]
+        if dialect_insert is not None and dialect.insert_returning:
+            statement = (dialect_insert(Favorite).values(batch)
+                         .on_conflict_do_nothing(index_elements=['user_id', 'song_id'])
+                         .returning(Favorite.song_id))
+            inserted.extend(db.session.scalars(statement))
+        else:
+            # Other databases (or SQLite < 3.35, without RETURNING): rely on the existing-favorites check
+            db.session.execute(insert(Favorite), batch)
+            inserted.extend(row['song_id'] for row in batch)
+    return inserted
+
+def _delete_favorites(user_id, condition, expected):
+    """Deletes the user's favorites matching 'condition'. Returns the song ids actually deleted."""
+    statement = delete(Favorite).where(Favorite.user_id == user_id, condition)
+    if db.session.get_bind().dialect.delete_returning:
+        return list(db.session.scalars(statement.returning(Favorite.song_id)))
+    db.session.execute(statement)
+    return list(expected)
+
+def apply_favorite_changes(user_id, add_ids=(), remove_ids=(), replace=False):
+    """
+    Adds and removes many favorites of a user in the current transaction (the caller commits).
+    Adding an existing favorite or removing a missing one is a no-op, so a request can be retried.
+    replace=True makes add_ids the user's complete set of favorites (every other one is removed).
+    Returns (added song ids, removed song ids, unknown song ids): only the rows this call actually
+    inserted or deleted are reported, not those a concurrent request changed first.
+    Unknown ids are not inserted.
+    """
+    add_ids = set(add_ids)
+    known = set(db.session.scalars(select(Song.id).where(Song.id.in_(add_ids)))) if add_ids else set()
+    current = favorite_song_ids(user_id)
+    to_add = known - current
+    to_remove = (current - known) if replace else (set(remove_ids) & current)
+
+    added = _insert_favorites(user_id, sorted(to_add)) if to_add else []
+    removed = []
+    if to_remove:
+        condition = (Favorite.song_id.not_in(known) if replace else Favorite.song_id.in_(to_remove))
+        removed = _delete_favorites(user_id, condition, to_remove)
+    return sorted(added), sorted(removed), sorted(add_ids - known)
+
+def ensure_favorite_indexes(engine):
+    """
+    Brings a Favorite table created before the unique (user_id, song_id) index up to date:
+    drops duplicate rows (keeping the earliest) and creates the indexes declared on the model.
+    Safe to run repeatedly.
+    """
+    table = Favorite.__table__
+    with engine.begin() as conn:
+        duplicates = conn.execute(delete(table).where(table.c.id.not_in(
+            select(func.min(table.c.id)).group_by(table.c.user_id, table.c.song_id)))).rowcount
+        if duplicates:
+            # Stats were counted with the duplicates; they are backfilled again on first read
+            conn.execute(delete(UserGenreCount.__table__))
+            conn.execute(delete(UserStats.__table__))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    return duplicates
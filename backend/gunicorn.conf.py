@@ -0,0 +1,36 @@
+# backend/gunicorn.conf.py
+
+# gunicorn settings for backend.wsgi:app (see backend/wsgi.py).
+#   gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Worker processes x request threads. Threads suit this app: most requests wait on the
+# database, and the CPU-heavy scoring runs on each worker's bounded scoring pool.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Don't import the app in the master: each worker creates its engine/pool and loads its
+# catalog after the fork (connections and threads must not be shared across processes)
+preload_app = False
+
+
+def on_starting(server):
+    # Schema migrations (backend.app.init_db) run once in the master, before any worker starts, so
+    # the workers don't race to create the same indexes; each worker's warm_up() finds nothing to do
+    from backend import db
+    from backend.app import create_app, init_db
+    app = create_app()
+    init_db(app)
+    with app.app_context():
+        db.engine.dispose()     # no connection opened here is inherited by the workers
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,247 @@
+# backend/ingest.py
+
+"""
+Bulk ingestion of Spotify-style CSV dumps into the song table.
+
+The CSV is streamed in chunks (never fully loaded), each chunk is cleaned and
+de-duplicated with vectorized pandas operations and written with one bulk
+statement: PostgreSQL COPY when available, a multi-row executemany INSERT
+otherwise. Each chunk is its own transaction and a checkpoint file records how
+far the import got, so an interrupted import can be resumed.
+
+Modes:
+- replace: drop and recreate all tables first (what seed_db.py always did).
+- upsert:  keep existing data (users, favorites); songs already present
+           (same title + artist) get their features updated, new ones are inserted.
+
+Usage:
+    python -m backend.ingest data.csv --mode upsert --chunksize 100000
+    python -m backend.ingest big_dump.csv --mode upsert --resume
+"""
+
+import csv
+import io
+import json
+import os
+import time
+
+import pandas as pd
+from sqlalchemy import bindparam, insert, select, update
+
+from backend import db
+from backend.models import Song, CatalogVersion
+from backend.catalog import bump_catalog_version, read_catalog_version
+
+# CSV column -> Song column
+COLUMN_MAPPING = {
+    'track_name': 'title',
+    'track_artist': 'artist',
+    'playlist_genre': 'genre',
+    'danceability': 'danceability',
+    'energy': 'energy',
+    'tempo': 'tempo',
+    'loudness': 'loudness',
+    'valence': 'valence'
+}
+NUMERIC_COLUMNS = ['danceability', 'energy', 'tempo', 'loudness', 'valence']
+SONG_COLUMNS = list(COLUMN_MAPPING.values())
+
+
+class IngestError(Exception):
+    """Raised when the CSV can't be ingested (missing file or columns)."""
+
+
+def song_keys(titles, artists):
+    """
+    Vectorized 64-bit hash of (title, artist), the de-duplication key.
+    Hashes keep the 'seen' set small even for millions of songs.
+    """
+    frame = pd.DataFrame({'title': titles, 'artist': artists})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def clean_chunk(df):
+    """
+    Renames, validates and cleans one CSV chunk (same rules as the original seed script):
+    drop rows without title/artist/genre, de-duplicate on (title, artist), coerce
+    the numeric features and drop rows where that failed.
+    """
+    df = df.rename(columns=COLUMN_MAPPING)[SONG_COLUMNS]
+    df = df.dropna(subset=['title', 'artist', 'genre']).drop_duplicates(subset=['title', 'artist'])
+    for col in ['title', 'artist', 'genre']:
+        df[col] = df[col].astype(str)
+    df['_key'] = song_keys(df['title'], df['artist'])
+    df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def iter_csv_chunks(csv_path, chunksize, skip_rows=0):
+    """
+    Streams the CSV in DataFrame chunks of 'chunksize' rows, optionally skipping the
+    first 'skip_rows' data rows (used when resuming). Yields (raw_row_count, cleaned_chunk).
+    """
+    header = pd.read_csv(csv_path, nrows=0, encoding='utf-8').columns
+    missing_cols = [col for col in COLUMN_MAPPING if col not in header]
+    if missing_cols:
+        raise IngestError(f"The CSV file is missing required columns: {missing_cols}.")
+    reader = pd.read_csv(csv_path, encoding='utf-8', on_bad_lines='skip', usecols=list(COLUMN_MAPPING),
+                         chunksize=chunksize, skiprows=range(1, skip_rows + 1) if skip_rows else None)
+    for chunk in reader:
+        yield len(chunk), clean_chunk(chunk)
+
+
+def _copy_rows(conn, df):
+    """Bulk-loads rows with PostgreSQL COPY (psycopg2) from an in-memory CSV buffer."""
+    buffer = io.StringIO()
+    df[SONG_COLUMNS].to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {Song.__tablename__} ({', '.join(SONG_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _insert_rows(conn, df, use_copy):
+    if df.empty:
+        return
+    if use_copy:
+        _copy_rows(conn, df)
+    else:
+        conn.execute(insert(Song.__table__), df[SONG_COLUMNS].to_dict('records'))
+
+
+def _update_rows(conn, df):
+    """Updates the features/genre of existing songs in one executemany statement."""
+    if df.empty:
+        return
+    table = Song.__table__
+    stmt = (update(table).where(table.c.id == bindparam('_id'))
+            .values({col: bindparam(col) for col in ['genre'] + NUMERIC_COLUMNS}))
+    conn.execute(stmt, df.rename(columns={'id': '_id'})[['_id', 'genre'] + NUMERIC_COLUMNS].to_dict('records'))
+
+
+def _existing_song_ids(conn):
+    """(title, artist) hash -> song id for every song already in the database."""
+    existing = pd.read_sql_query(select(Song.id, Song.title, Song.artist), conn)
+    return dict(zip(song_keys(existing['title'], existing['artist']), existing['id']))
+
+
+def _read_checkpoint(path, csv_path, mode):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != os.path.abspath(csv_path) or checkpoint.get('mode') != mode:
+        print(f"Checkpoint {path} belongs to another import; starting from the beginning.")
+        return None
+    return checkpoint
+
+
+def _write_checkpoint(path, state):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def ingest_csv(csv_path, mode='upsert', chunksize=50000, method='auto', checkpoint_path=None, resume=False):
+    """
+    Imports songs from a CSV file (must be called inside an app context).
+    method: 'copy' (PostgreSQL COPY), 'insert' (executemany) or 'auto' (COPY on PostgreSQL).
+    Returns a stats dict (rows read, inserted, updated, skipped, seconds, rows_per_sec).
+    """
+    if not os.path.exists(csv_path):
+        raise IngestError(f"CSV file '{csv_path}' not found.")
+    engine = db.engine
+    use_copy = method == 'copy' or (method == 'auto' and engine.dialect.name == 'postgresql')
+
+    checkpoint = _read_checkpoint(checkpoint_path, csv_path, mode) if resume else None
+    state = checkpoint or {'source': os.path.abspath(csv_path), 'mode': mode,
+                           'rows_read': 0, 'inserted': 0, 'updated': 0, 'skipped': 0}
+
+    if mode == 'replace' and checkpoint is None:
+        # Drop and recreate tables (ESSENTIAL for schema change); only on a fresh run
+        db.create_all()
+        with engine.connect() as conn:
+            catalog_version = read_catalog_version(conn)
+        db.drop_all()
+        db.create_all()
+        with engine.begin() as conn:
+            # Continue the old catalog version, so running workers see a change even if ids and count match
+            conn.execute(insert(CatalogVersion).values(id=1, version=catalog_version + 1))
+        print("Tables dropped and recreated with the new schema.")
+    else:
+        db.create_all()
+
+    # Keys of songs already stored: upsert targets, and de-duplication across chunks/resumes
+    with engine.connect() as conn:
+        existing_ids = _existing_song_ids(conn) if (mode == 'upsert' or checkpoint) else {}
+    seen = set(existing_ids)
+
+    started = time.perf_counter()
+    rows_this_run = 0
+    for raw_rows, df in iter_csv_chunks(csv_path, chunksize, skip_rows=state['rows_read']):
+        # Cross-chunk de-duplication (the first occurrence in the file wins)
+        first_seen = ~df['_key'].isin(seen) | df['_key'].isin(existing_ids)
+        seen.update(df['_key'].tolist())
+        df = df[first_seen].dropna(subset=NUMERIC_COLUMNS)  # Drop rows where numeric conversion failed
+
+        is_existing = df['_key'].isin(existing_ids)
+        to_update = df[is_existing].assign(id=df.loc[is_existing, '_key'].map(existing_ids))
+        to_insert = df[~is_existing]
+        with engine.begin() as conn:
+            _insert_rows(conn, to_insert, use_copy)
+            if mode == 'upsert' and not to_update.empty:
+                _update_rows(conn, to_update)
+                # Existing songs changed in place: running workers reload their catalog
+                bump_catalog_version(conn)
+        # Updated songs must not be updated twice if they appear again later in the file
+        for key in to_update['_key']:
+            existing_ids.pop(key, None)
+
+        state['rows_read'] += raw_rows
+        state['inserted'] += len(to_insert)
+        state['updated'] += len(to_update) if mode == 'upsert' else 0
+        state['skipped'] += raw_rows - len(df)
+        _write_checkpoint(checkpoint_path, state)
+
+        rows_this_run += raw_rows
+        elapsed = time.perf_counter() - started
+        print(f"Processed {state['rows_read']} rows (+{len(to_insert)} inserted, {len(to_update)} existing) "
+              f"- {rows_this_run / elapsed:,.0f} rows/sec")
+
+    elapsed = time.perf_counter() - started
+    state['seconds'] = elapsed
+    state['rows_per_sec'] = rows_this_run / elapsed if elapsed else 0.0
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # finished: the next run starts from the beginning
+    return state
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from backend.app import create_app
+
+    parser = argparse.ArgumentParser(description='Bulk-import songs from a Spotify CSV dump.')
+    parser.add_argument('csv_path', nargs='?', default='data.csv')
+    parser.add_argument('--mode', choices=('upsert', 'replace'), default='upsert')
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--method', choices=('auto', 'copy', 'insert'), default='auto')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: <csv_path>.checkpoint)')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoint of an interrupted run')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            stats = ingest_csv(args.csv_path, mode=args.mode, chunksize=args.chunksize, method=args.method,
+                               checkpoint_path=args.checkpoint or f"{args.csv_path}.checkpoint", resume=args.resume)
+        except IngestError as e:
+            print(f"ERROR: {e}")
+            raise SystemExit(1)
+    print(f"SUCCESS: {stats['inserted']} inserted, {stats['updated']} updated, {stats['skipped']} skipped "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec).")
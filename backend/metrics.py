@@ -0,0 +1,251 @@
+# backend/metrics.py
+
+"""
+Request-level instrumentation for the Flask app.
+
+- Latency histogram and request counter per endpoint/method/status.
+- Per-stage timers for code paths like the recommender (stage_timer()).
+- SQL query count and duration per request, collected with SQLAlchemy engine
+  events (attached to the Engine class, so every engine is covered).
+- Optional sampling profiler: a fraction of requests runs under cProfile and
+  the profile of those slower than a threshold is logged.
+
+Everything is exposed at GET /metrics in the Prometheus text format.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds), from sub-millisecond stages to slow requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            plain = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{plain} {series[-2]}")
+            lines.append(f"{self.name}_count{plain} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Registers a callable returning [(name, help, label names, {label values: value})] gauges read at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, help_text, label_names, values in collect():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+                for label_values, value in sorted(values.items()):
+                    lines.append(f"{name}{_format_labels(label_names, label_values)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram('http_request_duration_seconds', 'HTTP request latency.',
+                                     labels=('endpoint', 'method', 'status'))
+REQUESTS = registry.counter('http_requests_total', 'HTTP requests served.', labels=('endpoint', 'method', 'status'))
+STAGE_LATENCY = registry.histogram('stage_duration_seconds', 'Duration of instrumented code stages.',
+                                   labels=('component', 'stage'))
+DB_QUERY_LATENCY = registry.histogram('db_query_duration_seconds', 'SQL statement duration.', labels=('endpoint',))
+DB_QUERIES_PER_REQUEST = registry.histogram('db_queries_per_request', 'SQL statements executed per request.',
+                                            labels=('endpoint',), buckets=COUNT_BUCKETS)
+SLOW_PROFILES = registry.counter('profiled_slow_requests_total', 'Sampled requests slower than the threshold.',
+                                 labels=('endpoint',))
+
+
+def _cache_stats():
+    from backend.auth import token_cache
+    from backend.cache import recommendation_cache
+    from backend.radio import radio_sessions
+    values = {}
+    for cache_name, stats in (('recommendations', recommendation_cache.stats()), ('auth_tokens', token_cache.stats()),
+                              ('radio_sessions', radio_sessions.stats())):
+        for stat, value in stats.items():
+            values[(cache_name, stat)] = value
+    return [('cache_stats', 'Hit/miss/eviction counters and size of the in-process caches.', ('cache', 'stat'), values)]
+
+registry.add_collector(_cache_stats)
+
+
+def _scoring_stats():
+    from backend.scoring import scoring_pool
+    return [('scoring_rejected_total', 'Scorings refused because the scoring pool was full.', (),
+             {(): scoring_pool.rejected})]
+
+registry.add_collector(_scoring_stats)
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+@contextmanager
+def stage_timer(stage, component='recommender'):
+    """Times a block of code into stage_duration_seconds{component, stage}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, component, stage)
+
+
+# --- SQL instrumentation (all engines) ---
+
+_sql_listening = False
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_LATENCY.observe(elapsed, _current_endpoint())
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += elapsed
+
+def _listen_sql():
+    global _sql_listening
+    if not _sql_listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _sql_listening = True
+
+
+# --- Flask integration ---
+
+def init_app(app):
+    """Installs the request hooks, SQL listeners and the /metrics endpoint on the app."""
+    _listen_sql()
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    slow_seconds = app.config.get('PROFILE_SLOW_MS', 500) / 1000.0
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        if sample_rate and random.random() < sample_rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_LATENCY.observe(elapsed, endpoint, request.method, response.status_code)
+        REQUESTS.inc(endpoint, request.method, response.status_code)
+        DB_QUERIES_PER_REQUEST.observe(g.sql_queries, endpoint)
+        response.headers['Server-Timing'] = f"app;dur={elapsed * 1000:.1f}, db;dur={g.sql_seconds * 1000:.1f}"
+        return response
+
+    @app.teardown_request
+    def _collect_profile(exc):
+        # Teardown runs even when the view raised (after_request is skipped then),
+        # so a sampled request never leaves its profiler enabled on the thread
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        elapsed = time.perf_counter() - g.request_started
+        if elapsed >= slow_seconds:
+            SLOW_PROFILES.inc(request.endpoint or 'unknown')
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+            logger.warning("Slow request %s %s took %.1f ms (%d SQL queries%s):\n%s",
+                           request.method, request.path, elapsed * 1000, g.sql_queries,
+                           f", failed with {exc!r}" if exc is not None else '', out.getvalue())
+
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
@@ -21,10 +21,45 @@ class Song(db.Model):
     tempo = db.Column(db.Float)
     loudness = db.Column(db.Float)
     valence = db.Column(db.Float)
+
+    # Genre-filtered keyset pages of /songs (WHERE genre = ? AND id > ? ORDER BY id)
+    __table_args__ = (db.Index('ix_song_genre_id', 'genre', 'id'),)
     
+# Single-row counter bumped whenever existing songs are rewritten in place (backend/ingest.py),
+# so the in-memory catalogs of running workers notice changes that keep max(id) and count(id)
+class CatalogVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 # Favorite model remains the same
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False)
 
+    # One row per (user, song): the unique index also serves "song ids of a user" index-only,
+    # and (user_id, id) serves the user's favorites in insertion order (keyset pages)
+    __table_args__ = (
+        db.Index('uq_favorite_user_song', 'user_id', 'song_id', unique=True),
+        db.Index('ix_favorite_user_id_id', 'user_id', 'id'),
+    )
+
+
+# Materialized per-user aggregates (maintained by backend/stats.py on every favorite change)
+class UserGenreCount(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    genre = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # Favorite.id of the user's earliest favorite in this genre (tie-break of the top genres)
+    first_favorite_id = db.Column(db.Integer, nullable=False)
+
+class UserStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    favorite_count = db.Column(db.Integer, nullable=False, default=0)
+    # Sums of the audio features over the favorites that have all of them (feature_count songs)
+    feature_count = db.Column(db.Integer, nullable=False, default=0)
+    danceability_sum = db.Column(db.Float, nullable=False, default=0.0)
+    energy_sum = db.Column(db.Float, nullable=False, default=0.0)
+    tempo_sum = db.Column(db.Float, nullable=False, default=0.0)
+    loudness_sum = db.Column(db.Float, nullable=False, default=0.0)
+    valence_sum = db.Column(db.Float, nullable=False, default=0.0)
@@ -0,0 +1,292 @@
+# backend/radio.py
+
+"""
+Radio sessions: an endless queue of recommendations around a seed.
+
+A session starts from a song, an artist or the user's favorites. Its state
+is a taste vector in the normalized audio-feature space (backend/similarity.py)
+that like/skip feedback pulls towards or pushes away from the rated song.
+
+Songs are served in batches from a candidate pool: the POOL_SIZE unplayed
+songs nearest to the taste vector. The pool is computed once and then served
+lazily, a batch at a time, with the MMR re-ranking of backend/rerank.py (at
+most one song per artist per batch). It is recomputed only when it runs low
+or after feedback moved the taste.
+
+Played songs are remembered in a Bloom filter, a fixed PLAYED_BITS bitset
+of hashed song ids. So a session never grows, however long it plays:
+
+    taste vector                5 float32
+    candidate pool              POOL_SIZE int64 song ids
+    played filter               PLAYED_BITS / 8 bytes
+    recent history              RECENT_SIZE int64 song ids (ring)
+
+That is about 2.2 KB per session (3 KB as JSON). A rare false positive only
+skips a song. Once PLAYED_CAPACITY songs were played the filter is cleared and
+refilled with the recent history. Very long sessions may then replay songs
+heard long ago, but never recent ones.
+
+Sessions are stored as plain JSON-able dicts in a cache backend
+(backend/cache.py). The default is an in-process LRU with a TTL. 'redis'
+shares sessions between gunicorn workers.
+"""
+
+import base64
+import secrets
+import threading
+
+import numpy as np
+
+from backend.config import Config
+from backend.cache import create_backend
+from backend.recommender import get_catalog, get_user_favorite_ids
+from backend.similarity import get_feature_space, top_k_smallest
+from backend.rerank import rerank_positions
+from backend.scoring import scoring_pool
+
+# Candidate songs precomputed per session (refilled when fewer than a batch are left unplayed)
+POOL_SIZE = 100
+# Bloom filter of played song ids: size in bits (power of two), hash functions, and the number of
+# plays after which it is cleared (~2% false positives at capacity)
+PLAYED_BITS = 8192
+PLAYED_HASHES = 3
+PLAYED_CAPACITY = 1000
+# Last played song ids, kept across filter resets
+RECENT_SIZE = 50
+
+# How far one feedback moves the taste vector towards (like) or away from (skip) the song
+LIKE_RATE = 0.3
+SKIP_RATE = 0.15
+# Normalized features are z-scores: keep the drifting taste inside the catalog's range
+TASTE_LIMIT = 3.0
+# Diversity of each batch (see backend/rerank.py)
+BATCH_LAMBDA = 0.7
+BATCH_MAX_PER_ARTIST = 1
+
+FEEDBACK_ACTIONS = ('like', 'skip')
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+class RadioError(Exception):
+    """Invalid seed, session or feedback (the message is shown to the client with 'status')."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+def _decode(text, dtype):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+def _bloom_bits(song_ids):
+    """(len(song_ids), PLAYED_HASHES) bit positions of the song ids (double hashing of one 64-bit mix)."""
+    mixed = np.asarray(song_ids, dtype=np.uint64) * _GOLDEN
+    h1 = mixed >> np.uint64(32)
+    h2 = (mixed & np.uint64(0xFFFFFFFF)) | np.uint64(1)
+    steps = np.arange(PLAYED_HASHES, dtype=np.uint64)
+    return ((h1[:, None] + steps * h2[:, None]) & np.uint64(PLAYED_BITS - 1)).astype(np.intp)
+
+
+class RadioSession:
+    """State of one radio session; see the module docstring for the layout."""
+
+    def __init__(self, user_id, taste):
+        self.user_id = user_id
+        self.taste = np.asarray(taste, dtype=np.float32)
+        self.pool = np.empty(0, dtype=np.int64)
+        self.played = np.zeros(PLAYED_BITS // 8, dtype=np.uint8)
+        self.played_count = 0
+        self.recent = np.zeros(RECENT_SIZE, dtype=np.int64)
+        self.recent_count = 0
+        self.stale = True       # pool must be recomputed before serving
+
+    # --- Played songs ---
+
+    def was_played(self, song_ids):
+        """Boolean mask: True where the song id is (probably) already played in this session."""
+        if not len(song_ids):
+            return np.zeros(0, dtype=bool)
+        bits = _bloom_bits(song_ids)
+        return ((self.played[bits >> 3] >> (bits & 7).astype(np.uint8)) & 1).all(axis=1).astype(bool)
+
+    def _set_played_bits(self, song_ids):
+        bits = _bloom_bits(song_ids).ravel()
+        np.bitwise_or.at(self.played, bits >> 3, (1 << (bits & 7)).astype(np.uint8))
+
+    def mark_played(self, song_ids):
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        if self.played_count + len(song_ids) > PLAYED_CAPACITY:
+            # Filter saturated: start over from the recent history
+            self.played[:] = 0
+            self.played_count = min(self.recent_count, RECENT_SIZE)
+            self._set_played_bits(self.recent[:self.played_count])
+        self._set_played_bits(song_ids)
+        self.played_count += len(song_ids)
+        for song_id in song_ids.tolist():
+            self.recent[self.recent_count % RECENT_SIZE] = song_id
+            self.recent_count += 1
+
+    # --- Taste ---
+
+    def feedback(self, song_vector, action):
+        """Moves the taste vector towards (like) or away from (skip) a song's normalized features."""
+        rate = LIKE_RATE if action == 'like' else -SKIP_RATE
+        self.taste = np.clip(self.taste + rate * (song_vector - self.taste), -TASTE_LIMIT, TASTE_LIMIT)
+        self.stale = True
+
+    # --- Serialization (cache backends store JSON-able values) ---
+
+    def to_state(self):
+        return {
+            'user_id': self.user_id,
+            'taste': self.taste.tolist(),
+            'pool': _encode(self.pool),
+            'played': _encode(self.played),
+            'played_count': self.played_count,
+            'recent': _encode(self.recent),
+            'recent_count': self.recent_count,
+            'stale': self.stale,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        session = cls(state['user_id'], state['taste'])
+        session.pool = _decode(state['pool'], np.int64)
+        session.played = _decode(state['played'], np.uint8)
+        session.played_count = state['played_count']
+        session.recent = _decode(state['recent'], np.int64)
+        session.recent_count = state['recent_count']
+        session.stale = state['stale']
+        return session
+
+
+# --- Candidate generation and batches ---
+
+def _refill_pool(session, catalog, space):
+    """
+    Recomputes the session's pool: the POOL_SIZE unplayed songs nearest to the taste vector.
+    Played songs are filtered from a growing top-k, so only the best few hundred are hashed.
+    """
+    distances = space.distances(session.taste)
+    k = POOL_SIZE * 2
+    while True:
+        positions, _ = top_k_smallest(distances, k)
+        fresh = positions[~session.was_played(catalog.ids[positions])]
+        if len(fresh) >= POOL_SIZE or k >= len(catalog):
+            break
+        k *= 4
+    session.pool = catalog.ids[fresh[:POOL_SIZE]].astype(np.int64)
+    session.stale = False
+
+def _next_positions(session, catalog, limit):
+    """Picks the next 'limit' songs from the pool (refilled when needed) and marks them played."""
+    space = get_feature_space(catalog)
+    positions = catalog.positions_of(session.pool)
+    positions = positions[~session.was_played(catalog.ids[positions])]
+    if session.stale or len(positions) < limit:
+        _refill_pool(session, catalog, space)
+        positions = catalog.positions_of(session.pool)
+    positions = rerank_positions(catalog, space, positions, limit, lambda_=BATCH_LAMBDA,
+                                 max_per_artist=BATCH_MAX_PER_ARTIST)
+    session.mark_played(catalog.ids[positions])
+    return positions
+
+
+# --- Session store ---
+
+class RadioStore:
+    """Sessions by id in a cache backend; operations on one session are serialized in this process."""
+
+    def __init__(self, backend, lock_stripes=64):
+        self.backend = backend
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def lock(self, session_id):
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    def load(self, session_id, user_id):
+        state = self.backend.get(f"radio:{session_id}")
+        if state is None or state['user_id'] != user_id:
+            raise RadioError('Sesiune radio inexistenta sau expirata', status=404)
+        return RadioSession.from_state(state)
+
+    def save(self, session_id, session):
+        # Saving again restarts the TTL, so only idle sessions expire
+        self.backend.set(f"radio:{session_id}", session.to_state())
+
+    def stats(self):
+        return self.backend.stats()
+
+
+# Process-wide session store
+radio_sessions = RadioStore(create_backend(
+    Config.RADIO_SESSION_BACKEND,
+    max_entries=Config.RADIO_MAX_SESSIONS,
+    ttl=Config.RADIO_SESSION_TTL,
+    redis_url=Config.CACHE_REDIS_URL,
+))
+
+
+def _seed_taste(catalog, space, user_id, song_id=None, artist=None):
+    """Taste vector and played seed songs for a session seeded by a song, an artist or the user's favorites."""
+    if song_id is not None:
+        positions = catalog.positions_of([song_id])
+        if not len(positions):
+            raise RadioError('Piesa nu exista', status=404)
+    elif artist is not None:
+        positions = catalog.artist_positions(artist)
+        if not len(positions):
+            raise RadioError('Artist inexistent', status=404)
+    else:
+        positions = catalog.positions_of(sorted(get_user_favorite_ids(user_id)))
+        if not len(positions):
+            # No favorites yet: start from the middle of the catalog
+            return np.zeros(space.matrix.shape[1], dtype=np.float32), positions
+    return space.taste_vector(positions), positions
+
+def start_session(user_id, song_id=None, artist=None, limit=10):
+    """
+    Opens a session and returns (session_id, first batch of songs).
+    A seed song is played first; an artist's or the user's own songs are not replayed.
+    """
+    catalog = get_catalog()
+    space = get_feature_space(catalog)
+    taste, seed_positions = _seed_taste(catalog, space, user_id, song_id=song_id, artist=artist)
+    session = RadioSession(user_id, taste)
+    session.mark_played(catalog.ids[seed_positions])
+    if song_id is None:
+        positions = scoring_pool.run(_next_positions, session, catalog, limit)
+    else:
+        # The seed song opens the first batch, in place of one recommended song
+        positions = np.concatenate([seed_positions, scoring_pool.run(_next_positions, session, catalog, limit - 1)])
+    session_id = secrets.token_urlsafe(16)
+    radio_sessions.save(session_id, session)
+    return session_id, catalog.to_records(positions)
+
+def next_songs(session_id, user_id, limit=10):
+    """Returns the next batch of songs of a session."""
+    with radio_sessions.lock(session_id):
+        session = radio_sessions.load(session_id, user_id)
+        catalog = get_catalog()
+        positions = scoring_pool.run(_next_positions, session, catalog, limit)
+        radio_sessions.save(session_id, session)
+    return catalog.to_records(positions)
+
+def record_feedback(session_id, user_id, song_id, action):
+    """Applies a like/skip of a song to the session's taste; the next batch comes from a new pool."""
+    if action not in FEEDBACK_ACTIONS:
+        raise RadioError("action trebuie sa fie 'like' sau 'skip'")
+    with radio_sessions.lock(session_id):
+        session = radio_sessions.load(session_id, user_id)
+        catalog = get_catalog()
+        positions = catalog.positions_of([song_id])
+        if not len(positions):
+            raise RadioError('Piesa nu exista', status=404)
+        session.feedback(get_feature_space(catalog).matrix[positions[0]], action)
+        if not session.was_played(catalog.ids[positions])[0]:
+            session.mark_played(catalog.ids[positions])
+        radio_sessions.save(session_id, session)
@@ -1,99 +1,377 @@
 # backend/recommender.py
 
+import logging
+
+import numpy as np
 import pandas as pd
+from backend import db
 from backend.models import Song, Favorite # Make sure Song and Favorite are imported
 from backend.config import Config
-from sqlalchemy import create_engine
-import random 
+from backend.catalog import song_catalog
+from backend.similarity import get_feature_space
+from backend.ann_index import get_index
+from backend import collaborative
+from backend.cache import recommendation_cache
+from backend.metrics import stage_timer
+from backend.scoring import scoring_pool
+from backend.rerank import pool_size, rerank_positions
+from sqlalchemy import select
+
+# Database access goes through Flask-SQLAlchemy's engine (db.engine), so the routes and the
+# recommender share one connection pool configured from Config (an app context is required)
+
+logger = logging.getLogger(__name__)
+
+# Supported recommendation strategies (selected with ?mode= on /recommendations)
+# - genre:   random songs from the user's most frequent genre (default)
+# - similar: nearest neighbours of the user's audio-feature taste vector
+# - collaborative: songs liked by the users who liked the same songs (item-item CF)
+# - blended: collaborative and audio-feature scores combined (Config.BLEND_CF_WEIGHT)
+RECOMMENDATION_MODES = ('genre', 'similar', 'collaborative', 'blended')
+
+# Candidates taken from each source before blending
+BLEND_POOL_SIZE = 100
+
+_NO_POSITIONS = np.empty(0, dtype=np.intp)
+
+def _random_positions(excluded, num_recommendations):
+    """
+    Picks up to num_recommendations random catalog positions that are not marked in 'excluded'.
+    """
+    candidates = np.flatnonzero(~excluded)
+    num_to_sample = min(len(candidates), num_recommendations)
+    if num_to_sample <= 0:
+        return _NO_POSITIONS
+    return np.random.choice(candidates, size=num_to_sample, replace=False)
+
+def _mode_genre(catalog, positions):
+    """
+    Returns the most frequent genre code among the given catalog positions, or -1.
+    Ties are broken alphabetically, like pandas' Series.mode().iloc[0].
+    """
+    codes = catalog.genre_codes[positions]
+    codes = codes[codes >= 0]
+    if not len(codes):
+        return -1
+    counts = np.bincount(codes)
+    tied = np.flatnonzero(counts == counts.max())
+    return int(min(tied, key=lambda code: catalog.genre_names[code]))
+
+def get_user_favorite_ids(user_id):
+    """
+    Fetches only the song ids of the user's favorites (the catalog holds everything else).
+    """
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(Favorite.song_id).where(Favorite.user_id == user_id))
+        return [row[0] for row in rows]
+
+def get_catalog():
+    """
+    Returns the current song catalog snapshot, loading it on first use
+    (called at server startup so the first request doesn't pay for it).
+    """
+    return song_catalog.snapshot(db.engine)
+
+def _recommend_by_genre(catalog, favorite_positions, is_favorite, user_id, num_recommendations):
+    """
+    Genre strategy: random songs from the most frequent genre in the user's favorites.
+    """
+    # Identify Preferred Genres
+    # Find the most common genre in favorites
+    preferred_code = _mode_genre(catalog, favorite_positions)
+
+    if preferred_code < 0:
+         # If genres are missing, fall back to random
+        logger.info("No dominant genre found for user %s. Recommending random.", user_id)
+        return _random_positions(is_favorite, num_recommendations)
+
+    preferred_genre = catalog.genre_names[preferred_code]
+    logger.debug("User %s's preferred genre identified as: %s", user_id, preferred_genre)
+
+    # Find songs NOT in favorites that match the preferred genre
+    matches_genre = catalog.genre_codes == preferred_code
+    if not (matches_genre & ~is_favorite).any():
+        # If no songs found in the preferred genre, recommend random songs (excluding favorites)
+        logger.info("No new songs found in genre '%s'. Recommending random (excluding favorites).", preferred_genre)
+        return _random_positions(is_favorite, num_recommendations)
+
+    # Select N recommendations randomly from the filtered list
+    return _random_positions(~matches_genre | is_favorite, num_recommendations)
+
+def _recommend_similar(catalog, favorite_positions, is_favorite, user_id, num_recommendations):
+    """
+    Similarity strategy: the songs closest to the mean (normalized) audio features of the favorites.
+    Uses the configured nearest-neighbour index (Config.RECOMMENDER_INDEX) or an exact in-memory scan.
+    """
+    if Config.RECOMMENDER_INDEX:
+        index = get_index(catalog, Config.RECOMMENDER_INDEX, Config.RECOMMENDER_INDEX_PATH)
+        taste = index.transform(np.nanmean(catalog.features[favorite_positions], axis=0))
+        song_ids, _ = index.search(taste, num_recommendations, exclude_ids=catalog.ids[favorite_positions])
+        return catalog.positions_of(song_ids)
+
+    space = get_feature_space(catalog)
+    taste = space.taste_vector(favorite_positions)
+    positions, _ = space.top_k(taste, num_recommendations, excluded=is_favorite)
+    return positions
+
+def _recommend_collaborative(catalog, favorite_positions, is_favorite, user_id, num_recommendations):
+    """
+    Collaborative strategy: the songs with the highest summed cosine similarity to the favorites
+    in the item-item co-occurrence model. When the favorites have too few neighbours (songs few
+    other users liked), the list is topped up with the nearest songs in audio-feature space.
+    """
+    model = collaborative.get_model(db.engine, neighbours=Config.CF_NEIGHBOURS,
+                                    refresh_interval=Config.CF_REFRESH_SECONDS)
+    # Ask for a few extra: neighbours may have been deleted from the catalog since
+    song_ids, _ = model.recommend(catalog.ids[favorite_positions], num_recommendations * 2)
+    positions = catalog.positions_of(song_ids)[:num_recommendations]
+    if len(positions) < num_recommendations:
+        excluded = is_favorite.copy()
+        excluded[positions] = True
+        space = get_feature_space(catalog)
+        extra, _ = space.top_k(space.taste_vector(favorite_positions), num_recommendations - len(positions),
+                               excluded=excluded)
+        positions = np.concatenate([positions, extra])
+    return positions
+
+def _recommend_blended(catalog, favorite_positions, is_favorite, user_id, num_recommendations):
+    """
+    Blended strategy: pools the best collaborative and audio-feature candidates and ranks them by
+    w * collaborative + (1 - w) * content, both min-max scaled over the pool (w = Config.BLEND_CF_WEIGHT).
+    """
+    model = collaborative.get_model(db.engine, neighbours=Config.CF_NEIGHBOURS,
+                                    refresh_interval=Config.CF_REFRESH_SECONDS)
+    cf_ids, cf_scores = model.recommend(catalog.ids[favorite_positions], BLEND_POOL_SIZE)
+    cf_positions = np.searchsorted(catalog.ids, cf_ids)
+    in_catalog = (cf_positions < len(catalog)) & (catalog.ids[np.minimum(cf_positions, len(catalog) - 1)] == cf_ids)
+    cf_positions, cf_scores = cf_positions[in_catalog], cf_scores[in_catalog]
+
+    space = get_feature_space(catalog)
+    taste = space.taste_vector(favorite_positions)
+    content_positions, _ = space.top_k(taste, BLEND_POOL_SIZE, excluded=is_favorite)
 
-# Database connection using the correct URI from Config
-DB_URI = Config.SQLALCHEMY_DATABASE_URI
-engine = create_engine(DB_URI)
+    pool = np.unique(np.concatenate([cf_positions, content_positions]))
+    if not len(pool):
+        return _NO_POSITIONS
+    cf = np.zeros(len(pool))
+    cf[np.searchsorted(pool, cf_positions)] = cf_scores
+    distances = np.einsum('ij,ij->i', space.matrix[pool] - taste, space.matrix[pool] - taste)
+    content = -distances
 
-def get_recommendations_for_user(user_id, num_recommendations=5):
+    def scaled(values):
+        spread = values.max() - values.min()
+        return (values - values.min()) / spread if spread > 0 else np.zeros(len(values))
+
+    weight = Config.BLEND_CF_WEIGHT
+    scores = weight * scaled(cf) + (1 - weight) * scaled(content)
+    return pool[np.argsort(-scores, kind='stable')[:num_recommendations]]
+
+# mode -> strategy; the genre strategy is the fallback when a strategy finds nothing
+_STRATEGIES = {
+    'similar': _recommend_similar,
+    'collaborative': _recommend_collaborative,
+    'blended': _recommend_blended,
+}
+
+def get_recommendations_for_user(user_id, num_recommendations=5, mode='genre', rerank=None):
     """
-    Generates recommendations based on the most frequent genres in the user's favorites.
+    Generates recommendations for a user from their favorites.
+    'mode' is one of RECOMMENDATION_MODES; the genre strategy is used as fallback.
+    'rerank' (a rerank.RerankParams) enables the diversity re-ranking stage.
     Includes the 'genre' field in the output.
+    Song data comes from the process-wide catalog; only the favorites are queried per call.
     """
-    
+
     # 1. Load Data
     try:
-        all_songs_df = pd.read_sql_table(Song.__tablename__, engine)
-        
-        # Fetch only song_ids for the current user's favorites
-        favorites_query = f"SELECT song_id FROM {Favorite.__tablename__} WHERE user_id = {user_id}"
-        favorites_df = pd.read_sql_query(favorites_query, engine)
-        
+        with stage_timer('load'):
+            catalog = song_catalog.snapshot(db.engine)
+            favorite_song_ids = get_user_favorite_ids(user_id)
+
     except Exception as e:
-        print(f"Error loading data from database: {e}")
+        logger.error("Error loading data from database: %s", e)
         # Return random songs if DB read fails
         try:
-            sample_songs = pd.read_sql_query(f"SELECT * FROM {Song.__tablename__} ORDER BY RANDOM() LIMIT {num_recommendations}", engine)
+            sample_songs = pd.read_sql_query(f"SELECT * FROM {Song.__tablename__} ORDER BY RANDOM() LIMIT {int(num_recommendations)}", db.engine)
             return sample_songs.to_dict('records')
         except:
              return [] # Return empty list if even random fails
 
-    if favorites_df.empty:
-        # If no favorites, recommend highly popular (or random) songs WITH genre
-        print(f"User {user_id} has no favorites. Recommending random songs.")
-        random_songs = all_songs_df.sample(n=min(len(all_songs_df), num_recommendations))
-        # Ensure genre is included
-        return random_songs.to_dict('records') 
-
-    # Extract favorite song IDs
-    favorite_song_ids = favorites_df['song_id'].tolist()
-    
-    # Get details of favorite songs including genre
-    favorite_songs_details_df = all_songs_df[all_songs_df['id'].isin(favorite_song_ids)]
-
-    if favorite_songs_details_df.empty or 'genre' not in favorite_songs_details_df.columns:
-        print(f"Could not retrieve favorite song details or genre column missing. Recommending random.")
-        random_songs = all_songs_df[~all_songs_df['id'].isin(favorite_song_ids)].sample(n=min(len(all_songs_df)-len(favorite_song_ids), num_recommendations))
-        return random_songs.to_dict('records')
-
-    # 2. Identify Preferred Genres
-    # Find the most common genre(s) in favorites
-    top_genres = favorite_songs_details_df['genre'].mode()
-
-    if top_genres.empty:
-         # If genres are too diverse or missing, fall back to random
-        print(f"No dominant genre found for user {user_id}. Recommending random.")
-        random_songs = all_songs_df[~all_songs_df['id'].isin(favorite_song_ids)].sample(n=min(len(all_songs_df)-len(favorite_song_ids), num_recommendations))
-        return random_songs.to_dict('records')
-        
-    # Use the first top genre if multiple have the same frequency
-    preferred_genre = top_genres.iloc[0] 
-    print(f"User {user_id}'s preferred genre identified as: {preferred_genre}")
-
-    # 3. Generate Recommendations
-    
-    # Find songs NOT in favorites that match the preferred genre
-    recommendations_df = all_songs_df[
-        (all_songs_df['genre'] == preferred_genre) & 
-        (~all_songs_df['id'].isin(favorite_song_ids)) # Exclude already favorited songs
-    ]
+    return recommend_from_favorites(catalog, user_id, favorite_song_ids, num_recommendations, mode, rerank)
 
-    if recommendations_df.empty:
-        # If no songs found in the preferred genre, recommend random songs (excluding favorites)
-        print(f"No new songs found in genre '{preferred_genre}'. Recommending random (excluding favorites).")
-        other_songs = all_songs_df[~all_songs_df['id'].isin(favorite_song_ids)]
-        # Ensure we don't try to sample more than available
-        num_to_sample = min(len(other_songs), num_recommendations)
-        if num_to_sample > 0:
-             recommendations_df = other_songs.sample(n=num_to_sample)
-        else:
-             return [] # No other songs left to recommend
+def recommend_from_favorites(catalog, user_id, favorite_song_ids, num_recommendations=5, mode='genre', rerank=None,
+                             block=False):
+    """
+    Runs the recommendation strategies for one user whose favorite song ids are already known.
+    block=True waits for a free scoring worker instead of raising ScoringOverloaded.
+    """
+    positions = _recommend_positions(catalog, user_id, favorite_song_ids, num_recommendations, mode, rerank, block)
+    with stage_timer('serialize'):
+        result = catalog.to_records(positions)
+    logger.debug("Generated %d recommendations for user %s (mode: %s).", len(result), user_id, mode)
+    return result
 
+def _recommend_positions(catalog, user_id, favorite_song_ids, num_recommendations, mode, rerank=None, block=False):
+    with stage_timer('filter'):
+        if not favorite_song_ids:
+            # If no favorites, recommend highly popular (or random) songs WITH genre
+            logger.info("User %s has no favorites. Recommending random songs.", user_id)
+            return _random_positions(np.zeros(len(catalog), dtype=bool), num_recommendations)
 
-    # Select N recommendations randomly from the filtered list
-    final_num_recs = min(len(recommendations_df), num_recommendations)
-    final_recommendations_df = recommendations_df.sample(n=final_num_recs)
-    
-    # Convert to list of dictionaries, ensuring genre is present
-    result = final_recommendations_df.to_dict('records')
-    print(f"Generated {len(result)} recommendations for user {user_id}.")
-    
-    return result
+        # Catalog positions of the favorite songs, and a mask used to exclude them
+        favorite_positions = catalog.positions_of(favorite_song_ids)
+        is_favorite = np.zeros(len(catalog), dtype=bool)
+        is_favorite[favorite_positions] = True
+
+        if not len(favorite_positions):
+            logger.warning("Could not retrieve favorite song details for user %s. Recommending random.", user_id)
+            return _random_positions(is_favorite, num_recommendations)
+
+    # 2. Generate Recommendations with the requested strategy
+    # (a larger candidate pool when the re-ranking stage picks the final ones)
+    num_candidates = num_recommendations if rerank is None else pool_size(num_recommendations, len(catalog))
+    with stage_timer('score'):
+        positions = _NO_POSITIONS
+        strategy = _STRATEGIES.get(mode)
+        if strategy is not None:
+            # CPU-bound: runs on the bounded scoring pool (raises ScoringOverloaded when it's full)
+            positions = scoring_pool.run(strategy, catalog, favorite_positions, is_favorite, user_id, num_candidates,
+                                         block=block)
+        if not len(positions):
+            positions = _recommend_by_genre(catalog, favorite_positions, is_favorite, user_id, num_candidates)
+
+    # 3. Diversity re-ranking (MMR over the audio features + artist/genre quotas)
+    if rerank is not None:
+        with stage_timer('rerank'):
+            space = get_feature_space(catalog)
+            candidates = positions
+            positions = rerank_positions(catalog, space, candidates, num_recommendations, lambda_=rerank.lambda_,
+                                         max_per_artist=rerank.max_per_artist, max_per_genre=rerank.max_per_genre)
+            if len(positions) < num_recommendations and (rerank.max_per_artist or rerank.max_per_genre):
+                # The quotas starved the pool (e.g. the genre strategy only returns one genre): rank the
+                # nearest songs of any artist/genre after the strategy's candidates and pick again.
+                # The list is still short when the whole catalog can't meet the quotas.
+                excluded = is_favorite.copy()
+                excluded[candidates] = True
+                extra, _ = space.top_k(space.taste_vector(favorite_positions), num_candidates, excluded=excluded)
+                positions = rerank_positions(catalog, space, np.concatenate([candidates, extra]), num_recommendations,
+                                             lambda_=rerank.lambda_, max_per_artist=rerank.max_per_artist,
+                                             max_per_genre=rerank.max_per_genre)
+    return positions
+
+# --- Cached recommendations ---
+
+def _compute_for_cache(user_id, params):
+    mode, num_recommendations, rerank = params[0], params[1], params[2]
+    return get_recommendations_for_user(user_id, num_recommendations=num_recommendations, mode=mode, rerank=rerank)
+
+def get_cached_recommendations(user_id, num_recommendations=5, mode='genre', rerank=None):
+    """
+    Same as get_recommendations_for_user, but served from the recommendation cache while
+    the user's favorites and the catalog are unchanged.
+    """
+    catalog = song_catalog.snapshot(db.engine)
+    # db_version is the database's catalog version, the same in every worker: an in-place song
+    # update keeps the id range and count but bumps it
+    params = (mode, num_recommendations, rerank, catalog.high_water_mark, len(catalog), catalog.db_version)
+    return recommendation_cache.get_or_compute(user_id, params, lambda: _compute_for_cache(user_id, params))
+
+def favorites_changed(app, user_id, song_id=None, added=None, changes=None):
+    """
+    Drops the user's cached recommendations and recomputes the recently requested ones in the background.
+    When the toggled song is given (or 'changes', the (song_id, added) pairs of a bulk edit),
+    the collaborative model is updated incrementally too.
+    """
+    if song_id is not None:
+        changes = [(song_id, added)]
+    if changes:
+        collaborative.favorites_toggled(user_id, changes)
+    recommendation_cache.invalidate_user(user_id)
+    recommendation_cache.warm_async(app, _compute_for_cache, [user_id])
+
+# --- Batch recommendations (many users per call) ---
+
+# Upper bound on the (users x songs) distance matrix scored in one pass, in float32 cells (~128 MB)
+BATCH_SCORE_CELLS = 32_000_000
+
+def get_favorites_for_users(user_ids):
+    """
+    Fetches the favorite song ids of many users with a single query.
+    Returns {user_id: [song_id, ...]} (users without favorites are missing).
+    """
+    favorites = {}
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(Favorite.user_id, Favorite.song_id).where(Favorite.user_id.in_(list(user_ids))))
+        for user_id, song_id in rows:
+            favorites.setdefault(user_id, []).append(song_id)
+    return favorites
+
+def _batch_similar(catalog, user_rows, num_recommendations):
+    """
+    Similarity strategy for many users at once.
+    user_rows is a list of (user_id, favorite_positions); returns {user_id: positions}.
+    Taste vectors are stacked into a (users x features) matrix and scored against the
+    whole catalog with one matrix product per slice, then top-N is taken per row with argpartition.
+    """
+    space = get_feature_space(catalog)
+    n_songs = len(catalog)
+    results = {}
+    rows_per_pass = max(1, BATCH_SCORE_CELLS // max(1, n_songs))
+    for start in range(0, len(user_rows), rows_per_pass):
+        part = user_rows[start:start + rows_per_pass]
+        lengths = np.array([len(positions) for _, positions in part])
+        flat_positions = np.concatenate([positions for _, positions in part])
+        # Mean of each user's favorite vectors: segment sums via reduceat
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        tastes = np.add.reduceat(space.matrix[flat_positions], offsets, axis=0) / lengths[:, None]
+
+        dist = space.distances(tastes)
+        # Exclude each user's own favorites
+        dist[np.repeat(np.arange(len(part)), lengths), flat_positions] = np.inf
+
+        k = min(num_recommendations, n_songs)
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < n_songs else np.tile(np.arange(n_songs), (len(part), 1))
+        top_dist = np.take_along_axis(dist, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(top_dist, axis=1, kind='stable'), axis=1)
+        top_dist = np.sort(top_dist, axis=1)
+        for (user_id, _), positions, distances in zip(part, top, top_dist):
+            results[user_id] = positions[np.isfinite(distances)]
+    return results
+
+def iter_recommendations_for_users(user_ids, num_recommendations=5, mode='similar', chunk_size=1000):
+    """
+    Generates recommendations for many users, yielding {'user_id', 'recommendations'} dicts in
+    input order. Users are processed in chunks of 'chunk_size': one favorites query per chunk and,
+    for the 'similar' mode, one vectorized scoring pass, so memory stays bounded for any number of users.
+    """
+    catalog = song_catalog.snapshot(db.engine)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        with stage_timer('load'):
+            favorites = get_favorites_for_users(chunk)
+
+        batched = {}
+        if mode == 'similar' and len(catalog):
+            user_rows = []
+            for user_id in dict.fromkeys(chunk):
+                positions = catalog.positions_of(favorites.get(user_id, []))
+                if len(positions):
+                    user_rows.append((user_id, positions))
+            if user_rows:
+                with stage_timer('batch_score'):
+                    batched = scoring_pool.run(_batch_similar, catalog, user_rows, num_recommendations, block=True)
+
+        for user_id in chunk:
+            positions = batched.get(user_id)
+            if positions is not None and len(positions):
+                with stage_timer('serialize'):
+                    recommendations = catalog.to_records(positions)
+            else:
+                # The response is already streaming: wait for a scoring worker rather than fail mid-stream
+                recommendations = recommend_from_favorites(catalog, user_id, favorites.get(user_id, []),
+                                                           num_recommendations, mode, block=True)
+            yield {'user_id': user_id, 'recommendations': recommendations}
 
 # Optional: Test block (requires Flask app context)
 # if __name__ == '__main__':
@@ -105,4 +383,3 @@ def get_recommendations_for_user(user_id, num_recommendations=5):
 #         print(f"Recommendations for user {test_user_id}:")
 #         for rec in recs:
 #             print(f"- {rec.get('title')} by {rec.get('artist')} (Genre: {rec.get('genre')})")
-
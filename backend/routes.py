@@ -1,25 +1,41 @@
 # backend/routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from backend import db, bcrypt 
 from backend.models import User, Song, Favorite 
-from backend.recommender import get_recommendations_for_user 
+from backend.auth import AuthenticationError, authenticate_token
+from backend.favorites import load_favorite_songs, load_favorite_songs_page, favorite_song_ids, apply_favorite_changes
+from backend.stats import favorite_added, favorite_removed, rebuild_user_stats, user_genre_counts, user_summary, get_genre_stats
+from backend.serializers import SONG_COLUMNS, serialize_song
+from backend.search_index import search_catalog, search_postgres, encode_cursor, decode_cursor
+from backend.browse import BrowseError, EXPORT_FORMATS, parse_fields, parse_filters, load_songs_page, iter_export
+from backend.scoring import ScoringOverloaded
+from backend.rerank import RerankParams, DEFAULT_LAMBDA
+from backend.radio import RadioError, start_session, next_songs, record_feedback
+from backend.recommender import get_catalog, get_cached_recommendations, iter_recommendations_for_users, favorites_changed, RECOMMENDATION_MODES
+from sqlalchemy.exc import IntegrityError
 
 import jwt 
+import json
 import datetime
 from functools import wraps 
-from sqlalchemy import or_
-# NOU: Importăm Counter pentru a număra genurile
-from collections import Counter
 
 main_bp = Blueprint('main_bp', __name__)
 SECRET_KEY = "o_cheie_foarte_secreta_si_lunga" 
 
-# --- Decorator token_required (Rămâne neschimbat) ---
+# Pool-ul de scoring (backend/scoring.py) este plin: clientul poate reincerca putin mai tarziu
+@main_bp.errorhandler(ScoringOverloaded)
+def scoring_overloaded(e):
+    response = jsonify({'message': 'Serverul este ocupat, incercati din nou'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# --- Decorator token_required ---
+# Token-urile validate sunt tinute in cache (backend/auth.py), deci nu mai interogam
+# tabela User la fiecare cerere; rutele primesc un Principal (id, username).
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        # ... (logica existentă) ...
         token = None
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
@@ -27,13 +43,15 @@ def token_required(f):
         
         if not token: return jsonify({'message': 'Token lipsă!'}), 401
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-            if not current_user: raise Exception("User not found")
+            current_user = authenticate_token(token, SECRET_KEY)
         except Exception as e:
             print(f"Token validation error: {e}") 
             return jsonify({'message': 'Token invalid sau expirat!'}), 401
-        return f(current_user, *args, **kwargs)
+        try:
+            return f(current_user, *args, **kwargs)
+        except AuthenticationError:
+            # Token din cache al unui utilizator sters: randul User lipseste la primul acces
+            return jsonify({'message': 'Token invalid sau expirat!'}), 401
     return decorated
 
 # --- Auth routes (register/login - Rămân neschimbate) ---
@@ -59,38 +77,15 @@ def login():
     return jsonify({'message': 'Date invalide'}), 401
 
 
-# --- PROFILE Route (ACTUALIZATĂ) ---
+# --- PROFILE Route ---
 @main_bp.route('/profile', methods=['GET'])
 @token_required
 def profile(current_user):
-    # 1. Preluăm piesele favorite (similar cu get_favorites)
-    favorites = current_user.favorites
-    favorite_songs_list = []
-    genre_list = [] # Listă pentru a colecta genurile
-    
-    for fav in favorites:
-        song = Song.query.get(fav.song_id)
-        if song:
-            favorite_songs_list.append({
-                'id': song.id, 
-                'title': song.title, 
-                'artist': song.artist,
-                'genre': song.genre,
-                'danceability': song.danceability,
-                'energy': song.energy,
-                'tempo': song.tempo,
-                'loudness': song.loudness,
-                'valence': song.valence
-            })
-            if song.genre: # Adaugă genul la listă dacă există
-                genre_list.append(song.genre)
-
-    # 2. Calculăm cele mai frecvente genuri
-    top_genres = []
-    if genre_list:
-        genre_counts = Counter(genre_list)
-        # Obține top 3 genuri cele mai frecvente
-        top_genres = [{'genre': genre, 'count': count} for genre, count in genre_counts.most_common(3)]
+    # 1. Piesele favorite, incarcate cu un singur JOIN (nu cate o interogare per piesa)
+    favorite_songs_list = load_favorite_songs(current_user.id)
+
+    # 2. Cele mai frecvente 3 genuri, citite din agregatele precalculate (backend/stats.py)
+    top_genres = user_genre_counts(current_user.id, limit=3)
 
     # 3. Returnăm datele combinate
     return jsonify({
@@ -110,45 +105,248 @@ def toggle_favorite(current_user):
     if not song_id: return jsonify({'message': 'Lipseste song_id'}), 400
     song = Song.query.get(song_id)
     if not song: return jsonify({'message': 'Piesa nu exista'}), 404
+    current_user.ensure_exists()  # un token din cache al unui utilizator sters primeste 401, nu randuri noi
     favorite_entry = Favorite.query.filter_by(user_id=current_user.id, song_id=song_id).first()
+    # Agregatele utilizatorului (backend/stats.py) se actualizeaza in aceeasi tranzactie
     if favorite_entry:
+        favorite_removed(current_user.id, song, favorite_entry.id)
         db.session.delete(favorite_entry); db.session.commit()
+        favorites_changed(current_app._get_current_object(), current_user.id, song.id, added=False)
         return jsonify({'message': 'Eliminat din favorite', 'action': 'deleted'}), 200
     else:
         new_favorite = Favorite(user_id=current_user.id, song_id=song_id)
-        db.session.add(new_favorite); db.session.commit()
+        db.session.add(new_favorite)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Adaugata intre timp de o cerere concurenta (indexul unic user_id, song_id): rezultatul e acelasi
+            db.session.rollback()
+            return jsonify({'message': 'Adaugat la favorite', 'action': 'added'}), 200
+        favorite_added(current_user.id, song, new_favorite.id)
+        db.session.commit()
+        favorites_changed(current_app._get_current_object(), current_user.id, song.id, added=True)
         return jsonify({'message': 'Adaugat la favorite', 'action': 'added'}), 201
 
 @main_bp.route('/favorites', methods=['GET'])
 @token_required
 def get_favorites(current_user):
-    # ... (logica existentă, dar ruta /profile o face redundantă acum) ...
-    favorites = current_user.favorites
-    favorite_songs_list = []
-    for fav in favorites:
-        song = Song.query.get(fav.song_id)
-        if song:
-             favorite_songs_list.append({ 'id': song.id, 'title': song.title, 'artist': song.artist,'genre': song.genre, 'danceability': song.danceability, 'energy': song.energy, 'tempo': song.tempo, 'loudness': song.loudness, 'valence': song.valence })
-    return jsonify(favorite_songs_list), 200
-
-# --- SEARCH Route (Rămâne neschimbată) ---
+    # Fara parametri: toata lista (ca inainte). Cu ?limit=N[&after=cursor]: o pagina (paginare keyset).
+    if 'limit' not in request.args:
+        return jsonify(load_favorite_songs(current_user.id)), 200
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    if not limit or not 1 <= limit <= 1000: return jsonify({'message': 'limit trebuie sa fie intre 1 si 1000'}), 400
+    songs, next_cursor = load_favorite_songs_page(current_user.id, limit, after=after)
+    return jsonify({'items': songs, 'next_cursor': next_cursor}), 200
+
+# --- Bulk Favorites Route ---
+# PATCH {"add": [id, ...], "remove": [id, ...]}  adauga/elimina piese (idempotent: se poate repeta)
+# PUT   {"song_ids": [id, ...]}                  lista completa de favorite: celelalte sunt eliminate
+# Totul intr-o singura tranzactie; id-urile care nu exista sunt intoarse in 'unknown' si ignorate.
+@main_bp.route('/favorites/bulk', methods=['PUT', 'PATCH'])
+@token_required
+def bulk_favorites(current_user):
+    data = request.get_json(silent=True) or {}
+    if request.method == 'PUT':
+        add_ids, remove_ids = data.get('song_ids'), []
+    else:
+        add_ids, remove_ids = data.get('add', []), data.get('remove', [])
+    for ids in (add_ids, remove_ids):
+        if not isinstance(ids, list) or not all(isinstance(sid, int) and not isinstance(sid, bool) for sid in ids):
+            return jsonify({'message': 'Id-urile pieselor trebuie sa fie o lista de numere'}), 400
+    if len(add_ids) + len(remove_ids) > current_app.config['FAVORITES_BULK_MAX']:
+        return jsonify({'message': f"Maxim {current_app.config['FAVORITES_BULK_MAX']} piese per cerere"}), 400
+    if set(add_ids) & set(remove_ids): return jsonify({'message': 'O piesa nu poate fi si adaugata si eliminata'}), 400
+
+    current_user.ensure_exists()
+    added, removed, unknown = apply_favorite_changes(current_user.id, add_ids, remove_ids, replace=request.method == 'PUT')
+    if added or removed:
+        # Agregatele (backend/stats.py) se recalculeaza o singura data, in aceeasi tranzactie
+        rebuild_user_stats(current_user.id)
+    db.session.commit()
+    if added or removed:
+        changes = [(sid, True) for sid in added] + [(sid, False) for sid in removed]
+        favorites_changed(current_app._get_current_object(), current_user.id, changes=changes)
+    return jsonify({'added': added, 'removed': removed, 'unknown': unknown}), 200
+
+# --- SEARCH Route ---
+# ?q=text             potrivire pe subsir (ca ILIKE '%q%'), minim 3 caractere
+# ?mode=prefix        typeahead: fiecare cuvant din q este inceputul unui cuvant din titlu/artist
+# ?limit=N&cursor=... paginare; cursorul urmator este trimis in header-ul X-Next-Cursor
 @main_bp.route('/search', methods=['GET'])
 @token_required
 def search_songs(current_user):
-    # ... (logica existentă) ...
     query_string = request.args.get('q', '').strip()
-    if not query_string or len(query_string) < 3: return jsonify([]), 200
-    search = f"%{query_string}%"
-    songs = Song.query.filter(or_(Song.title.ilike(search), Song.artist.ilike(search), Song.genre.ilike(search))).limit(50).all() 
-    favorite_song_ids = {fav.song_id for fav in current_user.favorites} 
-    songs_list = [{'id': s.id, 'title': s.title, 'artist': s.artist, 'genre': s.genre, 'danceability': s.danceability, 'energy': s.energy, 'tempo': s.tempo, 'loudness': s.loudness, 'valence': s.valence, 'is_favorite': s.id in favorite_song_ids } for s in songs]
-    return jsonify(songs_list), 200
-
-# --- Recommendations Route (Rămâne neschimbată) ---
+    mode = request.args.get('mode', 'substring')
+    if mode not in ('substring', 'prefix'): return jsonify({'message': 'Mod de cautare invalid'}), 400
+    min_length = 1 if mode == 'prefix' else 3
+    if not query_string or len(query_string) < min_length: return jsonify([]), 200
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    offset = decode_cursor(request.args.get('cursor'))
+
+    favorite_ids = favorite_song_ids(current_user.id)
+    if current_app.config['SEARCH_BACKEND'] == 'postgres' and db.engine.dialect.name == 'postgresql':
+        rows, next_offset = search_postgres(db.session, SONG_COLUMNS, query_string, mode=mode, limit=limit, offset=offset)
+        songs_list = [serialize_song(s, is_favorite=s.id in favorite_ids) for s in rows]
+    else:
+        catalog = get_catalog()
+        positions, next_offset = search_catalog(catalog, query_string, mode=mode, limit=limit, offset=offset)
+        songs_list = catalog.to_records(positions)
+        for song in songs_list:
+            song['is_favorite'] = song['id'] in favorite_ids
+
+    response = jsonify(songs_list)
+    if next_offset is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_offset)
+    return response, 200
+
+# --- Songs (catalog browse) Route ---
+# ?limit=N&after=<id>          pagina (paginare keyset pe id); next_cursor = id-ul pentru pagina urmatoare
+# ?genre=pop[,rock]            filtrare dupa gen
+# ?energy_min=0.8&tempo_min=120&tempo_max=130   intervale (inclusive) pentru caracteristicile audio
+# ?fields=id,title,energy      doar campurile cerute
+# ?format=ndjson|csv           export complet, trimis in flux (fara limit)
+@main_bp.route('/songs', methods=['GET'])
+@token_required
+def browse_songs(current_user):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        conditions = parse_filters(request.args)
+    except BrowseError as e:
+        return jsonify({'message': str(e)}), 400
+    after = request.args.get('after', type=int)
+
+    export_format = request.args.get('format')
+    if export_format:
+        if export_format not in EXPORT_FORMATS: return jsonify({'message': 'Format de export invalid'}), 400
+        mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+        response = Response(stream_with_context(iter_export(fields, conditions, export_format, after=after)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=songs.{export_format}'
+        return response
+
+    limit = request.args.get('limit', 100, type=int)
+    if not limit or not 1 <= limit <= 1000: return jsonify({'message': 'limit trebuie sa fie intre 1 si 1000'}), 400
+    songs, next_cursor = load_songs_page(fields, conditions, limit, after=after)
+    return jsonify({'items': songs, 'next_cursor': next_cursor}), 200
+
+# --- Stats Routes ---
+# /stats: statistici pe gen pentru tot catalogul (numar de piese, medii, cuantile si histograme
+#         ale caracteristicilor audio); ?genre=pop pentru un singur gen
+# /stats/me: agregatele utilizatorului (numar de favorite, genuri, media caracteristicilor)
+@main_bp.route('/stats', methods=['GET'])
+@token_required
+def catalog_stats(current_user):
+    stats = get_genre_stats(get_catalog())
+    genre = request.args.get('genre')
+    if genre:
+        genres = [entry for entry in stats['genres'] if entry['genre'] == genre]
+        if not genres: return jsonify({'message': 'Gen inexistent'}), 404
+        stats = dict(stats, genres=genres)
+    return jsonify(stats), 200
+
+@main_bp.route('/stats/me', methods=['GET'])
+@token_required
+def my_stats(current_user):
+    return jsonify(user_summary(current_user.id)), 200
+
+# --- Recommendations Route ---
 @main_bp.route('/recommendations', methods=['GET'])
 @token_required
 def get_recommendations(current_user):
-    # ... (logica existentă) ...
-    recommendations = get_recommendations_for_user(current_user.id, num_recommendations=5)
+    # ?mode=genre (implicit), ?mode=similar (vecini pe baza caracteristicilor audio),
+    # ?mode=collaborative (ce au mai placut utilizatorii cu aceleasi favorite) sau ?mode=blended (ambele)
+    # ?limit=N (1-100, implicit 5)
+    # Re-ordonare pentru diversitate (MMR), activata de oricare dintre:
+    # ?lambda=0.7 (1 = doar relevanta, 0 = doar diversitate), ?max_per_artist=2, ?max_per_genre=3
+    # Cotele pot scurta lista doar daca tot catalogul nu le poate respecta (ex. max_per_genre=1 si mai putine genuri decat limit)
+    mode = request.args.get('mode', 'genre')
+    if mode not in RECOMMENDATION_MODES: return jsonify({'message': 'Mod de recomandare invalid'}), 400
+    limit = request.args.get('limit', 5, type=int)
+    if not limit or not 1 <= limit <= 100: return jsonify({'message': 'limit trebuie sa fie intre 1 si 100'}), 400
+
+    rerank = None
+    if any(name in request.args for name in ('lambda', 'max_per_artist', 'max_per_genre')):
+        lambda_ = request.args.get('lambda', DEFAULT_LAMBDA, type=float)
+        max_per_artist = request.args.get('max_per_artist', type=int)
+        max_per_genre = request.args.get('max_per_genre', type=int)
+        if lambda_ is None or not 0 <= lambda_ <= 1: return jsonify({'message': 'lambda trebuie sa fie intre 0 si 1'}), 400
+        if any(quota is not None and quota < 1 for quota in (max_per_artist, max_per_genre)):
+            return jsonify({'message': 'max_per_artist/max_per_genre trebuie sa fie cel putin 1'}), 400
+        rerank = RerankParams(lambda_, max_per_artist, max_per_genre)
+
+    recommendations = get_cached_recommendations(current_user.id, num_recommendations=limit, mode=mode, rerank=rerank)
     return jsonify(recommendations), 200
 
+
+# --- Radio Routes ---
+# POST /radio {"song_id": 12} | {"artist": "..."} | {} (favoritele utilizatorului), ?limit=N (1-50, implicit 10)
+#      -> {"session_id": ..., "songs": [...]} (primul lot)
+# GET  /radio/<session_id>/next?limit=N           urmatorul lot; piesele deja ascultate nu se repeta
+# POST /radio/<session_id>/feedback {"song_id": 12, "action": "like"|"skip"}   ajusteaza gustul sesiunii
+@main_bp.errorhandler(RadioError)
+def radio_error(e):
+    return jsonify({'message': str(e)}), e.status
+
+def _radio_limit():
+    limit = request.args.get('limit', 10, type=int)
+    if not limit or not 1 <= limit <= 50: raise RadioError('limit trebuie sa fie intre 1 si 50')
+    return limit
+
+@main_bp.route('/radio', methods=['POST'])
+@token_required
+def start_radio(current_user):
+    data = request.get_json(silent=True) or {}
+    song_id, artist = data.get('song_id'), data.get('artist')
+    if song_id is not None and (not isinstance(song_id, int) or isinstance(song_id, bool)):
+        return jsonify({'message': 'song_id trebuie sa fie un numar'}), 400
+    if artist is not None and not isinstance(artist, str):
+        return jsonify({'message': 'artist trebuie sa fie un text'}), 400
+    session_id, songs = start_session(current_user.id, song_id=song_id, artist=artist, limit=_radio_limit())
+    return jsonify({'session_id': session_id, 'songs': songs}), 201
+
+@main_bp.route('/radio/<session_id>/next', methods=['GET'])
+@token_required
+def radio_next(current_user, session_id):
+    return jsonify({'songs': next_songs(session_id, current_user.id, limit=_radio_limit())}), 200
+
+@main_bp.route('/radio/<session_id>/feedback', methods=['POST'])
+@token_required
+def radio_feedback(current_user, session_id):
+    data = request.get_json(silent=True) or {}
+    song_id = data.get('song_id')
+    if not isinstance(song_id, int) or isinstance(song_id, bool): return jsonify({'message': 'Lipseste song_id'}), 400
+    record_feedback(session_id, current_user.id, song_id, data.get('action'))
+    return jsonify({'message': 'Feedback inregistrat'}), 200
+
+
+# --- Batch Recommendations Route ---
+# Body: {"user_ids": [1, 2, ...], "num_recommendations": 5, "mode": "similar"}
+# Raspunsul este NDJSON: o linie {"user_id": ..., "recommendations": [...]} per utilizator,
+# trimisa pe masura ce este calculata (memoria ramane limitata si pentru 100k utilizatori).
+# Doar conturile de serviciu (Config.BATCH_RECOMMENDATION_USERS) pot cere alti utilizatori;
+# ceilalti pot cere doar propriul id. Daca scoring-ul esueaza in timpul fluxului, ultima linie
+# este {"error": ...} (antetul 200 a fost deja trimis).
+@main_bp.route('/recommendations/batch', methods=['POST'])
+@token_required
+def get_recommendations_batch(current_user):
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not all(isinstance(uid, int) and not isinstance(uid, bool) for uid in user_ids):
+        return jsonify({'message': 'user_ids trebuie sa fie o lista de id-uri'}), 400
+    if (any(uid != current_user.id for uid in user_ids)
+            and current_user.username not in current_app.config['BATCH_RECOMMENDATION_USERS']):
+        return jsonify({'message': 'Nu aveti acces la recomandarile altor utilizatori'}), 403
+    num_recommendations = data.get('num_recommendations', 5)
+    if (not isinstance(num_recommendations, int) or isinstance(num_recommendations, bool)
+            or not 1 <= num_recommendations <= 100):
+        return jsonify({'message': 'num_recommendations trebuie sa fie intre 1 si 100'}), 400
+    mode = data.get('mode', 'similar')
+    if mode not in RECOMMENDATION_MODES: return jsonify({'message': 'Mod de recomandare invalid'}), 400
+
+    def generate():
+        try:
+            for entry in iter_recommendations_for_users(user_ids, num_recommendations=num_recommendations, mode=mode):
+                yield json.dumps(entry) + '\n'
+        except ScoringOverloaded as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,86 @@
+# backend/scoring.py
+
+"""
+Bounded worker pool for CPU-heavy recommendation scoring.
+
+Request threads hand the scoring step (feature distances, collaborative
+scores, batch matrix products) to a fixed number of worker threads instead of
+running it themselves. At most SCORING_WORKERS scorings run at once, so a burst
+of /recommendations calls can't take every core away from the cheap, I/O-bound
+requests (/search, /favorites, ...) served by the same process. NumPy releases
+the GIL in the heavy parts, so the workers use real parallelism.
+
+When SCORING_WORKERS + SCORING_QUEUE scorings are already running or waiting,
+run() raises ScoringOverloaded (served as 503 + Retry-After) instead of
+queueing without bound.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app, has_app_context
+
+from backend.config import Config
+
+
+class ScoringOverloaded(Exception):
+    """Raised when the scoring pool has no free slot (or a scoring timed out)."""
+
+
+class ScoringPool:
+    def __init__(self, workers, max_queued, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._local = threading.local()
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Created on first use, so importing this module (or forking workers) starts no threads
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scoring')
+        return self._executor
+
+    def _call(self, app, fn, args):
+        self._local.inside = True
+        try:
+            if app is None:
+                return fn(*args)
+            with app.app_context():
+                return fn(*args)
+        finally:
+            self._local.inside = False
+            self._slots.release()
+
+    def run(self, fn, *args, block=False):
+        """
+        Runs fn(*args) on a scoring worker (inside the caller's app context) and returns its result.
+        block=False: raise ScoringOverloaded when the pool is full; block=True: wait for a slot.
+        Calls made from a scoring worker run inline.
+        """
+        if self.workers <= 0 or getattr(self._local, 'inside', False):
+            return fn(*args)
+        if not self._slots.acquire(blocking=block):
+            self.rejected += 1
+            raise ScoringOverloaded("Scoring pool is full")
+        app = current_app._get_current_object() if has_app_context() else None
+        try:
+            future = self._get_executor().submit(self._call, app, fn, args)
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ScoringOverloaded(f"Scoring took longer than {self.timeout}s")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+scoring_pool = ScoringPool(Config.SCORING_WORKERS, Config.SCORING_QUEUE, Config.SCORING_TIMEOUT)
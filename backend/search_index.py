@@ -0,0 +1,240 @@
+# backend/search_index.py
+
+"""
+Song search over title / artist / genre.
+
+The default backend is an in-process inverted index built from the song
+catalog:
+- substring mode: every 3-character gram (trigram) of the case-folded fields
+  points to the songs containing it. A query is answered by intersecting the
+  posting lists of its trigrams and verifying the candidates, which gives the
+  same matches as the old ILIKE '%q%' without scanning the table.
+- prefix mode (typeahead): every query word must be the prefix of a word in the
+  title or artist, looked up by binary search in a sorted word list.
+
+Results are ranked (title > artist > genre, exact and leading matches first)
+and paginated with an opaque cursor.
+
+With SEARCH_BACKEND = 'postgres' (and a PostgreSQL database) searches run in
+the database instead, using pg_trgm GIN indexes (see ensure_postgres_indexes).
+"""
+
+import base64
+import bisect
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, or_, text
+
+from backend.models import Song
+
+GRAM_SIZE = 3
+# Relevance weights of a match in each field
+FIELD_WEIGHTS = (('titles', 3.0), ('artists', 2.0), ('genres', 1.0))
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def _grams(value):
+    return {value[i:i + GRAM_SIZE] for i in range(len(value) - GRAM_SIZE + 1)}
+
+
+def _words(value):
+    return WORD_RE.findall(value)
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the offset stored in a cursor (0 for a missing or malformed cursor)."""
+    if not cursor:
+        return 0
+    try:
+        return max(0, int(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except (ValueError, UnicodeDecodeError):
+        return 0
+
+
+class SongSearchIndex:
+    """
+    Trigram + word-prefix inverted index over one catalog snapshot.
+    Positions are catalog positions, so the index can be extended in place when
+    the catalog only gained rows (append-only refresh) and must be rebuilt otherwise.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.last_id = None
+        self.version = None
+        self.reload_version = None
+        self._grams = {}        # trigram -> sorted int32 array of positions
+        # (sorted unique title/artist words, parallel list of int32 position arrays), published as
+        # one tuple so a query never pairs the words of one sync with the postings of another
+        self._word_index = ([], [])
+        self._lock = threading.Lock()
+
+    def sync(self, catalog):
+        """Indexes the catalog rows that are new since the last sync (or everything after a reload)."""
+        if self.version == catalog.version:
+            return
+        with self._lock:
+            if self.version == catalog.version:
+                return
+            # Extend only a catalog that was appended to since; a full reload (e.g. songs updated
+            # in place, same ids) may have changed any indexed title/artist/genre
+            appended = (self.size and catalog.reload_version == self.reload_version and len(catalog) >= self.size
+                        and int(catalog.ids[self.size - 1]) == self.last_id)
+            if not appended:
+                self._grams, self._word_index, self.size = {}, ([], []), 0
+            self._add_rows(catalog, self.size, len(catalog))
+            self.size = len(catalog)
+            self.last_id = int(catalog.ids[-1]) if len(catalog) else None
+            self.version = catalog.version
+            self.reload_version = catalog.reload_version
+
+    def _add_rows(self, catalog, start, end):
+        new_grams, new_words = {}, {}
+        for pos in range(start, end):
+            title = (catalog.titles[pos] or '').casefold()
+            artist = (catalog.artists[pos] or '').casefold()
+            genre = (catalog.genre_at(pos) or '').casefold()
+            for gram in _grams(title) | _grams(artist) | _grams(genre):
+                new_grams.setdefault(gram, []).append(pos)
+            for word in set(_words(title)) | set(_words(artist)):
+                new_words.setdefault(word, []).append(pos)
+
+        # New arrays are built and swapped in, so concurrent readers never see a half-updated list
+        grams = dict(self._grams)
+        for gram, positions in new_grams.items():
+            grams[gram] = np.concatenate([grams.get(gram, _EMPTY), np.array(positions, dtype=np.int32)])
+        words = dict(zip(*self._word_index))
+        for word, positions in new_words.items():
+            words[word] = np.concatenate([words.get(word, _EMPTY), np.array(positions, dtype=np.int32)])
+        sorted_words = sorted(words)
+        self._grams = grams
+        self._word_index = (sorted_words, [words[w] for w in sorted_words])
+
+    # --- Queries ---
+
+    def substring_candidates(self, query):
+        """Positions whose title/artist/genre may contain 'query' (casefolded)."""
+        if len(query) < GRAM_SIZE:
+            # Too short to have a trigram: every song is a candidate
+            return np.arange(self.size, dtype=np.int32)
+        postings = [self._grams.get(gram) for gram in _grams(query)]
+        if not postings or any(p is None for p in postings):
+            return _EMPTY
+        postings.sort(key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def prefix_candidates(self, query):
+        """Positions where every word of 'query' is a prefix of some title/artist word."""
+        result = None
+        words, postings = self._word_index
+        for token in set(_words(query)):
+            lo = bisect.bisect_left(words, token)
+            hi = bisect.bisect_left(words, token + '\U0010ffff')
+            matched = np.unique(np.concatenate(postings[lo:hi])) if hi > lo else _EMPTY
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else _EMPTY
+
+
+def _field_values(catalog, positions):
+    """Case-folded (title, artist, genre) columns of the candidate positions as pandas Series."""
+    genre_names = np.array([name.casefold() for name in catalog.genre_names] + [''], dtype=object)
+    return (
+        pd.Series(catalog.titles[positions], dtype=object).fillna('').str.casefold(),
+        pd.Series(catalog.artists[positions], dtype=object).fillna('').str.casefold(),
+        pd.Series(genre_names[catalog.genre_codes[positions]], dtype=object),  # code -1 -> ''
+    )
+
+
+def _score(catalog, positions, query, mode):
+    """
+    Ranks candidate positions and drops those that don't really match.
+    Returns (positions, scores) sorted by score desc, then song id.
+    """
+    if not len(positions):
+        return positions, np.empty(0)
+    scores = np.zeros(len(positions))
+    tokens = _words(query)
+    for (_, weight), values in zip(FIELD_WEIGHTS, _field_values(catalog, positions)):
+        starts = values.str.startswith(query).to_numpy(dtype=bool)
+        if mode == 'prefix':
+            # Fraction of the query words that start a word of this field
+            hits = sum(values.str.contains(r'(?:^|\W)' + re.escape(t), regex=True).to_numpy(dtype=float) for t in tokens)
+            scores += weight * hits / max(1, len(tokens)) + weight * starts
+        else:
+            contains = values.str.contains(query, regex=False).to_numpy(dtype=bool)
+            equal = (values == query).to_numpy(dtype=bool)
+            scores += weight * (contains.astype(float) + starts + equal)
+    # Substring mode: same matches as ILIKE '%q%' on any field (the trigram lookup only pre-filters)
+    keep = scores > 0
+    positions, scores = positions[keep], scores[keep]
+    order = np.lexsort((catalog.ids[positions], -scores))
+    return positions[order], scores[order]
+
+
+_index = SongSearchIndex()
+
+def search_catalog(catalog, query, mode='substring', limit=50, offset=0):
+    """
+    Searches the in-memory index (kept in sync with the catalog snapshot).
+    Returns (positions, next_offset); next_offset is None on the last page.
+    """
+    _index.sync(catalog)
+    query = query.casefold().strip()
+    if mode == 'prefix':
+        candidates = _index.prefix_candidates(query)
+    else:
+        candidates = _index.substring_candidates(query)
+    positions, _ = _score(catalog, candidates, query, mode)
+    page = positions[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(positions) else None
+    return page, next_offset
+
+
+# --- PostgreSQL backend (pg_trgm) ---
+
+def ensure_postgres_indexes(engine):
+    """
+    Creates the pg_trgm extension and trigram GIN indexes used by search_postgres().
+    Safe to run repeatedly.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in ('title', 'artist', 'genre'):
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_song_{column}_trgm "
+                              f"ON {Song.__tablename__} USING gin ({column} gin_trgm_ops)"))
+
+
+def search_postgres(session, columns, query, mode='substring', limit=50, offset=0):
+    """
+    Same contract as search_catalog, but executed in PostgreSQL. ILIKE with a leading
+    wildcard is served by the trigram GIN indexes; results are ranked by trigram similarity.
+    Returns (rows, next_offset).
+    """
+    if mode == 'prefix':
+        filters = [or_(*[col.op('~*')(r'\m' + re.escape(token)) for col in (Song.title, Song.artist)])
+                   for token in _words(query.casefold())]
+    else:
+        pattern = f"%{query}%"
+        filters = [or_(Song.title.ilike(pattern), Song.artist.ilike(pattern), Song.genre.ilike(pattern))]
+    rank = (3 * func.similarity(Song.title, query) + 2 * func.similarity(Song.artist, query)
+            + func.similarity(func.coalesce(Song.genre, ''), query))
+    rows = (session.query(*columns).filter(*filters)
+            .order_by(rank.desc(), Song.id).offset(offset).limit(limit + 1).all())
+    next_offset = offset + limit if len(rows) > limit else None
+    return rows[:limit], next_offset
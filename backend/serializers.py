@@ -0,0 +1,23 @@
+# backend/serializers.py
+
+from backend.models import Song
+
+# Song fields returned by the API, in response order
+SONG_FIELDS = ('id', 'title', 'artist', 'genre', 'danceability', 'energy', 'tempo', 'loudness', 'valence')
+
+# Column objects for selecting exactly the serialized fields (no ORM object construction)
+SONG_COLUMNS = tuple(getattr(Song, field) for field in SONG_FIELDS)
+
+def serialize_song(song, is_favorite=None):
+    """
+    Converts a Song (or a row selected with SONG_COLUMNS) to the API's JSON dict.
+    'is_favorite' is only included when given (used by /search).
+    """
+    data = {
+        'id': song.id, 'title': song.title, 'artist': song.artist, 'genre': song.genre,
+        'danceability': song.danceability, 'energy': song.energy, 'tempo': song.tempo,
+        'loudness': song.loudness, 'valence': song.valence,
+    }
+    if is_favorite is not None:
+        data['is_favorite'] = is_favorite
+    return data
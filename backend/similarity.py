@@ -0,0 +1,96 @@
+# backend/similarity.py
+
+"""
+Vectorized audio-feature similarity over the song catalog.
+
+Each song is a point in a 5-dimensional space (danceability, energy, tempo,
+loudness, valence). Features are z-score normalized so tempo (~120) and
+loudness (~-7 dB) don't dominate the 0..1 features, stored as one contiguous
+float32 matrix, and nearest neighbours are found with a single matrix-vector
+product plus np.argpartition (no per-row Python).
+"""
+
+import threading
+
+import numpy as np
+
+
+class FeatureSpace:
+    """
+    Normalized feature matrix for one catalog snapshot.
+    Distances are squared Euclidean in the normalized space:
+        |x - q|^2 = |x|^2 - 2 x.q + |q|^2
+    so scoring a query only needs X @ q (|q|^2 is constant per query).
+    """
+
+    def __init__(self, features, version=0):
+        raw = np.asarray(features, dtype=np.float64)
+        self.version = version
+        self.mean = np.nanmean(raw, axis=0) if len(raw) else np.zeros(raw.shape[1])
+        self.std = np.nanstd(raw, axis=0) if len(raw) else np.ones(raw.shape[1])
+        self.mean = np.nan_to_num(self.mean)
+        self.std = np.where(np.nan_to_num(self.std) > 0, np.nan_to_num(self.std), 1.0)
+        # Missing values end up at the column mean (0 after normalization)
+        self.matrix = np.ascontiguousarray(np.nan_to_num(self.transform(raw)), dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def transform(self, raw_features):
+        """Normalizes raw feature rows with this space's mean/std."""
+        return (np.asarray(raw_features, dtype=np.float64) - self.mean) / self.std
+
+    def taste_vector(self, positions):
+        """Mean normalized feature vector of the given catalog positions (the user's taste profile)."""
+        return self.matrix[positions].mean(axis=0)
+
+    def distances(self, queries):
+        """
+        Squared distances from each query to every song.
+        'queries' is (dims,) or (n_queries, dims); the result is (n_songs,) or (n_queries, n_songs).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        dots = queries @ self.matrix.T
+        q_norms = np.einsum('...j,...j->...', queries, queries)
+        return self.sq_norms - 2.0 * dots + q_norms[..., None]
+
+    def top_k(self, query, k, excluded=None):
+        """
+        Returns (positions, distances) of the k songs closest to 'query', nearest first.
+        'excluded' is an optional boolean mask of positions that must not be returned.
+        """
+        dist = self.distances(query)
+        if excluded is not None:
+            dist = np.where(excluded, np.inf, dist)
+        return top_k_smallest(dist, k)
+
+
+def top_k_smallest(values, k):
+    """
+    Indices and values of the k smallest entries of a 1-D array, sorted ascending.
+    Uses argpartition (O(n)) and only sorts the k winners. Infinite entries are dropped.
+    """
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=values.dtype)
+    idx = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    idx = idx[np.argsort(values[idx], kind='stable')]
+    idx = idx[np.isfinite(values[idx])]
+    return idx, values[idx]
+
+
+# The feature space is derived from a catalog snapshot; rebuild only when the snapshot changes
+_space = None
+_space_lock = threading.Lock()
+
+def get_feature_space(catalog):
+    """Returns the FeatureSpace for a catalog snapshot, reusing it while the snapshot version is unchanged."""
+    global _space
+    space = _space
+    if space is not None and space.version == catalog.version and len(space) == len(catalog):
+        return space
+    with _space_lock:
+        if _space is None or _space.version != catalog.version or len(_space) != len(catalog):
+            _space = FeatureSpace(catalog.features, version=catalog.version)
+        return _space
@@ -0,0 +1,204 @@
+# backend/snapshot.py
+
+"""
+Columnar on-disk snapshot of the song catalog.
+
+A snapshot is a directory of .npy files that np.load() memory-maps:
+
+    ids.npy                     int64, sorted song ids
+    features.npy                float32 (n, 5) audio features (FEATURE_COLUMNS order)
+    genre_codes.npy             int16 genre codes (-1: missing), names in snapshot.json
+    titles.offsets.npy          int64 (n + 1) byte offsets into titles.data.npy
+    titles.data.npy             uint8, the UTF-8 titles back to back
+    artists.offsets.npy / artists.data.npy
+    snapshot.json               format version, genre names and the version stamp
+
+Loading maps the files instead of reading them, so a worker starts in
+milliseconds and the pages are shared by every worker process through the OS
+page cache. Strings are only decoded when a song is actually read.
+
+The version stamp is the (max song id, song count, catalog version) of the
+database at export time. SongCatalog loads the snapshot when it starts and checks the stamp against
+the database like any other refresh. New rows are appended incrementally, and
+any other difference makes it reload from the database. In-place updates of
+existing songs (ingest --mode upsert) bump the catalog version, so workers skip
+a snapshot exported before them until it is re-exported.
+
+Usage:
+    python -m backend.snapshot export [--path instance/catalog_snapshot]
+    python -m backend.snapshot info [--path instance/catalog_snapshot]
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from backend.catalog import CatalogSnapshot, FEATURE_COLUMNS
+
+FORMAT_VERSION = 1
+MANIFEST = 'snapshot.json'
+
+
+class StringColumn:
+    """
+    Read-only column of strings stored as an offset buffer: string i is
+    data[offsets[i]:offsets[i + 1]] decoded as UTF-8. Indexing with an int returns a str,
+    indexing with an array or slice returns an object array (like the in-memory catalog columns).
+    """
+    __slots__ = ('offsets', 'data')
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [('' if s is None else str(s)).encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            return self._get(key)
+        positions = np.arange(len(self))[key]
+        out = np.empty(len(positions), dtype=object)
+        out[:] = [self._get(i) for i in positions.tolist()]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:]
+
+    def positions_of(self, value):
+        """Positions of the strings equal to 'value', compared as UTF-8 bytes (nothing is decoded)."""
+        encoded = np.frombuffer(('' if value is None else str(value)).encode('utf-8'), dtype=np.uint8)
+        starts = np.asarray(self.offsets[:-1])
+        positions = np.flatnonzero(np.diff(self.offsets) == len(encoded))
+        if len(encoded) and len(positions):
+            window = np.asarray(self.data)[starts[positions, None] + np.arange(len(encoded))]
+            positions = positions[(window == encoded).all(axis=1)]
+        return positions
+
+
+def export_snapshot(catalog, path, stamp=None):
+    """
+    Writes a CatalogSnapshot to 'path' (a directory). 'stamp' defaults to the catalog's
+    (max id, count) and catalog version 0; pass the database's catalog version when it has one.
+    Files are written to a temporary directory first and swapped in, so running workers
+    never see a half-written snapshot.
+    """
+    stamp = stamp or {'max_id': catalog.high_water_mark, 'count': len(catalog), 'catalog_version': 0}
+    tmp_path, old_path = f"{path}.tmp", f"{path}.old"
+    # Leftovers of an export that was interrupted (stale files, or an .old the swap can't replace)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.rmtree(old_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    arrays = {
+        'ids': np.asarray(catalog.ids, dtype=np.int64),
+        'features': np.ascontiguousarray(catalog.features, dtype=np.float32),
+        'genre_codes': np.asarray(catalog.genre_codes, dtype=np.int16),
+    }
+    for name in ('titles', 'artists'):
+        column = getattr(catalog, name)
+        column = column if isinstance(column, StringColumn) else StringColumn.from_strings(column)
+        arrays[f"{name}.offsets"] = column.offsets
+        arrays[f"{name}.data"] = column.data
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    manifest = {'format_version': FORMAT_VERSION, 'feature_columns': list(FEATURE_COLUMNS),
+                'genre_names': list(catalog.genre_names), 'stamp': stamp}
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+
+    if os.path.exists(path):
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path):
+    """Returns the snapshot.json of a snapshot directory, or None if there is no (compatible) snapshot."""
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION or manifest.get('feature_columns') != list(FEATURE_COLUMNS):
+        return None
+    return manifest
+
+
+def load_snapshot(path, version=0, mmap=True):
+    """
+    Memory-maps a snapshot directory. Returns (CatalogSnapshot, version stamp),
+    or None if there is no compatible snapshot.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    mode = 'r' if mmap else None
+
+    def array(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+    snapshot = CatalogSnapshot(
+        ids=array('ids'),
+        titles=StringColumn(array('titles.offsets'), array('titles.data')),
+        artists=StringColumn(array('artists.offsets'), array('artists.data')),
+        genre_codes=array('genre_codes'),
+        genre_names=tuple(manifest['genre_names']),
+        features=array('features'),
+        version=version,
+        db_version=manifest['stamp'].get('catalog_version', 0),
+    )
+    return snapshot, manifest['stamp']
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from backend.app import create_app
+    from backend.config import Config
+
+    parser = argparse.ArgumentParser(description='Export or inspect the on-disk catalog snapshot.')
+    parser.add_argument('command', choices=('export', 'info'))
+    parser.add_argument('--path', default=Config.CATALOG_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        from backend import db
+        from backend.catalog import SongCatalog, read_catalog_version
+        with create_app().app_context():
+            started = time.perf_counter()
+            # Read before the songs: an update racing with the export leaves the snapshot looking older
+            with db.engine.connect() as conn:
+                catalog_version = read_catalog_version(conn)
+            catalog = SongCatalog(refresh_interval=0, snapshot_path='').snapshot(db.engine)   # straight from the database
+            manifest = export_snapshot(catalog, args.path, stamp={'max_id': catalog.high_water_mark, 'count': len(catalog),
+                                                                  'catalog_version': catalog_version})
+        print(f"Exported {len(catalog)} songs to {args.path} in {time.perf_counter() - started:.2f}s "
+              f"(stamp {manifest['stamp']}).")
+    else:
+        started = time.perf_counter()
+        loaded = load_snapshot(args.path)
+        if loaded is None:
+            print(f"No snapshot at {args.path}.")
+            raise SystemExit(1)
+        snapshot, stamp = loaded
+        size = sum(os.path.getsize(os.path.join(args.path, name)) for name in os.listdir(args.path))
+        print(f"{len(snapshot)} songs, {len(snapshot.genre_names)} genres, {size / 1e6:.1f} MB on disk, "
+              f"stamp {stamp}, mapped in {(time.perf_counter() - started) * 1000:.1f} ms.")
@@ -0,0 +1,253 @@
+# backend/stats.py
+
+"""
+Materialized aggregates over favorites and the catalog.
+
+Per user (tables UserStats and UserGenreCount):
+- number of favorites and the sums of their audio features (-> mean taste vector)
+- favorites per genre, with the id of the first favorite in each genre
+
+They are updated incrementally in the same transaction as the favorite
+change (favorite_added / favorite_removed), so /profile and /stats/me read a
+handful of precomputed rows instead of aggregating the user's favorites on
+each call. Users whose favorites predate these tables are backfilled with two
+atomic INSERT ... SELECT ... ON CONFLICT DO NOTHING statements: on their first
+read (ensure_user_stats, in its own transaction) or by their first favorite
+change (in that change's transaction). Bulk edits recompute them with the
+same statements (rebuild_user_stats).
+
+Per genre of the catalog: song count, feature means and quantiles, and
+histograms on shared bins, computed with NumPy from the in-memory catalog and
+cached per catalog version.
+"""
+
+import threading
+
+import numpy as np
+from sqlalchemy import and_, case, delete, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from backend import db
+from backend.catalog import FEATURE_COLUMNS
+from backend.models import Song, Favorite, UserStats, UserGenreCount
+
+_SUM_COLUMNS = {feature: getattr(UserStats, f"{feature}_sum") for feature in FEATURE_COLUMNS}
+
+# Quantiles reported per genre and feature, and the number of histogram bins
+QUANTILES = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+HISTOGRAM_BINS = 20
+
+
+# --- Incremental maintenance (called inside the favorite's transaction, before commit) ---
+
+def _song_features(song):
+    values = [getattr(song, feature) for feature in FEATURE_COLUMNS]
+    return None if any(value is None for value in values) else values
+
+def _apply(user_id, song, sign):
+    """Adds (sign=1) or subtracts (sign=-1) one song from the user's stats. Returns False if not materialized."""
+    features = _song_features(song)
+    values = {UserStats.favorite_count: UserStats.favorite_count + sign}
+    if features is not None:
+        values[UserStats.feature_count] = UserStats.feature_count + sign
+        for feature, value in zip(FEATURE_COLUMNS, features):
+            values[_SUM_COLUMNS[feature]] = _SUM_COLUMNS[feature] + sign * value
+    result = db.session.execute(update(UserStats).where(UserStats.user_id == user_id).values(values))
+    return result.rowcount > 0
+
+def _count_genre(user_id, song, favorite_id):
+    # Favorite ids only grow, so first_favorite_id of an existing genre row stays the same
+    updated = db.session.execute(
+        update(UserGenreCount)
+        .where(UserGenreCount.user_id == user_id, UserGenreCount.genre == song.genre)
+        .values(count=UserGenreCount.count + 1))
+    if not updated.rowcount:
+        db.session.execute(insert(UserGenreCount).values(
+            user_id=user_id, genre=song.genre, count=1, first_favorite_id=favorite_id))
+
+def favorite_added(user_id, song, favorite_id):
+    """
+    Counts a new favorite (call after the Favorite row is flushed, before commit).
+    A user without stats rows yet is backfilled here, which already counts this favorite.
+    """
+    if not _apply(user_id, song, +1):
+        if _backfill(db.session, user_id):
+            return
+        # Backfilled concurrently by a transaction that couldn't see this favorite yet
+        _apply(user_id, song, +1)
+    if song.genre:
+        _count_genre(user_id, song, favorite_id)
+
+def favorite_removed(user_id, song, favorite_id):
+    """Uncounts a favorite that is being deleted (call before the DELETE and the commit)."""
+    if not _apply(user_id, song, -1):
+        # Backfilled while the favorite still exists, then uncounted like any other
+        _backfill(db.session, user_id)
+        _apply(user_id, song, -1)
+    if not song.genre:
+        return
+    in_genre = (UserGenreCount.user_id == user_id, UserGenreCount.genre == song.genre)
+    db.session.execute(update(UserGenreCount).where(*in_genre).values(count=UserGenreCount.count - 1))
+    db.session.execute(delete(UserGenreCount).where(*in_genre, UserGenreCount.count <= 0))
+    row = db.session.get(UserGenreCount, (user_id, song.genre), populate_existing=True)
+    if row is not None and row.first_favorite_id == favorite_id:
+        # The earliest favorite of the genre went away: find the next one
+        row.first_favorite_id = (db.session.query(func.min(Favorite.id))
+                                 .join(Song, Song.id == Favorite.song_id)
+                                 .filter(Favorite.user_id == user_id, Song.genre == song.genre,
+                                         Favorite.id != favorite_id)
+                                 .scalar())
+
+
+# --- Backfill ---
+
+_DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def _insert_select(connection, model, columns, query, key):
+    """INSERT INTO model (columns) <query>, skipping rows whose 'key' already exists. Returns the rowcount."""
+    dialect_insert = _DIALECT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(model).from_select(columns, query).on_conflict_do_nothing(index_elements=key)
+        return connection.execute(statement).rowcount
+    try:
+        with connection.begin_nested():
+            return connection.execute(insert(model).from_select(columns, query)).rowcount
+    except IntegrityError:
+        return 0
+
+def _backfill(connection, user_id):
+    """
+    Computes a user's stats from their favorites with two INSERT ... SELECT ... GROUP BY statements,
+    in the transaction of 'connection' (a session or connection). Rows that already exist (backfilled
+    concurrently) are left alone. Returns True if this call created the user's UserStats row.
+    """
+    has_features = and_(*[getattr(Song, feature).isnot(None) for feature in FEATURE_COLUMNS])
+    totals = (select(literal(user_id), func.count(Favorite.id), func.count(case((has_features, 1))),
+                     *[func.coalesce(func.sum(case((has_features, getattr(Song, feature)))), 0.0)
+                       for feature in FEATURE_COLUMNS])
+              .select_from(Favorite).join(Song, Song.id == Favorite.song_id)
+              .where(Favorite.user_id == user_id))
+    created = _insert_select(connection, UserStats,
+                             ['user_id', 'favorite_count', 'feature_count'] + [column.key for column in _SUM_COLUMNS.values()],
+                             totals, ['user_id'])
+    genre_rows = (select(literal(user_id), Song.genre, func.count(Favorite.id), func.min(Favorite.id))
+                  .select_from(Favorite).join(Song, Song.id == Favorite.song_id)
+                  .where(Favorite.user_id == user_id, Song.genre.isnot(None), Song.genre != '')
+                  .group_by(Song.genre))
+    _insert_select(connection, UserGenreCount, ['user_id', 'genre', 'count', 'first_favorite_id'],
+                   genre_rows, ['user_id', 'genre'])
+    return created > 0
+
+def rebuild_user_stats(user_id):
+    """
+    Recomputes a user's stats from scratch inside the current transaction (no commit).
+    Used after set-based edits (bulk favorites), where per-row increments would cost more.
+    """
+    db.session.execute(delete(UserGenreCount).where(UserGenreCount.user_id == user_id))
+    db.session.execute(delete(UserStats).where(UserStats.user_id == user_id))
+    _backfill(db.session, user_id)
+
+def ensure_user_stats(user_id):
+    """
+    Returns the user's UserStats row, backfilling it on first access. The backfill commits in
+    its own short transaction, so the caller's session is never committed from a read.
+    """
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        with db.engine.begin() as conn:
+            _backfill(conn, user_id)
+        stats = db.session.get(UserStats, user_id)
+    return stats
+
+
+# --- Reads ---
+
+def user_genre_counts(user_id, limit=None):
+    """
+    Genres of the user's favorites, most frequent first; ties keep the order in which the
+    genres were first favorited. Returns [{'genre': ..., 'count': ...}, ...].
+    """
+    ensure_user_stats(user_id)
+    query = (db.session.query(UserGenreCount.genre, UserGenreCount.count)
+             .filter(UserGenreCount.user_id == user_id, UserGenreCount.count > 0)
+             .order_by(UserGenreCount.count.desc(), UserGenreCount.first_favorite_id))
+    if limit is not None:
+        query = query.limit(limit)
+    return [{'genre': genre, 'count': count} for genre, count in query]
+
+def user_feature_means(user_id):
+    """Mean audio features of the user's favorites ({feature: mean}), or None without favorites."""
+    stats = ensure_user_stats(user_id)
+    if stats is None or not stats.feature_count:
+        return None
+    return {feature: getattr(stats, f"{feature}_sum") / stats.feature_count for feature in FEATURE_COLUMNS}
+
+def user_summary(user_id):
+    """Everything stored for a user: favorite count, genre counts and mean features."""
+    stats = ensure_user_stats(user_id)
+    return {
+        'user_id': user_id,
+        'favorite_count': stats.favorite_count if stats else 0,
+        'genres': user_genre_counts(user_id),
+        'feature_means': user_feature_means(user_id),
+    }
+
+
+# --- Catalog statistics per genre ---
+
+def compute_genre_stats(catalog):
+    """
+    Per-genre song counts, feature means and quantiles, and histograms over bins shared by all
+    genres (so distributions can be compared), from one catalog snapshot.
+    """
+    features = np.asarray(catalog.features, dtype=np.float64)
+    codes = np.asarray(catalog.genre_codes)
+    edges = {}
+    for i, feature in enumerate(FEATURE_COLUMNS):
+        column = features[:, i]
+        low, high = (np.nanmin(column), np.nanmax(column)) if len(column) and not np.isnan(column).all() else (0.0, 1.0)
+        edges[feature] = np.linspace(low, high if high > low else low + 1.0, HISTOGRAM_BINS + 1)
+
+    order = np.argsort(codes, kind='stable')
+    boundaries = np.searchsorted(codes[order], np.arange(len(catalog.genre_names) + 1))
+    genres = []
+    for code, name in enumerate(catalog.genre_names):
+        rows = features[order[boundaries[code]:boundaries[code + 1]]]
+        if not len(rows):
+            continue
+        entry = {'genre': name, 'count': int(len(rows)), 'features': {}}
+        for i, feature in enumerate(FEATURE_COLUMNS):
+            column = rows[:, i][~np.isnan(rows[:, i])]
+            if not len(column):
+                continue
+            counts, _ = np.histogram(column, bins=edges[feature])
+            entry['features'][feature] = {
+                'mean': float(column.mean()),
+                'std': float(column.std()),
+                'quantiles': dict(zip((str(q) for q in QUANTILES), np.quantile(column, QUANTILES).tolist())),
+                'histogram': counts.tolist(),
+            }
+        genres.append(entry)
+    genres.sort(key=lambda entry: (-entry['count'], entry['genre']))
+    return {
+        'songs': len(catalog),
+        'histogram_edges': {feature: bins.tolist() for feature, bins in edges.items()},
+        'genres': genres,
+    }
+
+
+# Derived from a catalog snapshot; recomputed only when the snapshot version changes
+_genre_stats = None
+_genre_stats_lock = threading.Lock()
+
+def get_genre_stats(catalog):
+    """Returns compute_genre_stats(catalog), cached while the catalog version is unchanged."""
+    global _genre_stats
+    cached = _genre_stats
+    if cached is not None and cached[0] == catalog.version:
+        return cached[1]
+    with _genre_stats_lock:
+        if _genre_stats is None or _genre_stats[0] != catalog.version:
+            _genre_stats = (catalog.version, compute_genre_stats(catalog))
+        return _genre_stats[1]
@@ -0,0 +1,91 @@
+# backend/tests/conftest.py
+
+"""
+Shared fixtures: one Flask app on a temporary SQLite database, seeded through the
+real ingestion pipeline with a small deterministic catalog.
+
+The backend reads its configuration from the environment at import time, so the
+variables are set here before anything from 'backend' is imported.
+
+Run from the repository root:
+    python -m pytest -q backend/tests
+"""
+
+import csv
+import datetime
+import itertools
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix='musicrec-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ['CATALOG_SNAPSHOT_PATH'] = os.path.join(_TMP_DIR, 'catalog_snapshot')
+os.environ['CATALOG_REFRESH_SECONDS'] = '0'
+os.environ['CF_REFRESH_SECONDS'] = '0'
+os.environ['RECOMMENDATION_CACHE_BACKEND'] = 'memory'
+os.environ['RADIO_SESSION_BACKEND'] = 'memory'
+
+import jwt
+import numpy as np
+import pytest
+
+from backend import db
+from backend.app import create_app
+from backend.ingest import COLUMN_MAPPING, ingest_csv
+from backend.models import User, Favorite
+from backend.routes import SECRET_KEY
+
+NUM_SONGS = 300
+GENRES = ('pop', 'rock', 'rap', 'edm', 'latin')
+
+_usernames = itertools.count(1)
+
+
+def write_catalog_csv(path, num_songs, seed=0):
+    """Small catalog in data.csv's layout: NUM_SONGS songs, 5 genres, 60 artists."""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        for i in range(num_songs):
+            writer.writerow([f"Song {i}", f"Artist {i % 60}", GENRES[i % len(GENRES)],
+                             round(rng.uniform(0, 1), 4), round(rng.uniform(0, 1), 4),
+                             round(rng.uniform(60, 200), 3), round(rng.uniform(-20, 0), 3),
+                             round(rng.uniform(0, 1), 4)])
+    return path
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    with app.app_context():
+        ingest_csv(write_catalog_csv(os.path.join(_TMP_DIR, 'catalog.csv'), NUM_SONGS), mode='replace')
+        yield app
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    return app.test_client()
+
+
+class ApiUser:
+    def __init__(self, user_id, username):
+        self.id = user_id
+        self.username = username
+        token = jwt.encode({'user_id': user_id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)},
+                           SECRET_KEY, algorithm="HS256")
+        self.headers = {'Authorization': f"Bearer {token}"}
+
+
+@pytest.fixture
+def make_user(app):
+    """Creates users with optional favorites: make_user(favorites=[song ids]) -> ApiUser."""
+    def make(favorites=()):
+        username = f"test_user_{next(_usernames)}"
+        user = User(username=username, password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(Favorite(user_id=user.id, song_id=song_id) for song_id in favorites)
+        db.session.commit()
+        return ApiUser(user.id, username)
+    return make
@@ -0,0 +1,94 @@
+# backend/tests/test_ann_index.py
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from backend import ann_index
+from backend.ann_index import ExactIndex, IVFIndex, LSHIndex, VectorIndex, get_index, recall_report, reset_index
+from backend.catalog import CatalogSnapshot, FEATURE_COLUMNS
+
+
+def _data(n=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    return np.arange(1, n + 1, dtype=np.int64), rng.standard_normal((n, len(FEATURE_COLUMNS)))
+
+
+def _catalog(ids, features, version, reload_version=1):
+    n = len(ids)
+    return CatalogSnapshot(np.asarray(ids, dtype=np.int64), np.array(['Song'] * n, dtype=object),
+                           np.array(['Artist'] * n, dtype=object), np.zeros(n, dtype=np.int16), ('pop',),
+                           np.asarray(features, dtype=np.float64), version=version, reload_version=reload_version)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_index():
+    reset_index()
+    yield
+    reset_index()
+
+
+def test_approximate_kinds_keep_recall_against_exact_search():
+    ids, features = _data()
+    report = {row['kind']: row for row in recall_report(ids, features, num_queries=50, k=10,
+                                                         lsh={'multiprobe': True})}
+    assert report['exact']['recall'] == 1.0
+    assert report['ivf']['recall'] >= 0.75
+    assert report['lsh']['recall'] >= 0.75
+
+
+@pytest.mark.parametrize('cls', [ExactIndex, IVFIndex, LSHIndex])
+def test_added_and_removed_songs_are_searchable(cls):
+    ids, features = _data(500)
+    index = cls.build(ids, features)
+    far = np.full((1, features.shape[1]), 50.0)
+    index.add([1000], far)
+    found, _ = index.search(index.transform(far)[0], 1)
+    assert found.tolist() == [1000]
+
+    index.remove([1000, 1])
+    found, _ = index.search(index.transform(far)[0], 5)
+    assert 1000 not in found.tolist()
+    assert 1 not in index.all_ids().tolist()
+    assert len(index) == 499
+
+
+@pytest.mark.parametrize('cls', [ExactIndex, IVFIndex, LSHIndex])
+def test_save_and_load_round_trip(cls, tmp_path):
+    ids, features = _data(500)
+    index = cls.build(ids, features)
+    index.add([1000], np.zeros((1, features.shape[1])))
+    path = str(tmp_path / 'index')
+    index.save(path)
+
+    loaded = VectorIndex.load(path)
+    assert isinstance(loaded, cls) and isinstance(loaded.vectors, np.memmap)
+    assert loaded.delta_size() == 0 and len(loaded) == 501
+    query = loaded.transform(features[7])
+    assert loaded.search(query, 5)[0].tolist() == index.search(query, 5)[0].tolist()
+
+
+def test_songs_updated_in_place_get_new_vectors_after_a_full_reload():
+    ids, features = _data(200)
+    get_index(_catalog(ids, features, version=1), 'exact')
+    moved = features.copy()
+    moved[4] = 40.0
+    index = get_index(_catalog(ids, moved, version=2, reload_version=2), 'exact')
+    found, _ = index.search(index.transform(moved[4]), 1)
+    assert found.tolist() == [5]
+
+
+def test_saved_index_of_another_kind_is_not_reloaded_on_every_call(tmp_path, monkeypatch):
+    ids, features = _data(200)
+    path = str(tmp_path / 'index')
+    ExactIndex.build(ids, features).save(path)
+    with open(os.path.join(path, ann_index.MANIFEST_FILE)) as f:
+        assert json.load(f)['kind'] == 'exact'
+
+    catalog = _catalog(ids, features, version=1)
+    first = get_index(catalog, 'ivf', path)
+    monkeypatch.setattr(VectorIndex, 'load', staticmethod(lambda *a, **k: pytest.fail('reloaded from disk')))
+    assert first.kind == 'ivf'
+    assert get_index(catalog, 'ivf', path) is first
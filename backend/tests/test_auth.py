@@ -0,0 +1,47 @@
+# backend/tests/test_auth.py
+
+from backend import db
+from backend.auth import invalidate_user
+from backend.models import Favorite, User
+from backend.routes import token_required
+
+
+@token_required
+def _password_hash(current_user):
+    # Touches an attribute that only the full User row has
+    return current_user.password_hash
+
+
+def test_cached_token_of_deleted_user_gets_401(app, client, make_user):
+    user = make_user()
+    assert client.get('/profile', headers=user.headers).status_code == 200   # token now cached
+
+    db.session.delete(db.session.get(User, user.id))
+    db.session.commit()
+
+    with app.test_request_context('/', headers=user.headers):
+        response, status = _password_hash()
+    assert status == 401
+    assert response.get_json()['message'] == 'Token invalid sau expirat!'
+
+
+def test_invalidated_user_is_validated_again(client, make_user):
+    user = make_user()
+    assert client.get('/search?q=Song', headers=user.headers).status_code == 200   # token now cached
+
+    db.session.delete(db.session.get(User, user.id))
+    db.session.commit()
+    invalidate_user(user.id)
+    assert client.get('/search?q=Song', headers=user.headers).status_code == 401
+
+
+def test_cached_token_of_deleted_user_cannot_add_favorites(client, make_user):
+    user = make_user()
+    assert client.get('/search?q=Song', headers=user.headers).status_code == 200
+
+    db.session.delete(db.session.get(User, user.id))
+    db.session.commit()
+    assert client.post('/favorites', json={'song_id': 3}, headers=user.headers).status_code == 401
+    response = client.patch('/favorites/bulk', json={'add': [3, 4]}, headers=user.headers)
+    assert response.status_code == 401
+    assert not db.session.query(Favorite).filter_by(user_id=user.id).count()
@@ -0,0 +1,65 @@
+# backend/tests/test_batch_recommendations.py
+
+import json
+
+import pytest
+
+from backend.scoring import ScoringOverloaded, scoring_pool
+
+
+def _post_batch(client, user, user_ids, mode='similar'):
+    return client.post('/recommendations/batch', headers=user.headers,
+                       json={'user_ids': user_ids, 'num_recommendations': 3, 'mode': mode})
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_own_recommendations(client, make_user):
+    user = make_user(favorites=[1, 2, 3])
+    response = _post_batch(client, user, [user.id])
+    assert response.status_code == 200
+    [entry] = _lines(response)
+    assert entry['user_id'] == user.id and len(entry['recommendations']) == 3
+
+
+def test_other_users_are_forbidden(client, make_user):
+    user, other = make_user(favorites=[1]), make_user(favorites=[2])
+    assert _post_batch(client, user, [user.id, other.id]).status_code == 403
+
+
+def test_service_account_may_ask_for_anyone(app, client, make_user, monkeypatch):
+    service, other = make_user(), make_user(favorites=[2, 7])
+    monkeypatch.setitem(app.config, 'BATCH_RECOMMENDATION_USERS', frozenset({service.username}))
+    response = _post_batch(client, service, [other.id])
+    assert response.status_code == 200
+    assert [entry['user_id'] for entry in _lines(response)] == [other.id]
+
+
+@pytest.mark.parametrize('user_ids', [[True], 'x', [1.5]])
+def test_invalid_user_ids(client, make_user, user_ids):
+    assert _post_batch(client, make_user(), user_ids).status_code == 400
+
+
+def test_batch_waits_for_a_scoring_worker(client, make_user, monkeypatch):
+    # A full pool refuses non-blocking calls; the batch stream must not be cut short by that
+    run = scoring_pool.run
+
+    def refusing_run(fn, *args, block=False):
+        if not block:
+            raise ScoringOverloaded("Scoring pool is full")
+        return run(fn, *args, block=block)
+
+    monkeypatch.setattr(scoring_pool, 'run', refusing_run)
+    user = make_user(favorites=[4, 5])
+    response = _post_batch(client, user, [user.id, user.id], mode='blended')
+    entries = _lines(response)
+    assert len(entries) == 2 and all(len(entry['recommendations']) == 3 for entry in entries)
+
+
+def test_boolean_num_recommendations_is_rejected(client, make_user):
+    user = make_user(favorites=[1])
+    response = client.post('/recommendations/batch', headers=user.headers,
+                           json={'user_ids': [user.id], 'num_recommendations': True})
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+# backend/tests/test_browse.py
+
+import csv
+import io
+import json
+
+import pytest
+
+from backend import db
+from backend.models import Song
+
+
+def _pop_ids(energy_min=0.5):
+    return [song_id for (song_id,) in db.session.query(Song.id).filter(Song.genre == 'pop', Song.energy >= energy_min)
+            .order_by(Song.id)]
+
+
+def test_keyset_pages_cover_every_match_once(client, make_user):
+    user = make_user()
+    ids, after = [], None
+    while True:
+        query = '/songs?genre=pop&energy_min=0.5&limit=7&fields=id,genre' + (f'&after={after}' if after else '')
+        page = client.get(query, headers=user.headers).get_json()
+        assert all(set(song) == {'id', 'genre'} and song['genre'] == 'pop' for song in page['items'])
+        ids.extend(song['id'] for song in page['items'])
+        after = page['next_cursor']
+        if after is None:
+            break
+    assert ids == _pop_ids()
+
+
+def test_exports_stream_every_match(client, make_user):
+    user = make_user()
+    response = client.get('/songs?genre=pop&energy_min=0.5&fields=id,title&format=ndjson', headers=user.headers)
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['id'] for row in rows] == _pop_ids()
+    assert set(rows[0]) == {'id', 'title'}
+
+    response = client.get('/songs?genre=pop&energy_min=0.5&fields=id,title&format=csv', headers=user.headers)
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row['id']) for row in rows] == _pop_ids()
+    assert list(rows[0]) == ['id', 'title']
+
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'inf', '-Infinity'])
+def test_non_numeric_range_filters_are_rejected(client, make_user, value):
+    user = make_user()
+    response = client.get(f'/songs?energy_min={value}', headers=user.headers)
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'energy_min trebuie sa fie un numar'
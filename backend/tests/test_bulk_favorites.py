@@ -0,0 +1,64 @@
+# backend/tests/test_bulk_favorites.py
+
+from sqlalchemy import inspect, text
+
+from backend import db, favorites
+from backend.app import warm_up
+from backend.favorites import apply_favorite_changes, favorite_song_ids
+from backend.models import Favorite
+
+
+def test_repeated_patch_is_a_no_op(client, make_user):
+    user = make_user(favorites=[50])
+    body = {'add': [50, 51, 52, 999999], 'remove': [53]}
+    first = client.patch('/favorites/bulk', json=body, headers=user.headers).get_json()
+    assert first == {'added': [51, 52], 'removed': [], 'unknown': [999999]}
+
+    again = client.patch('/favorites/bulk', json=body, headers=user.headers).get_json()
+    assert again == {'added': [], 'removed': [], 'unknown': [999999]}
+
+    removal = {'remove': [51, 53]}
+    assert client.patch('/favorites/bulk', json=removal, headers=user.headers).get_json()['removed'] == [51]
+    assert client.patch('/favorites/bulk', json=removal, headers=user.headers).get_json()['removed'] == []
+    assert client.get('/stats/me', headers=user.headers).get_json()['favorite_count'] == 2
+
+
+def test_put_replaces_the_whole_set(client, make_user):
+    user = make_user(favorites=[60, 61])
+    result = client.put('/favorites/bulk', json={'song_ids': [61, 62]}, headers=user.headers).get_json()
+    assert result == {'added': [62], 'removed': [60], 'unknown': []}
+    assert favorite_song_ids(user.id) == {61, 62}
+
+
+def test_rows_written_concurrently_are_not_reported(app, make_user, monkeypatch):
+    user = make_user(favorites=[70, 71])
+    # Another request added 70/71 after this one read the user's favorites
+    monkeypatch.setattr(favorites, 'favorite_song_ids', lambda user_id: set())
+    added, removed, unknown = apply_favorite_changes(user.id, add_ids=[70, 71, 72])
+    db.session.commit()
+    assert (added, removed, unknown) == ([72], [], [])
+
+
+def test_warm_up_creates_the_favorite_index_of_an_older_database(app):
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_favorite_user_song"))
+    warm_up(app)
+    assert 'uq_favorite_user_song' in {index['name'] for index in inspect(db.engine).get_indexes('favorite')}
+
+
+class _NoFavoriteFound:
+    """Favorite.query whose lookup misses, as when a concurrent request inserts the row right after it."""
+    def filter_by(self, **kwargs):
+        return self
+
+    def first(self):
+        return None
+
+
+def test_concurrent_duplicate_toggle_is_not_an_error(client, make_user, monkeypatch):
+    user = make_user(favorites=[80])
+    monkeypatch.setattr(Favorite, 'query', _NoFavoriteFound())
+    response = client.post('/favorites', json={'song_id': 80}, headers=user.headers)
+    assert response.status_code == 200
+    assert response.get_json()['action'] == 'added'
+    assert favorite_song_ids(user.id) == {80}
@@ -0,0 +1,107 @@
+# backend/tests/test_catalog.py
+
+import csv
+import os
+
+import numpy as np
+
+from backend import db
+from backend.catalog import SegmentedColumn, SongCatalog, read_catalog_version, song_catalog
+from backend.ingest import COLUMN_MAPPING, ingest_csv
+from backend.models import Song
+from backend.similarity import FeatureSpace
+from backend.snapshot import StringColumn, export_snapshot, load_snapshot
+
+
+def test_new_songs_are_appended(app, tmp_path):
+    before = song_catalog.snapshot(db.engine)
+    path = tmp_path / 'new.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        writer.writerow(['Brand New', 'Artist New', 'pop', 0.5, 0.5, 120.0, -5.0, 0.5])
+    ingest_csv(str(path), mode='upsert')
+
+    after = song_catalog.snapshot(db.engine)
+    assert len(after) == len(before) + 1
+    assert after.reload_version == before.reload_version     # appended, not reloaded
+    assert after.to_records([len(after) - 1])[0]['title'] == 'Brand New'
+
+
+def test_in_place_update_reloads_catalog(app, tmp_path):
+    song = db.session.get(Song, 1)
+    song_catalog.snapshot(db.engine)
+    path = tmp_path / 'update.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        writer.writerow([song.title, song.artist, song.genre, song.danceability, 0.123, song.tempo,
+                         song.loudness, song.valence])
+    stats = ingest_csv(str(path), mode='upsert')
+    assert stats['updated'] == 1
+
+    # Same max(id) and count(id): only the catalog version tells the refresh something changed
+    catalog = song_catalog.snapshot(db.engine)
+    assert catalog.to_records(catalog.positions_of([song.id]))[0]['energy'] == 0.123
+
+
+def test_rows_appended_to_a_mapped_snapshot_go_to_a_tail(app, tmp_path):
+    snapshot_path = str(tmp_path / 'snapshot')
+    source = SongCatalog(refresh_interval=0, snapshot_path='').snapshot(db.engine)
+    with db.engine.connect() as conn:
+        export_snapshot(source, snapshot_path, stamp={'max_id': source.high_water_mark, 'count': len(source),
+                                                      'catalog_version': read_catalog_version(conn)})
+    catalog = SongCatalog(refresh_interval=0, snapshot_path=snapshot_path)
+    mapped = catalog.snapshot(db.engine)
+    assert isinstance(mapped.ids, np.memmap)
+
+    path = tmp_path / 'tail.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        writer.writerow(['Tail Song', 'Tail Artist', 'tailgenre', 0.5, 0.5, 120.0, -5.0, 0.5])
+    ingest_csv(str(path), mode='upsert')
+
+    after = catalog.snapshot(db.engine)
+    assert len(after) == len(mapped) + 1
+    for column in ('ids', 'titles', 'artists', 'genre_codes', 'features'):
+        segmented = getattr(after, column)
+        assert isinstance(segmented, SegmentedColumn)
+        assert segmented.base is getattr(mapped, column)      # the mapped files are not copied
+    assert isinstance(after.titles.base, StringColumn)
+
+    new_id = after.high_water_mark
+    positions = after.positions_of([1, new_id, new_id + 1])
+    assert positions.tolist() == [0, len(after) - 1]
+    assert [song['title'] for song in after.to_records(positions)] == ['Song 0', 'Tail Song']
+    assert np.searchsorted(after.ids, [new_id]).tolist() == [len(after) - 1]
+    assert after.artists[[0, -1]].tolist() == ['Artist 0', 'Tail Artist']
+    assert np.flatnonzero(after.genre_codes == after.genre_code('tailgenre')).tolist() == [len(after) - 1]
+    assert np.array_equal(np.asarray(after.ids), np.asarray(source.ids).tolist() + [new_id])
+    assert len(FeatureSpace(after.features)) == len(after)
+    assert after.artist_positions('Tail Artist').tolist() == [len(after) - 1]
+    assert after.artist_positions('Artist 7').tolist() == np.flatnonzero(np.asarray(after.artists) == 'Artist 7').tolist()
+
+
+def test_invalidate_forces_a_full_reload(app):
+    before = song_catalog.snapshot(db.engine)
+    song_catalog.invalidate(db.engine)
+    after = song_catalog.snapshot(db.engine)
+    assert after.reload_version != before.reload_version
+    assert after.db_version == before.db_version + 1
+
+
+def test_export_replaces_leftovers_of_an_interrupted_export(app, tmp_path):
+    catalog = song_catalog.snapshot(db.engine)
+    path = str(tmp_path / 'snapshot')
+    export_snapshot(catalog, path)
+    for leftover in (f"{path}.tmp", f"{path}.old"):
+        os.makedirs(leftover)
+        with open(os.path.join(leftover, 'stale.npy'), 'w') as f:
+            f.write('stale')
+
+    export_snapshot(catalog, path)
+    assert not os.path.exists(f"{path}.tmp") and not os.path.exists(f"{path}.old")
+    assert 'stale.npy' not in os.listdir(path)
+    loaded, _ = load_snapshot(path)
+    assert loaded.ids.tolist() == catalog.ids.tolist()
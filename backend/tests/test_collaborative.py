@@ -0,0 +1,47 @@
+# backend/tests/test_collaborative.py
+
+from backend import collaborative, db
+from backend.models import Favorite
+
+
+def _refreshed_model(refresh_interval=0):
+    """get_model() after the background refresh it started (if any) is done."""
+    collaborative.get_model(db.engine, refresh_interval=refresh_interval)
+    if collaborative._refresh_thread is not None:
+        collaborative._refresh_thread.join(5)
+    return collaborative.get_model(db.engine)
+
+
+def test_collaborative_list_is_topped_up_to_the_limit(client, make_user):
+    make_user(favorites=[250, 252])          # the only co-occurrence of song 250
+    user = make_user(favorites=[250, 251])
+    _refreshed_model()
+
+    response = client.get('/recommendations?mode=collaborative&limit=5', headers=user.headers)
+    ids = [song['id'] for song in response.get_json()]
+    assert response.status_code == 200
+    assert len(ids) == len(set(ids)) == 5
+    assert ids[0] == 252
+    assert not {250, 251} & set(ids)
+
+
+def test_model_picks_up_favorites_written_by_another_worker(app, make_user):
+    user = make_user(favorites=[260])
+    assert _refreshed_model().items_of(user.id) == {260}
+
+    # Written straight to the database, as another worker would
+    db.session.add(Favorite(user_id=user.id, song_id=261))
+    db.session.commit()
+    assert _refreshed_model(refresh_interval=3600).items_of(user.id) == {260}
+    assert _refreshed_model().items_of(user.id) == {260, 261}
+
+
+def test_own_toggles_do_not_trigger_a_rebuild(client, make_user):
+    user = make_user()
+    model = _refreshed_model()
+    assert client.post('/favorites', json={'song_id': 270}, headers=user.headers).status_code == 201
+    response = client.patch('/favorites/bulk', json={'add': [271, 272], 'remove': [270]}, headers=user.headers)
+    assert response.status_code == 200
+
+    assert _refreshed_model() is model
+    assert model.items_of(user.id) == {271, 272}
@@ -0,0 +1,25 @@
+# backend/tests/test_metrics.py
+
+import sys
+
+import pytest
+from flask import Flask
+
+from backend import metrics
+
+
+def test_profiler_is_collected_when_the_view_raises():
+    app = Flask(__name__)
+    # Propagated exceptions skip after_request entirely
+    app.config.update(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=0, PROPAGATE_EXCEPTIONS=True)
+    metrics.init_app(app)
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    before = metrics.SLOW_PROFILES._values.get(('boom',), 0)
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/boom')
+    assert sys.getprofile() is None
+    assert metrics.SLOW_PROFILES._values.get(('boom',), 0) == before + 1
@@ -0,0 +1,35 @@
+# backend/tests/test_radio.py
+
+from backend.radio import RECENT_SIZE, radio_sessions
+
+
+def test_seed_song_first_and_every_played_song_is_served(client, make_user):
+    user = make_user()
+    response = client.post('/radio?limit=5', json={'song_id': 100}, headers=user.headers)
+    assert response.status_code == 201
+    session_id, songs = response.get_json()['session_id'], response.get_json()['songs']
+    served = [song['id'] for song in songs]
+    assert len(served) == 5 and served[0] == 100
+
+    for _ in range(4):
+        batch = client.get(f"/radio/{session_id}/next?limit=10", headers=user.headers).get_json()['songs']
+        assert len(batch) == 10
+        served.extend(song['id'] for song in batch)
+    assert len(served) == len(set(served))
+
+    # Songs marked as played are exactly the songs that were served, in order
+    session = radio_sessions.load(session_id, user.id)
+    assert session.recent_count == len(served) <= RECENT_SIZE
+    assert session.recent[:session.recent_count].tolist() == served
+
+
+def test_artist_seed_skips_the_artists_own_songs(client, make_user):
+    user = make_user()
+    response = client.post('/radio?limit=20', json={'artist': 'Artist 7'}, headers=user.headers)
+    assert response.status_code == 201
+    songs = response.get_json()['songs']
+    assert len(songs) == 20
+    assert all(song['artist'] != 'Artist 7' for song in songs)
+
+    missing = client.post('/radio', json={'artist': 'Nobody'}, headers=user.headers)
+    assert missing.status_code == 404
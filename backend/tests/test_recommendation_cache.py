@@ -0,0 +1,69 @@
+# backend/tests/test_recommendation_cache.py
+
+import csv
+import threading
+import time
+
+from backend import db
+from backend.cache import MemoryBackend, RecommendationCache
+from backend.ingest import COLUMN_MAPPING, ingest_csv
+from backend.models import Favorite, Song
+from backend.recommender import get_cached_recommendations
+
+
+def test_change_made_by_another_worker_is_not_served_stale(app, make_user):
+    user = make_user(favorites=[1, 2, 3])
+    first = get_cached_recommendations(user.id, num_recommendations=5, mode='similar')
+    assert get_cached_recommendations(user.id, num_recommendations=5, mode='similar') == first
+
+    # Written straight to the database: this process' invalidation counter never moves
+    recommended = first[0]['id']
+    db.session.add(Favorite(user_id=user.id, song_id=recommended))
+    db.session.commit()
+    fresh = get_cached_recommendations(user.id, num_recommendations=5, mode='similar')
+    assert recommended not in [song['id'] for song in fresh]
+
+
+def test_song_updated_in_place_is_not_served_stale(app, make_user, tmp_path):
+    user = make_user(favorites=[4, 5, 6])
+    first = get_cached_recommendations(user.id, num_recommendations=5, mode='similar')
+    song = db.session.get(Song, first[0]['id'])
+    path = tmp_path / 'update.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        writer.writerow([song.title, song.artist, song.genre, song.danceability, 0.4321, song.tempo,
+                         song.loudness, song.valence])
+    assert ingest_csv(str(path), mode='upsert')['updated'] == 1
+    db.session.expire_all()
+
+    # Same id range and count: only the database's catalog version tells the cache key apart
+    fresh = get_cached_recommendations(user.id, num_recommendations=5, mode='similar')
+    for record in fresh:
+        assert record['energy'] == db.session.get(Song, record['id']).energy
+
+
+def test_warming_uses_one_thread_and_dedupes_users(app):
+    cache = RecommendationCache(MemoryBackend(), max_active_users=3)
+    release, calls = threading.Event(), []
+
+    def compute(user_id, params):
+        release.wait(5)
+        calls.append(user_id)
+        return [user_id]
+
+    for user_id in range(5):
+        cache.get_or_compute(user_id, ('genre', 5), lambda: None)
+    threads_before = threading.active_count()
+    for _ in range(20):
+        for user_id in range(5):
+            cache.warm_async(app, compute, [user_id])
+
+    assert threading.active_count() <= threads_before + 1
+    assert len(cache._pending) <= 3     # bounded, one slot per user
+    release.set()
+    deadline = time.monotonic() + 5
+    while (cache._pending or len(calls) < 3) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 100 requests for 5 users: the one being computed when the burst came, plus at most 3 queued
+    assert 3 <= len(calls) <= 4
@@ -0,0 +1,44 @@
+# backend/tests/test_rerank.py
+
+import numpy as np
+from sqlalchemy import distinct, func
+
+from backend import db
+from backend.models import Song
+from backend.rerank import mmr_select, rank_relevance
+
+
+def test_lambda_one_keeps_the_relevance_order():
+    vectors = np.random.default_rng(0).standard_normal((20, 5))
+    relevance = np.random.default_rng(1).random(20)
+    assert mmr_select(vectors, relevance, 10, lambda_=1.0).tolist() == np.argsort(-relevance)[:10].tolist()
+
+
+def test_low_lambda_prefers_a_different_song_over_a_near_duplicate():
+    vectors = np.array([[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]])
+    relevance = rank_relevance(3)
+    assert mmr_select(vectors, relevance, 2, lambda_=1.0).tolist() == [0, 1]
+    assert mmr_select(vectors, relevance, 2, lambda_=0.3).tolist() == [0, 2]
+
+
+def test_quotas_limit_each_group_and_stop_when_nothing_is_left():
+    vectors = np.ones((5, 2))
+    codes = np.array([0, 0, 1, 1, -1])
+    selected = mmr_select(vectors, rank_relevance(5), 5, lambda_=1.0, groups=[(codes, 1)])
+    assert selected.tolist() == [0, 2, 4]     # one per code; negative codes are never limited
+
+
+def test_genre_quota_is_met_from_outside_the_preferred_genre(client, make_user):
+    user = make_user(favorites=[1, 6, 11])     # all 'pop': the genre strategy only returns pop songs
+    response = client.get('/recommendations?max_per_genre=1&limit=5', headers=user.headers)
+    songs = response.get_json()
+    assert response.status_code == 200
+    assert len(songs) == 5
+    assert len({song['genre'] for song in songs}) == 5
+
+    # Fewer genres than the limit: a quota the catalog can't meet gives a shorter list
+    num_genres = db.session.query(func.count(distinct(Song.genre))).scalar()
+    response = client.get(f'/recommendations?max_per_genre=1&limit={num_genres + 5}', headers=user.headers)
+    genres = [song['genre'] for song in response.get_json()]
+    assert len(genres) == len(set(genres))
+    assert 5 <= len(genres) <= num_genres
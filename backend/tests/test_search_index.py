@@ -0,0 +1,55 @@
+# backend/tests/test_search_index.py
+
+import csv
+
+import numpy as np
+
+from backend import db
+from backend.catalog import CatalogSnapshot, FEATURE_COLUMNS, song_catalog
+from backend.ingest import COLUMN_MAPPING, ingest_csv
+from backend.models import Song
+from backend.search_index import SongSearchIndex, search_catalog
+
+
+def _catalog(titles, version, reload_version=1):
+    n = len(titles)
+    return CatalogSnapshot(np.arange(1, n + 1, dtype=np.int64), np.array(titles, dtype=object),
+                           np.array(['Artist'] * n, dtype=object), np.zeros(n, dtype=np.int16), ('pop',),
+                           np.zeros((n, len(FEATURE_COLUMNS))), version=version, reload_version=reload_version)
+
+
+def test_prefix_candidates_after_append():
+    index = SongSearchIndex()
+    index.sync(_catalog(['Blue Moon', 'Red Sky'], version=1))
+    assert index.prefix_candidates('blu').tolist() == [0]
+
+    index.sync(_catalog(['Blue Moon', 'Red Sky', 'Blues Brothers', 'Azure'], version=2))
+    words, postings = index._word_index
+    assert len(words) == len(postings)
+    assert index.prefix_candidates('blu').tolist() == [0, 2]
+    assert index.prefix_candidates('blue bro').tolist() == [2]
+    assert index.prefix_candidates('green').tolist() == []
+
+
+def test_full_reload_with_the_same_ids_rebuilds_the_index():
+    index = SongSearchIndex()
+    index.sync(_catalog(['Blue Moon', 'Red Sky'], version=1))
+    index.sync(_catalog(['Green Moon', 'Red Sky'], version=2, reload_version=2))
+    assert index.prefix_candidates('blu').tolist() == []
+    assert index.prefix_candidates('gre').tolist() == [0]
+
+
+def test_search_sees_songs_updated_in_place(app, tmp_path):
+    song = db.session.get(Song, 2)
+    search_catalog(song_catalog.snapshot(db.engine), 'zydeco')
+    path = tmp_path / 'update.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(COLUMN_MAPPING))
+        writer.writerow([song.title, song.artist, 'zydeco', song.danceability, song.energy, song.tempo,
+                         song.loudness, song.valence])
+    ingest_csv(str(path), mode='upsert')
+
+    catalog = song_catalog.snapshot(db.engine)
+    positions, _ = search_catalog(catalog, 'zydeco')
+    assert catalog.ids[positions].tolist() == [song.id]
@@ -0,0 +1,47 @@
+# backend/tests/test_stats.py
+
+import pytest
+
+from backend import db
+from backend.models import UserStats
+from backend.stats import rebuild_user_stats, user_summary
+
+
+def _summary(user_id):
+    db.session.expire_all()
+    return user_summary(user_id)
+
+def _assert_matches_rebuild(summary, user_id):
+    rebuild_user_stats(user_id)
+    db.session.commit()
+    rebuilt = _summary(user_id)
+    assert summary['feature_means'] == pytest.approx(rebuilt.pop('feature_means'))
+    assert {key: value for key, value in summary.items() if key != 'feature_means'} == rebuilt
+
+
+def test_toggles_of_a_user_without_stats_are_counted(client, make_user):
+    user = make_user(favorites=[10, 11, 12])     # written directly: no stats rows yet
+    assert client.post('/favorites', json={'song_id': 13}, headers=user.headers).status_code == 201
+    assert client.post('/favorites', json={'song_id': 10}, headers=user.headers).status_code == 200
+
+    summary = client.get('/stats/me', headers=user.headers).get_json()
+    assert summary['favorite_count'] == 3
+    _assert_matches_rebuild(summary, user.id)
+
+
+def test_first_read_backfills_and_later_toggles_stay_consistent(client, make_user):
+    user = make_user(favorites=[20, 25, 26])
+    assert client.get('/stats/me', headers=user.headers).get_json()['favorite_count'] == 3
+    for song_id in (21, 22, 25, 20, 30):
+        client.post('/favorites', json={'song_id': song_id}, headers=user.headers)
+
+    summary = client.get('/stats/me', headers=user.headers).get_json()
+    assert summary['favorite_count'] == 4
+    assert {row['genre']: row['count'] for row in summary['genres']} == {'pop': 2, 'rock': 1, 'latin': 1}
+    _assert_matches_rebuild(summary, user.id)
+
+
+def test_genre_recommendations_do_not_touch_the_stats_tables(client, make_user):
+    user = make_user(favorites=[40, 45])
+    assert client.get('/recommendations?mode=genre', headers=user.headers).status_code == 200
+    assert db.session.get(UserStats, user.id) is None
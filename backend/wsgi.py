@@ -0,0 +1,26 @@
+# backend/wsgi.py
+
+"""
+Production entry point (WSGI).
+
+`python -m backend.app` runs Flask's development server (debug, reloader).
+In production the app is served by gunicorn with several worker processes,
+each running several request threads:
+
+    gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+Worker count, threads and bind address come from backend/gunicorn.conf.py
+(WEB_CONCURRENCY, GUNICORN_THREADS, BIND). Every worker process has its own
+connection pool (DB_POOL_SIZE + DB_MAX_OVERFLOW connections), song catalog and
+scoring pool (SCORING_WORKERS), so size the database's max_connections for
+workers x (pool size + overflow).
+
+warm_up() creates missing tables and indexes (backend.app.init_db) before the
+catalog is loaded; with gunicorn this already ran once in the master
+(on_starting in gunicorn.conf.py).
+"""
+
+from backend.app import create_app, warm_up
+
+app = create_app()
+warm_up(app)